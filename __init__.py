@@ -11,7 +11,6 @@
 
 
 import os
-import psutil
 import time
 import sys
 import traceback
@@ -20,15 +19,15 @@ import json
 
 from collections import namedtuple
 
-import helpers
-import curses_display as ui
-from logging import LoggingManager
+import backends
+from logging import LoggingManager, MeasurementEncoder, is_active
 from psutil_functions import calculate_cpu_times_percent
+from overhead import OverheadMonitor
 
 
 def get_time():
-    """ Unified/comparable clock access """
-    return time.time()
+    """ Unified/comparable clock access (the clock of the system backend, see »backends.py«) """
+    return backends.get_backend().time()
 
 
 ## XXX for interactive debugging only
@@ -39,22 +38,37 @@ def RELOAD():
 
 MEASUREMENT_INTERVAL = 0.2
 
-nic_speeds = helpers.get_nic_speeds()
-nics = list( nic_speeds.keys() )
+## NOTE: Nothing is discovered at import time (NICs, speeds, ...) and the (curses) UI is only loaded when
+#    it's actually used; see the main section. (Headless instances are started by the hundreds.)
+ui = None
+nics = None
+nic_speeds = None
 
 
 class Reading:
-    """ A single reading of various CPU, NET, ... values. --> Building block for the »Measurement« class."""
+    """
+    A single reading of various CPU, NET, ... values. --> Building block for the »Measurement« class.
+
+    Also reads the optional |collectors| (see »collectors.py«).
+    """
+
+    def __init__(self, collectors=()):
+        backend = backends.get_backend()
 
-    def __init__(self):
         ## * measurements *
-        self.timestamp = get_time()
+        self.timestamp = backend.time()
         #self.cpu_util = psutil.cpu_percent(interval=0, percpu=True)                      ## XXX
         #self.cpu_times_percent = psutil.cpu_times_percent(interval=0, percpu=True)       ## XXX
-        self.cpu_times = psutil.cpu_times(percpu=True)
-        self.memory = psutil.virtual_memory()
-        self.net_io = psutil.net_io_counters(pernic=True)
-        self.nb_open_files = helpers.get_nb_open_files()
+        self.cpu_times = backend.cpu_times()
+        self.memory = backend.virtual_memory()
+        self.net_io = backend.net_io_counters()
+        self.nb_open_files = backend.nb_open_files()
+
+        # (»collectors.py« is only imported if there are collectors.)
+        self.collected = list()
+        if collectors:
+            from collectors import read_collectors
+            self.collected = read_collectors(collectors)
 
     def __str__(self):
         ## •‣∘⁕∗◘☉☀★◾☞☛⦿
@@ -85,11 +99,16 @@ class NetworkTraffic:
 
 
 class Measurement:
-    """ Calculates and stores CPU utilization, network traffic, ... during a timespan. Based two »Readings«. """
+    """
+    Calculates and stores CPU utilization, network traffic, ... during a timespan. Based two »Readings«.
+
+    If |nics| is given, the network traffic is only calculated for these NICs.
+    """
 
-    def __init__(self, reading1, reading2):
+    def __init__(self, reading1, reading2, nics=None):
         self.r1 = reading1
         self.r2 = reading2
+        self.nics = nics
 
         ## calculate differences
         self.timespan = self.r2.timestamp - self.r1.timestamp
@@ -98,13 +117,22 @@ class Measurement:
         # Point measurement are measured at a given point in time, not during a timespan.  We use the second reading.
         self.memory = self.r2.memory
         self.nb_open_files = self.r2.nb_open_files
+        # Values of the collectors (by name), and what each of them cost: (read time, compute time)
+        self.collected = dict()
+        if self.r2.collected:
+            from collectors import compute_collectors
+            self.collected = compute_collectors(self.r1.collected, self.r2.collected, self.timespan)
+        self.collector_overhead = dict( (c.name, (c.read_time, c.compute_time)) for c, _ in self.r2.collected )
 
 
     def _calculate_net_io(self):
         ret = dict()
 
-        for nic in self.r1.net_io.keys():
-            ret[nic] = NetworkTraffic(self.r1.net_io[nic], self.r2.net_io[nic], self.timespan)
+        for nic in self.nics if self.nics is not None else self.r1.net_io.keys():
+            try:
+                ret[nic] = NetworkTraffic(self.r1.net_io[nic], self.r2.net_io[nic], self.timespan)
+            except KeyError:
+                pass   # (not present in both readings)
 
         return ret
 
@@ -129,59 +157,176 @@ def measure(interval = MEASUREMENT_INTERVAL):
 
 
 
+class Sampler:
+    """
+    Source of live »Measurements«: Takes a »Reading« every |interval| seconds.
+
+    With |nics|, the measurements only cover these NICs (see »Measurement«).
+    The |collectors| are read along with each »Reading«.
+
+    Usage:
+      - start()
+      - Loop:
+          - next()
+          - wait()
+    """
+
+    def __init__(self, interval, nics=None, collectors=()):
+        self.interval = interval
+        self.nics = nics
+        self.collectors = collectors
+        self.old_reading = None
+
+        # Time spent in the last call of |next()|, and the interval the last |wait()| used (see »OverheadMonitor«).
+        self.read_time = 0
+        self.compute_time = 0
+        self.last_interval = None
+
+    def start(self):
+        # Take an initial reading.
+        self.old_reading = Reading(self.collectors)
+
+        # Sleep till the next "full" second begins. (In order to roughly synchronize with other instances.)
+        now = get_time()
+        backends.get_backend().sleep(math.floor(now)+1-now)
+
+    def next(self):
+        # Take a new reading.
+        t0 = time.perf_counter()
+        new_reading = Reading(self.collectors)
+        t1 = time.perf_counter()
+
+        # Calculate the measurement from the last two readings.
+        measurement = Measurement(self.old_reading, new_reading, self.nics)
+
+        self.read_time = t1 - t0
+        self.compute_time = time.perf_counter() - t1
+
+        # Store the last reading as |old_reading|.
+        self.old_reading = new_reading
+
+        return measurement
+
+    def wait(self):
+        self.last_interval = self.interval
+        backends.get_backend().sleep(self.interval)
+            ## XXX TODO We could calculating the remaining waiting-time here.
+
+
+
+class AdaptiveSampler(Sampler):
+    """
+    A »Sampler« that switches between a slow base rate and a fast one, driven by activity:
+
+    Samples every |interval| seconds while idle, and every |fast_interval| seconds as soon as a measurement
+    shows activity (see »logging.is_active()«: NIC traffic above |min_rate| bits/s, or a CPU utilization
+    above |min_cpu_util| percent). Returns to the base rate after |hold| seconds without activity.
+
+    (Each measurement records its actual begin, end and duration, so the logs need no fixed interval.)
+    """
+
+    def __init__(self, interval, fast_interval, hold, min_rate, min_cpu_util, nics=None, collectors=()):
+        Sampler.__init__(self, interval, nics, collectors)
+
+        self.fast_interval = fast_interval
+        self.hold = hold
+        self.min_rate = min_rate
+        self.min_cpu_util = min_cpu_util
+
+        self.fast = False
+        self.inactivity_count = 0
+
+    def next(self):
+        measurement = Sampler.next(self)
+
+        if ( is_active(measurement, self.nics, self.min_rate, self.min_cpu_util) ):
+            self.fast = True
+            self.inactivity_count = 0
+        elif ( self.fast ):
+            self.inactivity_count += measurement.timespan
+            if ( self.inactivity_count >= self.hold ):
+                self.fast = False
+
+        return measurement
 
-def main_loop():
+    def get_current_interval(self):
+        ## (|interval| may be changed from outside, e.g. over the control socket.)
+        return min(self.fast_interval, self.interval) if self.fast else self.interval
+
+    def wait(self):
+        self.last_interval = self.get_current_interval()
+        backends.get_backend().sleep(self.last_interval)
+
+
+
+def main_loop(source, display_interval):
     """ Main Loop:
       - Sets up curses-display
-      - Takes a reading every second
-      - Displays the measurements
+      - Gets a measurement from the |source| (»Sampler« or »Replay«) every interval
+      - Displays the measurements (but at most one per |display_interval| seconds, of measurement time)
       - Logs the measurements with the LoggingManager
+      - Measures its own overhead (logged with each measurement)
     """
 
-    ## TODO this should be configurable by command line options
-    sample_interval = float(args.interval)
-    display_interval = float(args.displayinterval)
-
-    display_skip = max(display_interval / sample_interval, 1)
-
     err = None
 
+    overhead = OverheadMonitor( getattr(source, "interval", None),
+                                logging_manager.get_queue_depth if logging_manager.get_sinks() else None )
+
     try:
         # Set up (curses) UI.
-        ui.nics = nics
-        ui.nic_speeds = nic_speeds
-        ui.logging_manager = logging_manager
         if not args.headless:
             ui.init()
 
-        # Take an initial reading.
-        old_reading = Reading()
+        source.start()
 
-        # Sleep till the next "full" second begins. (In order to roughly synchronize with other instances.)
-        now = time.time()
-        time.sleep(math.ceil(now)-now)
-
-        display_skip_counter = 0
+        last_display = None
+        last_measurement = None
         running = True
         while running:
-            # Take a new reading.
-            new_reading = Reading()
-
-            # Calculate the measurement from the last two readings.
-            measurement = Measurement(old_reading, new_reading)
-
-            # Display/log the measurement.
-            running &= logging_manager.log(measurement)
-            if ( display_skip_counter % display_skip < 1 ) and not args.headless:   # the display may skip some samples
+            # Start/stop profiling windows (see --profile and SIGUSR1).
+            profiler.tick()
+
+            # Execute requests from the control socket (see --control).
+            if control:
+                control.process()
+                overhead.interval = getattr(source, "interval", None)
+
+            # Get the next measurement. (None: End of a replay.)
+            overhead.begin()
+            measurement = source.next()
+            overhead.end("next")
+            if measurement is None:
+                break
+
+            # Log the measurement. (A paused replay repeats the last measurement, that is only displayed.)
+            if measurement is not last_measurement:
+                measurement.overhead = overhead.sample(source, measurement)
+
+                overhead.begin()
+                running &= logging_manager.log(measurement)
+                if exporter or live_metrics or history is not None:
+                    # (Encoded once for all of them.)
+                    values = live_encoder.encode(measurement)
+                    if exporter:
+                        exporter.update(measurement, values)
+                    if live_metrics:
+                        live_metrics.update(measurement, values)
+                    if history is not None:
+                        history.append_vector(values)
+                overhead.end("log")
+            last_measurement = measurement
+
+            # Display the measurement.
+            #   (The display may skip some samples. The sampling interval may vary, see »AdaptiveSampler«.)
+            end = measurement.get_end()
+            if not args.headless and ( last_display is None or end - last_display >= display_interval or end < last_display ):
+                overhead.begin()
                 running = ui.display( measurement )
-                display_skip_counter = 0
-            display_skip_counter += 1
-
-            # Store the last reading as |old_reading|.
-            old_reading = new_reading
+                overhead.end("display")
+                last_display = end
 
-            time.sleep(sample_interval)
-                ## XXX TODO We could calculating the remaining waiting-time here.
+            source.wait()
 
 
 
@@ -196,7 +341,14 @@ def main_loop():
         # Tear down the UI.
         if not args.headless:
             ui.close()
+        profiler.stop()
         logging_manager.close()
+        if exporter:
+            exporter.close()
+        if live_metrics:
+            live_metrics.close()
+        if control:
+            control.close()
 
     ## On error: Print error message *after* curses has quit.
     if ( err ):
@@ -211,11 +363,51 @@ def main_loop():
 
 
 
+def parse_log_output(tokens, args):
+    """
+    Turns a --log specification (KEY=VALUE tokens) into the arguments of a »LogOutput«.
+    Raises a ValueError if it's invalid.
+    """
+
+    output = dict( path=args.path, autologging=args.autologging )
+
+    for token in tokens:
+        key, sep, value = token.partition("=")
+        if ( key == "aggregate" and not sep ):
+            value = "yes"
+
+        if ( key == "path" ):
+            output["path"] = None if value == "-" else value
+        elif ( key == "sqlite" ):
+            from sqlite_sink import SQLiteSink
+            output["sink"] = SQLiteSink( value, args.sqlite_layout )
+        elif ( key == "remote" ):
+            from network_sink import RemoteSink
+            output["sink"] = RemoteSink( value, args.spool if args.spool else os.path.join(args.path or ".", "spool") )
+        elif ( key == "classes" ):
+            output["classes"] = value.split(",")
+        elif ( key == "every" ):
+            output["every"] = int(value)
+            if ( output["every"] < 1 ):
+                raise ValueError("every must be at least 1")
+        elif ( key in ("aggregate", "autologging") ):
+            if ( value not in ("yes", "no") ):
+                raise ValueError("{} must be 'yes' or 'no'".format(key))
+            output[key] = (value == "yes")
+        else:
+            raise ValueError("unknown key: " + key)
+
+    return output
+
+
+
 ## MAIN ##
 if __name__ == "__main__":
 
     ## Command line arguments
     import argparse
+    from control import DEFAULT_SOCKET as DEFAULT_CONTROL_SOCKET
+    from collectors import COLLECTORS, create_collectors, load_plugin, load_entry_points
 #
     parser = argparse.ArgumentParser()
 
@@ -232,12 +424,35 @@ if __name__ == "__main__":
                         help="Path where the log files are stored in. (See --logging.)")
     parser.add_argument("--stdout", action="store_true",
                         help="Log to stdout instead of writing to a file (implies --logging and --headless, ignores --path)")
+    parser.add_argument("--remote", metavar="URL",
+                        help="Stream the log to a collector (tcp://HOST:PORT or udp://HOST:PORT) instead of writing a file (implies --logging)")
+    parser.add_argument("--spool",
+                        help="Directory for spooling the log while the collector is unreachable. [Default = <path>/spool] (See --remote.)")
+    parser.add_argument("--sqlite", metavar="DATABASE",
+                        help="Write the log into an SQLite database instead of a file (implies --logging)")
+    parser.add_argument("--sqlite-layout", choices=("wide", "narrow"), default="wide",
+                        help="Table layout: one column per value, or one (time, series, value) row per value. [Default = wide] (See --sqlite.)")
+    parser.add_argument("--log", nargs="+", action="append", metavar="KEY=VALUE",
+                        help="Write (another) log from the same measurements, instead of the default one. Keys: "
+                             "path=DIR ('-' for stdout; default: --path), sqlite=DATABASE, remote=URL, "
+                             "classes=CLASS,... (default: all), every=N (only every N-th measurement), "
+                             "aggregate[=yes] (instead: the mean of every N measurements), autologging=yes|no (default: --autologging). "
+                             "Can be given several times; implies --logging. "
+                             "Example: --log classes=NIC path=/data/fast  --log every=100 aggregate path=/data/capacity")
     parser.add_argument("-e", "--environment",
                         help="JSON file that holds arbitrary environment context. (This can be seen as a structured comment field.)")
     parser.add_argument("-i", "--interval", default="0.5",
                         help="Time between two samples (in seconds). [Default = 0.5]")
     parser.add_argument("-d", "--displayinterval", default="1",
                         help="Time between two display updates (in seconds). [Default = 1]")
+    parser.add_argument("--adaptive", type=float, metavar="FAST_INTERVAL",
+                        help="Adaptive sampling: Sample every FAST_INTERVAL seconds while there is activity on the NICs or CPUs, and every --interval seconds otherwise.")
+    parser.add_argument("--adaptive-hold", type=float, default=10,
+                        help="Time without activity (in seconds) before returning to the base interval. [Default = 10] (See --adaptive.)")
+    parser.add_argument("--adaptive-rate", type=float, default=1,
+                        help="NIC activity: traffic above this rate (in Mbit/s, sent or received, on any NIC). [Default = 1] (See --adaptive.)")
+    parser.add_argument("--adaptive-cpu", type=float, default=50,
+                        help="CPU activity: utilization above this share (in percent, on any CPU). [Default = 50] (See --adaptive.)")
 
 
     # NICs
@@ -247,8 +462,130 @@ if __name__ == "__main__":
     parser.add_argument("-q", "--headless", action="store_true", 
                         help="Run in quiet/headless mode without GUI")
 
+    ## Collectors
+    parser.add_argument("--collect", nargs="+", default=list(), metavar="NAME",
+                        help="Also log these (optional) values: {} (or those of installed plugins)".format(", ".join(sorted(COLLECTORS))))
+    parser.add_argument("--plugin", action="append", default=list(), metavar="PLUGIN",
+                        help="Load (and enable) the collectors of this plugin: a Python file or module. (See »collectors.py«.) Can be given several times.")
+    parser.add_argument("--disks", nargs="+", metavar="DEVICE",
+                        help="The block devices to log, e.g. 'sda nvme0n1'. [Default = all disks, without partitions] (See --collect disk.)")
+    parser.add_argument("--cgroups", nargs="+", metavar="CGROUP",
+                        help="The cgroups (v2) to log: paths or glob patterns below the cgroup root, e.g. 'system.slice/docker-*.scope'. [Default = '*'] (See --collect cgroups.)")
+
+    ## Daemon
+    parser.add_argument("--control", nargs="?", const=DEFAULT_CONTROL_SOCKET, metavar="SOCKET",
+                        help="Accept commands (start/stop logging, comment, ...) on a UNIX socket, see cnl_ctl.py. [Default = {}]".format(DEFAULT_CONTROL_SOCKET))
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running as a daemon, controlled via the control socket. (Implies --headless and --control.)")
+
+    ## Simulation
+    parser.add_argument("--sysroot", metavar="DIR",
+                        help="Read proc/stat, proc/net/dev, proc/meminfo, ... below DIR instead of /proc and /sys.")
+    parser.add_argument("--simulate", metavar="CPUSxNICS",
+                        help="Measure a simulated system instead, e.g. '1024x5000'.")
+    parser.add_argument("--pattern", choices=backends.SimulatedBackend.PATTERNS, default="burst",
+                        help="Traffic pattern of the simulation. [Default = burst] (See --simulate.)")
+    parser.add_argument("--virtual-time", action="store_true",
+                        help="Run the simulation on a virtual clock, as fast as possible. (See --simulate.)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed of the simulation. [Default = 0] (See --simulate.)")
+
+    ## Replay
+    parser.add_argument("--replay", metavar="FILE",
+                        help="Replay a recorded log instead of measuring. (Keys: space = pause, </> = seek, [/] = speed)")
+    parser.add_argument("--speed", default="1x",
+                        help="Replay speed, e.g. '10x' or 'max'. [Default = 1x] (See --replay.)")
+    parser.add_argument("--seek", metavar="TIME",
+                        help="Start the replay at TIME: Unix time, '+SECONDS' or 'HH:MM[:SS]'. (See --replay.)")
+
+    ## Exporter
+    parser.add_argument("--exporter", metavar="[HOST]:PORT",
+                        help="Serve the latest measurement to Prometheus scrapers on the given address, e.g. ':9105'.")
+    parser.add_argument("--history", type=float, default=60, metavar="SECONDS",
+                        help="Keep the measurements of the last SECONDS in memory, for queries over the control socket (only with --control, see cnl-ctl history). 0 disables it. [Default = 60]")
+    parser.add_argument("--shm", nargs="?", const="/dev/shm/cpunetlog", metavar="PATH",
+                        help="Publish the latest measurement into a shared memory file for local consumers (see live_metrics_reader.py). [Default = /dev/shm/cpunetlog]")
+
+    ## Profiling
+    parser.add_argument("--profile", nargs="?", const="cprofile", choices=("cprofile", "sample"),
+                        help="Profile the main loop (cProfile, or a sampling profiler) and write the profile next to the logs. (SIGUSR1 starts/stops profiling at any time.)")
+    parser.add_argument("--profile-duration", type=float, default=60,
+                        help="Length of a profiling window (in seconds). [Default = 60] (See --profile.)")
+    parser.add_argument("--profile-tracemalloc", type=int, default=0, metavar="N",
+                        help="Also report the top N allocation sites of each sample. (See --profile.)")
+
     args = parser.parse_args()
 
+    ## --daemon implies --headless and --control
+    if args.daemon:
+        args.headless = True
+        if not args.control:
+            args.control = DEFAULT_CONTROL_SOCKET
+
+    ## Collector plugins: --plugin enables all collectors of the plugin; installed ones are only looked up if needed.
+    for plugin in args.plugin:
+        try:
+            args.collect.extend( name for name in load_plugin(plugin) if name not in args.collect )
+        except (ImportError, OSError, ValueError, SyntaxError) as e:
+            parser.error( "can't load plugin '{}': {}".format(plugin, e) )
+
+    if any( name not in COLLECTORS for name in args.collect ):
+        load_entry_points()
+        unknown = [ name for name in args.collect if name not in COLLECTORS ]
+        if unknown:
+            parser.error( "unknown collector(s): {} (available: {})".format(", ".join(unknown), ", ".join(sorted(COLLECTORS))) )
+
+
+    ## System backend: The real host, a sysroot or a simulation.
+    if args.sysroot:
+        backends.set_backend( backends.SysrootBackend(args.sysroot) )
+    elif args.simulate:
+        sim_cpus, sim_nics = ( int(x) for x in args.simulate.lower().split("x") )
+        backends.set_backend( backends.SimulatedBackend(sim_cpus, sim_nics, args.pattern, seed=args.seed,
+                                                        virtual_clock=args.virtual_time) )
+
+    backend = backends.get_backend()
+
+    ## NICs: With --nics, only these are looked up. (There may be thousands of virtual interfaces.)
+    nic_speeds = backend.nic_speeds(args.nics)
+    if args.nics:
+        nics = args.nics
+    elif args.sysroot or args.simulate:
+        nics = list( backend.net_io_counters().keys() )
+    else:
+        # All NICs with a known speed (i.e. no loopback, tunnels, ...)
+        nics = list( nic_speeds.keys() )
+
+    num_cpus = backend.cpu_count()
+    system_info = backend.sysinfo()
+
+    ## Source: Live measurements, or a replay of a recorded log.
+    if args.replay:
+        from replay import Replay, parse_speed
+        source = Replay( args.replay, parse_speed(args.speed), pause_at_end=not (args.headless or args.stdout) )
+        if args.seek:
+            try:
+                source.start_time = source.reader.parse_time(args.seek)
+            except ValueError as e:
+                parser.error("--seek: " + str(e))
+
+        # Use the recorded CPUs, NICs, ...
+        num_cpus = source.num_cpus
+        system_info = source.system_info
+        nics = source.nics
+        nic_speeds = dict()
+        collectors = list()
+        display_interval = 0
+    else:
+        collectors = create_collectors( args.collect, backend, nics, {"disks": args.disks, "cgroups": args.cgroups} )
+
+        sample_interval = float(args.interval)
+        if args.adaptive:
+            source = AdaptiveSampler( sample_interval, args.adaptive, args.adaptive_hold, args.adaptive_rate * 1000000,
+                                      args.adaptive_cpu, nics, collectors )
+        else:
+            source = Sampler(sample_interval, nics, collectors)
+        display_interval = float(args.displayinterval)
 
 
     ## NICs
@@ -261,6 +598,20 @@ if __name__ == "__main__":
     if ( args.autologging ):
         args.logging = True
 
+    ## --remote and --sqlite imply --logging
+    if args.remote and args.sqlite:
+        parser.error("--remote and --sqlite can't be combined.")
+
+    sink = None
+    if args.remote:
+        from network_sink import RemoteSink
+        args.logging = True
+        sink = RemoteSink( args.remote, args.spool if args.spool else os.path.join(args.path, "spool") )
+    elif args.sqlite:
+        from sqlite_sink import SQLiteSink
+        args.logging = True
+        sink = SQLiteSink( args.sqlite, args.sqlite_layout )
+
     ## --stdout implies --logging and --headless
     if args.stdout:
         args.logging = True
@@ -268,19 +619,103 @@ if __name__ == "__main__":
         # By convention, path == None means "output to stdout"
         args.path = None
 
-    ## compensate psutil version incompatibilities
-    try:
-        num_cpus = psutil.cpu_count()
-    except:
-        num_cpus = psutil.NUM_CPUS
+    ## --log: Several logs (instead of the one of --path, --stdout, --remote or --sqlite)
+    outputs = None
+    if args.log:
+        if sink:
+            parser.error("--remote and --sqlite can't be combined with --log (use remote=URL or sqlite=DATABASE there).")
+
+        args.logging = True
+        try:
+            outputs = [ parse_log_output(tokens, args) for tokens in args.log ]
+        except ValueError as e:
+            parser.error( "invalid --log: " + str(e) )
+
+        ## A log to stdout (path=-) implies --headless, as --stdout does
+        if any( output["path"] is None and "sink" not in output for output in outputs ):
+            args.stdout = True
+            args.headless = True
+            if args.replay:
+                source.pause_at_end = False
 
     ## Logging
-    logging_manager = LoggingManager( num_cpus, monitored_nics, helpers.get_sysinfo(), args.environment,
-                                      args.comment, args.path, args.autologging, args.watch )
+    try:
+        logging_manager = LoggingManager( num_cpus, monitored_nics, system_info, args.environment,
+                                          args.comment, args.path, args.autologging, args.watch, sink, collectors, outputs )
+    except ValueError as e:
+        parser.error( ("invalid --log: " if outputs else "") + str(e) )
     if args.logging:
         logging_manager.enable_measurement_logger()
 
+    ## (curses) UI
+    if not args.headless:
+        import curses_display as ui
+
+        ui.nics = monitored_nics
+        ui.nic_speeds = nic_speeds
+        ui.logging_manager = logging_manager
+        ui.collectors = collectors
+        if args.replay:
+            ui.key_handler = source.handle_key
+            ui.status = source.get_state
+
+    ## Encoder of the exporter, the shared memory and the history (they share the encoded measurements)
+    live_encoder = MeasurementEncoder(num_cpus, monitored_nics, collectors)
+
+    ## Exporter
+    exporter = None
+    if args.exporter:
+        from exporter import MetricsExporter, parse_address
+        exporter = MetricsExporter( live_encoder, parse_address(args.exporter) )
+
+    ## Shared memory
+    live_metrics = None
+    if args.shm:
+        from live_metrics import LiveMetricsPublisher
+        live_metrics = LiveMetricsPublisher( live_encoder, args.shm )
+
+
+    ## History (of the fastest sampling rate), for the control socket
+    #   (Grown by the control socket, if the interval is made shorter.)
+    history = None
+    if args.control and args.history > 0:
+        from columnar_history import ColumnarHistory
+        shortest_interval = min( float(args.interval), args.adaptive or float(args.interval) )
+        history = ColumnarHistory( live_encoder, int( math.ceil(args.history / shortest_interval) ) + 1 )
+
+    ## Control socket
+    control = None
+    if args.control:
+        from control import ControlServer, Controller
+        control = ControlServer( args.control, Controller(logging_manager, source, ui, history, args.history) )
+
+    ## A daemon quits gracefully on SIGTERM, as on Ctrl-C.
+    if args.daemon:
+        import signal
+
+        def _terminate(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, _terminate)
+
+
+    ## Profiling (also started later by SIGUSR1)
+    from profiling import Profiler
+    profile_prefix = os.path.join( args.path if args.path else ".",
+                                   time.strftime("%Y-%m-%d_%H:%M:%S") + "-" + system_info["hostname"] )
+    profiler = Profiler( profile_prefix, args.profile if args.profile else "cprofile",
+                         args.profile_duration, args.profile_tracemalloc, verbose=args.headless and not args.stdout )
+    profiler.install_signal_handler()
+    if args.profile:
+        profiler.start()
+
 
     # Run the main loop.
-    main_loop()
+    main_loop(source, display_interval)
+
+    for collector in collectors:
+        collector.close()
+
+    for sink in logging_manager.get_sinks():
+        print( "Log sink statistics: " + str(sink.get_stats()), file=sys.stderr )
 
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+System backends: Where »Readings« get their values (and their clock) from.
+
+  - HostBackend:       The real host (»psutil«, /proc and /sys). This is the default.
+  - SysrootBackend:    A directory tree with (synthetic) proc/stat, proc/net/dev, proc/meminfo,
+                       proc/sys/fs/file-nr and sys/class/net/*/speed files.
+  - SimulatedBackend:  A deterministic generator for any number of CPUs and NICs with scripted
+                       traffic patterns, optionally on a virtual clock (no sleeping at all).
+
+The active backend is |backend| (set it with |set_backend()| before taking the first »Reading«).
+
+All backends return the same (named tuple) types as »psutil«.
+'''
+
+import math
+import os
+import random
+import time
+
+from collections import namedtuple
+
+
+## Same fields as »psutil« on Linux.
+scputimes = namedtuple("scputimes", ("user", "nice", "system", "idle", "iowait", "irq", "softirq", "steal", "guest", "guest_nice"))
+snetio = namedtuple("snetio", ("bytes_sent", "bytes_recv", "packets_sent", "packets_recv", "errin", "errout", "dropin", "dropout"))
+svmem = namedtuple("svmem", ("total", "available", "percent", "used", "free", "active", "inactive", "buffers", "cached", "shared", "slab"))
+
+## Unit of the CPU times in /proc/stat.
+CLOCK_TICKS = 100
+
+
+
+class HostBackend:
+    """
+    The real host.
+
+    Interface (all backends):
+      - time() / sleep( seconds )
+      - cpu_count()
+      - cpu_times()         (per CPU)
+      - virtual_memory()
+      - net_io_counters()   (per NIC)
+      - nb_open_files()
+      - nic_speeds( nics )  (bit/s, of the given NICs or of all)
+      - sysinfo()
+      - proc_path( name )   (path of a procfs/sysfs file, e.g. "proc/net/snmp", for the »Collectors«; or None)
+    """
+
+    def __init__(self):
+        ## (Imported here, so that the other backends don't need them.)
+        import psutil
+        import helpers
+
+        self.psutil = psutil
+        self.helpers = helpers
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def cpu_count(self):
+        ## compensate psutil version incompatibilities
+        try:
+            return self.psutil.cpu_count()
+        except:
+            return self.psutil.NUM_CPUS
+
+    def cpu_times(self):
+        return self.psutil.cpu_times(percpu=True)
+
+    def virtual_memory(self):
+        return self.psutil.virtual_memory()
+
+    def net_io_counters(self):
+        return self.psutil.net_io_counters(pernic=True)
+
+    def nb_open_files(self):
+        return self.helpers.get_nb_open_files()
+
+    def nic_speeds(self, nics=None):
+        return self.helpers.get_nic_speeds(nics)
+
+    def sysinfo(self):
+        return self.helpers.get_sysinfo()
+
+    def proc_path(self, name):
+        return "/" + name
+
+
+
+class SysrootBackend:
+    """
+    Reads the (procfs/sysfs formatted) files below |root| instead of /proc and /sys.
+    (The clock is the real one; the files may be updated by some external script.)
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+        if ( not os.path.exists(self._path("proc/stat")) ):
+            raise ValueError("Not a sysroot (proc/stat is missing): " + root)
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _read(self, name):
+        with open( self._path(name) ) as f:
+            return f.read()
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def cpu_count(self):
+        return len( self.cpu_times() )
+
+    def cpu_times(self):
+        ret = list()
+
+        for line in self._read("proc/stat").splitlines():
+            if ( line.startswith("cpu") and line[3:4].isdigit() ):
+                values = [ int(x) / CLOCK_TICKS for x in line.split()[1:] ]
+                values += [0.0] * (len(scputimes._fields) - len(values))
+                ret.append( scputimes( *values[:len(scputimes._fields)] ) )
+
+        return ret
+
+    def virtual_memory(self):
+        info = dict()
+        for line in self._read("proc/meminfo").splitlines():
+            name, sep, value = line.partition(":")
+            if ( sep ):
+                info[name] = int( value.split()[0] ) * 1024
+
+        total = info.get("MemTotal", 0)
+        free = info.get("MemFree", 0)
+        buffers = info.get("Buffers", 0)
+        cached = info.get("Cached", 0) + info.get("SReclaimable", 0)
+        available = info.get("MemAvailable", free + buffers + cached)
+        used = max( total - free - buffers - cached, 0 )
+
+        return svmem( total, available, round(100.0 * (total - available) / total, 1) if total else 0,
+                      used, free, info.get("Active", 0), info.get("Inactive", 0),
+                      buffers, cached, info.get("Shmem", 0), info.get("Slab", 0) )
+
+    def net_io_counters(self):
+        ret = dict()
+
+        for line in self._read("proc/net/dev").splitlines()[2:]:
+            name, sep, values = line.partition(":")
+            if ( not sep ):
+                continue
+
+            v = [ int(x) for x in values.split() ]
+            #                     sent  recv  pkt_s pkt_r errin errout dropin dropout
+            ret[name.strip()] = snetio( v[8], v[0], v[9], v[1], v[2], v[10], v[3], v[11] )
+
+        return ret
+
+    def nb_open_files(self):
+        try:
+            return int( self._read("proc/sys/fs/file-nr").split()[0] )
+        except OSError:
+            return 0
+
+    def nic_speeds(self, nics=None):
+        ret = dict()
+
+        for nic in nics if nics is not None else self.net_io_counters():
+            try:
+                ret[nic] = int( self._read("sys/class/net/" + nic + "/speed").strip() ) * 1000 * 1000
+            except (OSError, ValueError):
+                pass
+
+        return ret
+
+    def sysinfo(self):
+        ret = dict( zip( ("sysname", "hostname", "kernel", "version", "machine"), os.uname() ) )
+        ret["hostname"] = "sysroot-" + os.path.basename( os.path.abspath(self.root) )
+
+        return ret
+
+    def proc_path(self, name):
+        return self._path(name)
+
+
+
+class SimulatedBackend:
+    """
+    Simulates |num_cpus| CPUs and |num_nics| NICs. Everything is derived from the clock and |seed|,
+    so two runs with the same parameters (and a virtual clock) produce the same values.
+
+    Traffic |pattern| (per NIC, each with its own random base rate and phase):
+      - "constant": the base rate
+      - "sine":     oscillates between 0 and the base rate (|period| seconds)
+      - "burst":    the base rate for a quarter of each |period|, idle otherwise (all NICs at once;
+                    exercises auto-logging)
+      - "idle":     no traffic
+
+    The CPU load follows the traffic.
+
+    With |virtual_clock|, the clock starts at |start| and only advances by |sleep()|, i.e. the
+    simulation runs as fast as possible.
+    """
+
+    PATTERNS = ("constant", "sine", "burst", "idle")
+
+    def __init__(self, num_cpus, num_nics, pattern="burst", period=120, seed=0, virtual_clock=False, start=None):
+        if ( pattern not in self.PATTERNS ):
+            raise ValueError("Unknown traffic pattern (expected one of {}): {}".format(", ".join(self.PATTERNS), pattern))
+
+        self.num_cpus = num_cpus
+        self.nics = [ "sim" + str(i) for i in range(num_nics) ]
+        self.pattern = pattern
+        self.period = period
+        self.virtual_clock = virtual_clock
+
+        self.start = start if start is not None else math.floor( time.time() )
+        self.clock = self.start
+
+        ## Deterministic parameters
+        rng = random.Random(seed)
+        self.SPEED = 10 * 1000 * 1000 * 1000     # bit/s
+        self.base_rates = [ 10 ** rng.uniform(5, 8.5) for nic in self.nics ]       # bytes/s (up to ~2.5 Gbit/s)
+        self.phases = [ rng.uniform(0, period) for nic in self.nics ]
+        self.cpu_weights = [ rng.uniform(0.2, 1) for i in range(num_cpus) ]
+        self.max_total = sum(self.base_rates) or 1
+
+        ## Counters (advanced by |_update()|)
+        self.last_update = self.start
+        self.cpu_counters = [ [0.0] * len(scputimes._fields) for i in range(num_cpus) ]
+        self.net_counters = [ [0] * len(snetio._fields) for nic in self.nics ]
+
+        self.TOTAL_MEMORY = 64 * 1024**3
+
+
+    def _rate(self, i, t):
+        """ Receive rate (bytes/s) of NIC |i| at time |t|. """
+
+        if ( self.pattern == "idle" ):
+            return 0
+
+        base = self.base_rates[i]
+
+        if ( self.pattern == "sine" ):
+            phase = (t - self.start + self.phases[i]) % self.period
+            return base * (1 + math.sin(2 * math.pi * phase / self.period)) / 2
+        elif ( self.pattern == "burst" ):
+            phase = (t - self.start) % self.period
+            return base if phase < self.period / 4 else 0
+
+        return base
+
+
+    def _update(self):
+        t = self.time()
+        dt = t - self.last_update
+        if ( dt <= 0 ):
+            return
+        self.last_update = t
+
+        ## NICs (send half as much as they receive; 1000 byte packets)
+        total = 0
+        for i, counters in enumerate(self.net_counters):
+            rate = self._rate(i, t)
+            total += rate
+
+            received = int(rate * dt)
+            counters[0] += received // 2
+            counters[1] += received
+            counters[2] += received // 2000
+            counters[3] += received // 1000
+
+        ## CPUs: Split the load into user, system, irq and softirq.
+        load = total / self.max_total
+        for weight, counters in zip(self.cpu_weights, self.cpu_counters):
+            util = min(0.05 + 0.9 * load * weight, 1.0) * dt
+            counters[0] += util * 0.5       # user
+            counters[2] += util * 0.25      # system
+            counters[5] += util * 0.05      # irq
+            counters[6] += util * 0.2       # softirq
+            counters[3] += dt - util        # idle
+
+
+    ## Interface ##
+
+    def time(self):
+        return self.clock if self.virtual_clock else time.time()
+
+    def sleep(self, seconds):
+        if ( self.virtual_clock ):
+            self.clock += seconds
+        else:
+            time.sleep(seconds)
+
+    def cpu_count(self):
+        return self.num_cpus
+
+    def cpu_times(self):
+        self._update()
+        return [ scputimes(*c) for c in self.cpu_counters ]
+
+    def virtual_memory(self):
+        total = self.TOTAL_MEMORY
+        used = total // 4
+        return svmem( total, total - used, 25.0, used, total // 2, used, total // 8, total // 32, total // 4, total // 64, total // 64 )
+
+    def net_io_counters(self):
+        self._update()
+        return dict( (nic, snetio(*c)) for nic, c in zip(self.nics, self.net_counters) )
+
+    def nb_open_files(self):
+        return 1000 + len(self.nics)
+
+    def nic_speeds(self, nics=None):
+        if ( nics is None ):
+            return dict.fromkeys(self.nics, self.SPEED)
+
+        known = set(self.nics)
+        return dict( (nic, self.SPEED) for nic in nics if nic in known )
+
+    def sysinfo(self):
+        return { "sysname": "Linux",
+                 "hostname": "simulated-{}x{}".format(self.num_cpus, len(self.nics)),
+                 "kernel": "simulated",
+                 "version": self.pattern,
+                 "machine": "x86_64" }
+
+    def proc_path(self, name):
+        ## (No such files: The »Collectors« aren't available in a simulation.)
+        return None
+
+
+
+def write_sysroot(source, root):
+    """
+    Writes the current values of the backend |source| as a sysroot (see »SysrootBackend«) into |root|.
+    """
+
+    for d in ("proc/net", "proc/sys/fs"):
+        os.makedirs( os.path.join(root, d), exist_ok=True )
+
+    cpus = source.cpu_times()
+    with open( os.path.join(root, "proc/stat"), "w" ) as f:
+        totals = [ sum(x) for x in zip(*cpus) ]
+        f.write( "cpu  " + " ".join( str(int(x * CLOCK_TICKS)) for x in totals ) + "\n" )
+        for i, cpu in enumerate(cpus):
+            f.write( "cpu{} {}\n".format( i, " ".join( str(int(x * CLOCK_TICKS)) for x in cpu ) ) )
+
+    with open( os.path.join(root, "proc/net/dev"), "w" ) as f:
+        f.write( "Inter-|   Receive                                                |  Transmit\n" )
+        f.write( " face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed\n" )
+        for nic, c in sorted( source.net_io_counters().items() ):
+            f.write( "{:>6}: {} {} {} {} 0 0 0 0 {} {} {} {} 0 0 0 0\n".format(
+                        nic, c.bytes_recv, c.packets_recv, c.errin, c.dropin, c.bytes_sent, c.packets_sent, c.errout, c.dropout) )
+
+    mem = source.virtual_memory()
+    with open( os.path.join(root, "proc/meminfo"), "w" ) as f:
+        for name, value in ( ("MemTotal", mem.total), ("MemFree", mem.free), ("MemAvailable", mem.available),
+                             ("Buffers", mem.buffers), ("Cached", mem.cached), ("Active", mem.active),
+                             ("Inactive", mem.inactive), ("Shmem", mem.shared), ("Slab", mem.slab) ):
+            f.write( "{}: {} kB\n".format(name, value // 1024) )
+
+    with open( os.path.join(root, "proc/sys/fs/file-nr"), "w" ) as f:
+        f.write( "{}\t0\t1000000\n".format( source.nb_open_files() ) )
+
+    for nic, speed in source.nic_speeds().items():
+        os.makedirs( os.path.join(root, "sys/class/net", nic), exist_ok=True )
+        with open( os.path.join(root, "sys/class/net", nic, "speed"), "w" ) as f:
+            f.write( "{}\n".format(speed // (1000 * 1000)) )
+
+
+
+## The active backend.
+backend = None
+
+def get_backend():
+    global backend
+
+    if ( not backend ):
+        backend = HostBackend()
+
+    return backend
+
+def set_backend(new_backend):
+    global backend
+    backend = new_backend
+
+
+
+## MAIN ##
+if __name__ == "__main__":
+
+    ## Command line arguments
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write a synthetic sysroot (see --sysroot of cpunetlog) from a simulation.")
+
+    parser.add_argument("root",
+                        help="Target directory.")
+    parser.add_argument("--simulate", default="16x4", metavar="CPUSxNICS",
+                        help="Number of CPUs and NICs. [Default = 16x4]")
+    parser.add_argument("--pattern", choices=SimulatedBackend.PATTERNS, default="constant",
+                        help="Traffic pattern. [Default = constant]")
+    parser.add_argument("--seconds", type=float, default=60,
+                        help="Simulated time before the snapshot is written. [Default = 60]")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed. [Default = 0]")
+
+    args = parser.parse_args()
+
+    num_cpus, num_nics = ( int(x) for x in args.simulate.lower().split("x") )
+    sim = SimulatedBackend(num_cpus, num_nics, args.pattern, seed=args.seed, virtual_clock=True)
+    sim.sleep(args.seconds)
+
+    write_sysroot(sim, args.root)
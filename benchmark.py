@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Benchmarks of the hot paths of »cpunetlog«:
+
+  - startup:       Importing the main program          (in a fresh interpreter)
+  - nic_speeds:    Looking up the NIC speeds           (live, on this host: all NICs, and a single one)
+  - reading:       Reading()                           (live, on this host)
+  - collect.*:     Collector.read()                    (live, on this host; all available collectors)
+  - sysfs_*:       SysfsFiles.read(), serial and with threads   (live, on this host)
+  - measurement:   Measurement( reading1, reading2 )
+  - cpu_percent:   calculate_cpu_times_percent( ..., percpu=True )
+  - encode:        MeasurementEncoder.encode
+  - logger:        MeasurementLogger.log               (including CNLFileWriter.write_vector into /dev/null)
+  - write_vector:  CNLFileWriter.write_vector          (/dev/null)
+  - display:       curses_display._display             (against a virtual screen)
+
+All but the live ones run on synthetic »Readings« for each combination of CPU and NIC counts.
+
+Importing the main program must not do any real work (e.g. discovering NICs) nor load the UI, the
+system libraries or NumPy: If "startup" sees any of the |HEAVY_MODULES| being imported, or if it takes
+longer than --startup-limit (median, including the start of the interpreter), the run fails.
+
+Each benchmark reports ops/s, median and p99 latency, and the peak memory allocated per operation
+(tracemalloc, in a separate pass). The results are written into a JSON file, together with the
+commit they were measured on, so that they can be compared across commits (see --compare).
+'''
+
+import glob
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from collections import namedtuple
+
+import psutil
+
+import backends
+import curses_display
+from collectors import COLLECTORS, SysfsFiles, create_collectors
+from logging import LoggingManager, MeasurementEncoder, MeasurementLogger, CNLFileWriter
+from psutil_functions import calculate_cpu_times_percent
+
+
+BASE_DIR = os.path.dirname( os.path.abspath(__file__) )
+
+## Modules that the main program must only load when (and if) they are needed.
+HEAVY_MODULES = ("curses", "netifaces", "psutil", "numpy", "multiprocessing")
+
+## Median time (seconds) that "startup" may take. (About 45 ms on a single-CPU VM, most of it the interpreter.)
+STARTUP_LIMIT = 0.1
+
+## Imports the main program, and prints which of the |HEAVY_MODULES| that loaded.
+STARTUP_SCRIPT = """
+import sys, runpy
+sys.path.insert(0, {base!r})
+runpy.run_path({main!r}, run_name="cpunetlog_main")
+print( ",".join( m for m in {heavy!r} if m in sys.modules ) )
+"""
+
+## Same fields as »psutil« on Linux.
+FakeCpuTimes = namedtuple("scputimes", ("user", "nice", "system", "idle", "iowait", "irq", "softirq", "steal", "guest", "guest_nice"))
+FakeNetIO = namedtuple("snetio", ("bytes_sent", "bytes_recv", "packets_sent", "packets_recv", "errin", "errout", "dropin", "dropout"))
+
+
+
+def _load_main_module():
+    """
+    Imports »__init__.py« (the main program, which defines »Reading« and »Measurement«) as a module.
+    """
+
+    spec = importlib.util.spec_from_file_location( "cpunetlog_main", os.path.join(BASE_DIR, "__init__.py") )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def startup():
+    """
+    Imports the main program in a fresh interpreter. Returns the |HEAVY_MODULES| that were loaded.
+    """
+
+    script = STARTUP_SCRIPT.format( base=BASE_DIR, main=os.path.join(BASE_DIR, "__init__.py"), heavy=HEAVY_MODULES )
+    output = subprocess.check_output( [sys.executable, "-c", script], cwd=BASE_DIR ).decode().strip()
+
+    return output.split(",") if output else []
+
+
+def get_commit():
+    """
+    Returns the current commit id (with "-dirty", if there are uncommitted changes), or None.
+    """
+
+    try:
+        commit = subprocess.check_output( ["git", "rev-parse", "HEAD"], cwd=BASE_DIR, stderr=subprocess.DEVNULL ).decode().strip()
+        dirty = subprocess.call( ["git", "diff", "--quiet", "HEAD", "--", "*.py"], cwd=BASE_DIR, stderr=subprocess.DEVNULL )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return commit + ("-dirty" if dirty else "")
+
+
+
+## Synthetic data ##
+
+def fake_reading(main, num_cpus, nics, t):
+    """
+    A »Reading« with |num_cpus| CPUs and the NICs |nics|, whose counters grow with |t|.
+    """
+
+    reading = main.Reading.__new__(main.Reading)
+    reading.timestamp = t
+
+    reading.cpu_times = [ FakeCpuTimes( *[ t * (f+1) * (i%7+1) for f in range(10) ] ) for i in range(num_cpus) ]
+    reading.net_io = dict( (nic, FakeNetIO( *[ int(t * 1000 * (f+1) * (i+1)) for f in range(8) ] )) for i, nic in enumerate(nics) )
+    reading.memory = psutil.virtual_memory()
+    reading.nb_open_files = 42
+    reading.collected = list()
+
+    return reading
+
+
+
+class VirtualScreen:
+    """
+    Stand-in for a curses window: Keeps the text in a (growing) buffer, and ignores all attributes.
+    """
+
+    def __init__(self, width=80):
+        self.width = width
+        self.lines = list()
+        self.y = 0
+        self.x = 0
+
+    def _put(self, y, x, text):
+        while ( len(self.lines) <= y ):
+            self.lines.append( [" "] * self.width )
+
+        line = self.lines[y]
+        end = min( x + len(text), self.width )
+        line[x:end] = text[:end-x]
+
+        self.y = y
+        self.x = end
+
+    def addstr(self, *args):
+        ## (y, x, text[, attr])  or  (text[, attr])
+        if ( isinstance(args[0], str) ):
+            self._put(self.y, self.x, args[0])
+        else:
+            self._put(args[0], args[1], args[2])
+
+    def move(self, y, x):
+        self.y = y
+        self.x = x
+
+    def hline(self, y, x, char, n):
+        self._put(y, x, char * n)
+
+    def clear(self):
+        self.lines = list()
+
+    def getch(self):
+        return -1
+
+    def border(self, *args):
+        pass
+
+    def refresh(self):
+        pass
+
+
+class VirtualCurses:
+    """ The parts of the »curses« module that »curses_display« uses while drawing. """
+
+    A_BOLD = 1 << 21
+    A_REVERSE = 1 << 18
+
+    @staticmethod
+    def color_pair(n):
+        return n << 8
+
+
+
+## Benchmark runner ##
+
+def run(func, min_time=0.5, min_ops=20):
+    """
+    Calls |func| repeatedly (for at least |min_time| seconds and |min_ops| times).
+
+    Returns ops/s, median and p99 latency (in seconds), and the peak memory allocated per call (in bytes).
+    """
+
+    ## Warm up.
+    for i in range(3):
+        func()
+
+    ## Timing
+    latencies = list()
+    start = time.perf_counter()
+    while ( len(latencies) < min_ops or time.perf_counter() - start < min_time ):
+        t = time.perf_counter()
+        func()
+        latencies.append( time.perf_counter() - t )
+    total = time.perf_counter() - start
+
+    latencies.sort()
+
+    ## Allocations (separate pass, since tracing slows everything down)
+    tracemalloc.start()
+    peak = 0
+    for i in range(5):
+        tracemalloc.clear_traces()
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func()
+        peak = max( peak, tracemalloc.get_traced_memory()[1] - base )
+    tracemalloc.stop()
+
+    return { "ops": len(latencies),
+             "ops_per_s": len(latencies) / total,
+             "median": latencies[ len(latencies) // 2 ],
+             "p99": latencies[ min( int(len(latencies) * 0.99), len(latencies) - 1 ) ],
+             "alloc_bytes": peak }
+
+
+
+def benchmark_cases(main, num_cpus, num_nics):
+    """
+    Returns [(name, function), ...] for one CPU/NIC count.
+    """
+
+    nics = [ "eth" + str(i) for i in range(num_nics) ]
+    r1 = fake_reading(main, num_cpus, nics, 1000.0)
+    r2 = fake_reading(main, num_cpus, nics, 1000.5)
+    measurement = main.Measurement(r1, r2)
+
+    encoder = MeasurementEncoder(num_cpus, nics)
+    vector = encoder.encode(measurement)
+
+    system_info = { "hostname": "benchmark" }
+    logger = MeasurementLogger(num_cpus, nics, ["", 1000.0], system_info, None, None, os.devnull)
+    writer = CNLFileWriter(os.devnull)
+
+    ## Display
+    curses_display.stdscr = VirtualScreen()
+    curses_display.curses = VirtualCurses
+    curses_display.nics = None
+    curses_display.nic_speeds = dict.fromkeys( nics, curses_display.EXISTING_NIC_SPEEDS[0] )
+    curses_display.logging_manager = LoggingManager( num_cpus, nics, system_info, None, None, None, False, None )
+
+    return [ ("measurement", lambda: main.Measurement(r1, r2)),
+             ("cpu_percent", lambda: calculate_cpu_times_percent(r1.cpu_times, r2.cpu_times, percpu=True)),
+             ("encode", lambda: encoder.encode(measurement)),
+             ("logger", lambda: logger.log(measurement)),
+             ("write_vector", lambda: writer.write_vector(vector)),
+             ("display", lambda: curses_display._display(measurement)) ]
+
+
+
+def run_all(cpu_counts, nic_counts, names=None, min_time=0.5, verbose=True):
+    main = _load_main_module()
+    results = list()
+
+    def record(name, num_cpus, num_nics, func):
+        if ( names and name not in names ):
+            return
+
+        result = run(func, min_time)
+        result.update( {"benchmark": name, "cpus": num_cpus, "nics": num_nics} )
+        results.append(result)
+
+        if ( verbose ):
+            print( "{:>13} cpus={:<4} nics={:<5} {:>12.1f} ops/s   median {:>9.1f} us   p99 {:>9.1f} us   alloc {:>9} B".format(
+                        name, num_cpus, num_nics, result["ops_per_s"], result["median"] * 1e6, result["p99"] * 1e6,
+                        result["alloc_bytes"]), file=sys.stderr )
+
+    ## Startup
+    heavy_imports = None
+    startup_time = None
+    if ( not names or "startup" in names ):
+        heavy_imports = startup()
+        record( "startup", 0, 0, startup )
+        startup_time = results[-1]["median"]
+        if ( heavy_imports and verbose ):
+            print( "WARNING: Importing the main program loads: " + ", ".join(heavy_imports), file=sys.stderr )
+
+    ## Live (on this host)
+    host = backends.HostBackend()
+    all_nics = list( psutil.net_io_counters(pernic=True).keys() )
+    record( "nic_speeds", 0, len(all_nics), host.nic_speeds )
+    record( "nic_speeds", 0, 1, lambda: host.nic_speeds(all_nics[:1]) )
+
+    record( "reading", psutil.cpu_count(), len(all_nics), main.Reading )
+
+    for collector in create_collectors( sorted(COLLECTORS), host, all_nics, verbose=verbose ):
+        record( "collect." + collector.name, 0, 0, collector.read )
+        collector.close()
+
+    ## Batched sysfs reads: serial vs. threads (see »SysfsFiles«; "nics" is the number of files here)
+    paths = glob.glob("/sys/class/net/*/statistics/*")
+    if ( paths ):
+        paths = ( paths * (-(-SysfsFiles.PARALLEL_THRESHOLD // len(paths))) )[:SysfsFiles.PARALLEL_THRESHOLD]
+        for name, threshold in ( ("sysfs_serial", len(paths) + 1), ("sysfs_threads", 0) ):
+            SysfsFiles.PARALLEL_THRESHOLD, default = threshold, SysfsFiles.PARALLEL_THRESHOLD
+            files = SysfsFiles(paths)
+            SysfsFiles.PARALLEL_THRESHOLD = default
+
+            record( name, 0, len(paths), files.read )
+            files.close()
+
+    ## Synthetic
+    for num_cpus in cpu_counts:
+        for num_nics in nic_counts:
+            for name, func in benchmark_cases(main, num_cpus, num_nics):
+                record(name, num_cpus, num_nics, func)
+
+    return { "commit": get_commit(),
+             "heavy_imports": heavy_imports,
+             "startup_time": startup_time,
+             "date": time.time(),
+             "python": platform.python_version(),
+             "platform": platform.platform(),
+             "cpu_model": platform.processor(),
+             "results": results }
+
+
+
+def compare(old, new, threshold):
+    """
+    Prints the relative change of ops/s and p99 for all benchmarks in both result sets.
+
+    Returns the number of regressions (ops/s lower by more than |threshold| percent).
+    (The p99 is shown, but not judged: It's too noisy on a shared machine.)
+    """
+
+    def key(r):
+        return (r["benchmark"], r["cpus"], r["nics"])
+
+    old_results = dict( (key(r), r) for r in old["results"] )
+    regressions = 0
+
+    print( "Comparing {} (old) with {} (new):".format(old.get("commit"), new.get("commit")) )
+    for r in new["results"]:
+        o = old_results.get( key(r) )
+        if ( not o ):
+            continue
+
+        ops_change = 100.0 * (r["ops_per_s"] / o["ops_per_s"] - 1)
+        p99_change = 100.0 * (r["p99"] / o["p99"] - 1) if o["p99"] else 0
+        regression = ( ops_change < -threshold )
+        regressions += regression
+
+        print( "{:>13} cpus={:<4} nics={:<5} ops/s {:>+7.1f}%   p99 {:>+7.1f}%{}".format(
+                    r["benchmark"], r["cpus"], r["nics"], ops_change, p99_change, "   <-- REGRESSION" if regression else "") )
+
+    return regressions
+
+
+
+## MAIN ##
+if __name__ == "__main__":
+
+    ## Command line arguments
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmarks of the sampling, measurement, logging and display hot paths.")
+
+    parser.add_argument("--cpus", default="4,16,64,256,512",
+                        help="CPU counts. [Default = 4,16,64,256,512]")
+    parser.add_argument("--nics", default="1,10,100,1000",
+                        help="NIC counts. [Default = 1,10,100,1000]")
+    parser.add_argument("-b", "--benchmarks",
+                        help="Only run these benchmarks (comma separated, see above).")
+    parser.add_argument("-t", "--time", type=float, default=0.5,
+                        help="Minimum time per benchmark (in seconds). [Default = 0.5]")
+    parser.add_argument("-o", "--output",
+                        help="Result file. [Default = benchmark-<commit>.json]")
+    parser.add_argument("--compare", metavar="OLD_RESULTS",
+                        help="Compare with an earlier result file. (Exits with 1 on regressions.)")
+    parser.add_argument("--threshold", type=float, default=10,
+                        help="Change (in percent) that counts as a regression. [Default = 10] (See --compare.)")
+    parser.add_argument("--startup-limit", type=float, default=STARTUP_LIMIT, metavar="SECONDS",
+                        help="Longest (median) startup time that passes. [Default = {}]".format(STARTUP_LIMIT))
+
+    args = parser.parse_args()
+
+    results = run_all( [ int(x) for x in args.cpus.split(",") ],
+                       [ int(x) for x in args.nics.split(",") ],
+                       args.benchmarks.split(",") if args.benchmarks else None,
+                       args.time )
+
+    output = args.output if args.output else "benchmark-{}.json".format( (results["commit"] or "unknown")[:12] )
+    with open(output, "w") as f:
+        json.dump(results, f, indent=1)
+    print( "Results written to: " + output, file=sys.stderr )
+
+    if ( results["heavy_imports"] ):
+        sys.exit(1)
+
+    if ( results["startup_time"] is not None and results["startup_time"] > args.startup_limit ):
+        print( "Startup takes {:.1f} ms (limit: {:.1f} ms).".format(results["startup_time"] * 1000, args.startup_limit * 1000),
+               file=sys.stderr )
+        sys.exit(1)
+
+    if ( args.compare ):
+        with open(args.compare) as f:
+            old = json.load(f)
+
+        if ( compare(old, results, args.threshold) ):
+            sys.exit(1)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Reference collector for »cpunetlog --remote«.
+
+Receives »CNL« streams (see »network_sink.py«) via TCP and UDP and writes each stream into a ».cnl« file.
+'''
+
+import json
+import os
+import selectors
+import socket
+import time
+
+from logging import CNLFileWriter
+from network_sink import decode_frames, TYPE_HEADER, TYPE_DATA, TYPE_END
+
+
+class StreamStats:
+    """ Throughput and latency counters of one stream. """
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+        self.first = time.time()
+        self.last = self.first
+        self.latency_sum = 0
+        self.latency_max = 0
+
+    def update(self, body, now):
+        self.bytes += len(body)
+        self.last = now
+
+        for line in body.splitlines():
+            self.rows += 1
+
+            ## End-to-end latency: from the end of the measurement (2nd column) till reception.
+            try:
+                latency = now - float(line.split(b",", 2)[1])
+            except (IndexError, ValueError):
+                continue
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def __str__(self):
+        duration = max(self.last - self.first, 1e-9)
+        avg = self.latency_sum / self.rows if self.rows else 0
+
+        return "{} rows, {} bytes ({:.1f} rows/s), latency avg {:.3f}s / max {:.3f}s".format(
+                    self.rows, self.bytes, self.rows / duration, avg, self.latency_max)
+
+
+
+class Collector:
+    def __init__(self, path, verbose=False):
+        self.path = path
+        self.verbose = verbose
+
+        ## stream name --> (»CNLFileWriter«, »StreamStats«)
+        self.streams = dict()
+        self.orphaned_rows = 0
+
+        if ( not os.path.exists(path) ):
+            os.makedirs(path)
+
+
+    def _open(self, stream, body):
+        ## The JSON header is pretty-printed (multiple lines). The CSV header is the last line.
+        json_header, _, csv_header = body.decode("utf-8").rstrip("\n").rpartition("\n")
+
+        # Make sure the filename is unique.
+        filename_prefix = os.path.join(self.path, stream.replace("/", "_"))
+        filename = filename_prefix + ".cnl"
+        i = 0
+        while ( os.path.exists(filename) ):
+            filename = filename_prefix + "-" + str(i) + ".cnl"
+            i += 1
+
+        writer = CNLFileWriter(filename)
+        writer.write_header( json.loads(json_header) )
+        writer.write_line(csv_header)
+
+        self.streams[stream] = (writer, StreamStats())
+
+        if ( self.verbose ):
+            print( "[{}] New stream, writing to: {}".format(stream, filename) )
+
+
+    def _close(self, stream):
+        writer, stats = self.streams.pop(stream)
+        writer.close()
+
+        if ( self.verbose ):
+            print( "[{}] Finished: {}".format(stream, stats) )
+
+
+    def process(self, frames):
+        now = time.time()
+
+        for frame_type, stream, body in frames:
+            ## Header (repeated headers of known streams are ignored)
+            if ( frame_type == TYPE_HEADER ):
+                if ( stream not in self.streams ):
+                    self._open(stream, body)
+
+            ## Data
+            elif ( frame_type == TYPE_DATA ):
+                if ( stream in self.streams ):
+                    writer, stats = self.streams[stream]
+                    writer.write_line( body.decode("utf-8").rstrip("\n") )
+                    stats.update(body, now)
+                else:
+                    self.orphaned_rows += body.count(b"\n")
+
+            ## End of stream
+            elif ( frame_type == TYPE_END ):
+                if ( stream in self.streams ):
+                    self._close(stream)
+
+
+    def print_stats(self):
+        for stream, (writer, stats) in sorted(self.streams.items()):
+            print( "[{}] {}".format(stream, stats) )
+
+        if ( self.orphaned_rows ):
+            print( "Orphaned rows (stream header missing): {}".format(self.orphaned_rows) )
+
+
+    def close(self):
+        for stream in list(self.streams.keys()):
+            self._close(stream)
+
+
+
+def serve(collector, address, tcp=True, udp=True, stats_interval=None):
+    sel = selectors.DefaultSelector()
+
+    if ( tcp ):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(address)
+        listener.listen(16)
+        sel.register(listener, selectors.EVENT_READ, "accept")
+
+    if ( udp ):
+        dgram = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        dgram.bind(address)
+        sel.register(dgram, selectors.EVENT_READ, "udp")
+
+    ## TCP receive buffers per connection.
+    buffers = dict()
+    next_stats = time.time() + stats_interval if stats_interval else None
+
+    while True:
+        for key, mask in sel.select(timeout=1):
+            sock = key.fileobj
+
+            if ( key.data == "accept" ):
+                conn, peer = sock.accept()
+                conn.setblocking(False)
+                sel.register(conn, selectors.EVENT_READ, "tcp")
+                buffers[conn] = b""
+
+            elif ( key.data == "udp" ):
+                data = sock.recv(65535)
+                frames, rest = decode_frames(data)
+                collector.process(frames)
+
+            else:
+                data = sock.recv(1024*1024)
+                if ( not data ):
+                    sel.unregister(sock)
+                    sock.close()
+                    del buffers[sock]
+                    continue
+
+                frames, buffers[sock] = decode_frames(buffers[sock] + data)
+                collector.process(frames)
+
+        if ( next_stats and time.time() >= next_stats ):
+            collector.print_stats()
+            next_stats += stats_interval
+
+
+
+## MAIN ##
+if __name__ == "__main__":
+
+    ## Command line arguments
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-l", "--listen", default="127.0.0.1:5105",
+                        help="Address to listen on (TCP and UDP). [Default = 127.0.0.1:5105]")
+    parser.add_argument("--path", default="/tmp/cpunetlog-collector",
+                        help="Path where the received log files are stored in.")
+    parser.add_argument("--no-tcp", action="store_true",
+                        help="Don't accept TCP connections.")
+    parser.add_argument("--no-udp", action="store_true",
+                        help="Don't accept UDP datagrams.")
+    parser.add_argument("-s", "--stats", type=float,
+                        help="Print throughput and latency statistics every STATS seconds.")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Print a message on every new or finished stream.")
+
+    args = parser.parse_args()
+
+    host, _, port = args.listen.rpartition(":")
+    collector = Collector(args.path, args.verbose)
+
+    try:
+        serve(collector, (host, int(port)), not args.no_tcp, not args.no_udp, args.stats)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.print_stats()
+        collector.close()
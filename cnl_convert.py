@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Converts directories of ».cnl« logs into columnar archives (in parallel, one process per file).
+
+Each log becomes a NumPy ».npz« archive (one float64 array per column, plus the JSON header
+as "_header"), and additionally a Parquet file if »pyarrow« is available.
+
+The conversion is resumable: A catalogue (»catalogue.json« in the output directory) records every
+converted log (and every empty one) with the modification time and size of its source, and is saved
+every few seconds. Logs that did not change since are skipped. The catalogue also lists the logs per
+host and day, so that queries only have to open the relevant archives (see »Catalogue.find()«, and
+»cnl_query.py --archives«).
+
+Logs that can't be read (e.g. truncated ones) are reported and skipped.
+
+Memory: Each worker holds one whole log, as float64 columns (8 bytes per value), while writing its archives.
+'''
+
+import json
+import os
+import sys
+import time
+
+from multiprocessing import Pool
+
+from cnl_reader import CNLFileReader, numpy
+from cnl_merge import find_logs
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+CATALOGUE_NAME = "catalogue.json"
+
+## Seconds between saves of the catalogue (while converting)
+SAVE_INTERVAL = 10
+
+
+
+def _days(begin, end):
+    """
+    Returns the (local) days, as "YYYY-MM-DD", covered by [begin, end].
+    """
+
+    ret = list()
+    day = time.localtime(begin)[:3]
+    last = time.localtime(end)[:3]
+
+    while True:
+        ret.append( "{:04d}-{:02d}-{:02d}".format(*day) )
+        if ( day >= last ):
+            return ret
+
+        ## Noon of the next day. (Avoids trouble with DST changes.)
+        day = time.localtime( time.mktime(day + (12, 0, 0, 0, 0, -1)) + 86400 )[:3]
+
+
+
+def _write_npz(path, columns, data, header):
+    tmp_path = path + ".tmp.npz"
+    arrays = dict( (name, data[name]) for name in columns )
+    arrays["_header"] = numpy.array( json.dumps(header) )
+
+    numpy.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _write_parquet(path, columns, data, header):
+    tmp_path = path + ".tmp"
+    table = pyarrow.Table.from_arrays( [ data[name] for name in columns ], names=columns )
+    table = table.replace_schema_metadata( {"cnl_header": json.dumps(header)} )
+
+    pyarrow.parquet.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def convert_file(job):
+    """
+    Converts one log into |archive_base|».npz« (and ».parquet«).
+
+    Returns the catalogue entry (without archives, if the log is empty),
+    or {"Source": ..., "Error": ...} if the log can't be converted. (Runs in a worker process.)
+    """
+
+    source, archive_base, parquet = job
+
+    try:
+        return _convert_file(source, archive_base, parquet)
+    except (ValueError, KeyError, OSError) as e:
+        return { "Source": source, "Error": str(e) }
+
+
+def _convert_file(source, archive_base, parquet):
+    stat = os.stat(source)
+    with CNLFileReader(source) as reader:
+        columns = reader.columns
+        header = reader.header
+        host = header["General"]["SystemInfo"]["hostname"]
+
+        chunks = list( reader.column_chunks(columns) )
+
+    if ( not chunks ):
+        return { "Source": source,
+                 "SourceMtime": stat.st_mtime,
+                 "SourceSize": stat.st_size,
+                 "Archives": [],
+                 "Host": host,
+                 "Begin": None,
+                 "End": None,
+                 "Days": [],
+                 "Rows": 0,
+                 "Columns": columns }
+
+    ## (Column by column, releasing the chunks on the way: at most one column is held twice.)
+    data = dict()
+    for name in columns:
+        data[name] = numpy.concatenate([ chunk.pop(name) for chunk in chunks ])
+
+    os.makedirs( os.path.dirname(archive_base) or ".", exist_ok=True )
+
+    archives = [ archive_base + ".npz" ]
+    _write_npz(archives[0], columns, data, header)
+
+    if ( parquet ):
+        archives.append( archive_base + ".parquet" )
+        _write_parquet(archives[1], columns, data, header)
+
+    begin = float( data["begin"][0] )
+    end = float( data["end"][-1] )
+
+    return { "Source": source,
+             "SourceMtime": stat.st_mtime,
+             "SourceSize": stat.st_size,
+             "Archives": archives,
+             "Host": host,
+             "Begin": begin,
+             "End": end,
+             "Days": _days(begin, end),
+             "Rows": len(data["begin"]),
+             "Columns": columns }
+
+
+
+class Catalogue:
+    """
+    The catalogue of converted logs (stored as JSON). Paths are relative to the catalogue.
+    (Empty logs are listed with "Rows": 0 and without archives, so that they aren't read again.)
+
+    Usage:
+      - Constructor( output directory )
+      - is_up_to_date( source )
+      - get( source )
+      - add( entry )
+      - save()
+      - find( host, time_from, time_to )
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, CATALOGUE_NAME)
+
+        ## { source (relative): entry }
+        self.entries = dict()
+
+        if ( os.path.exists(self.path) ):
+            with open(self.path) as f:
+                self.entries = json.load(f)["Logs"]
+
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.directory)
+
+    def _absolute(self, path):
+        return os.path.normpath( os.path.join(self.directory, path) )
+
+
+    def is_up_to_date(self, source):
+        entry = self.entries.get( self._relative(source) )
+        if ( not entry ):
+            return False
+
+        stat = os.stat(source)
+        return ( entry["SourceMtime"] == stat.st_mtime and entry["SourceSize"] == stat.st_size and
+                 all( os.path.exists(self._absolute(a)) for a in entry["Archives"] ) )
+
+
+    def get(self, source):
+        """
+        Returns the entry (with absolute paths) of |source|, or None if it isn't converted or not up-to-date.
+        """
+
+        if ( not self.is_up_to_date(source) ):
+            return None
+
+        entry = dict( self.entries[ self._relative(source) ] )
+        entry["Source"] = source
+        entry["Archives"] = [ self._absolute(a) for a in entry["Archives"] ]
+
+        return entry
+
+
+    def add(self, entry):
+        entry = dict(entry)
+        entry["Source"] = self._relative(entry["Source"])
+        entry["Archives"] = [ self._relative(a) for a in entry["Archives"] ]
+
+        self.entries[ entry["Source"] ] = entry
+
+
+    def _index(self):
+        ## Index: host -> day -> logs (sources, relative), ordered by time
+        hosts = dict()
+        logs = [ item for item in self.entries.items() if item[1]["Rows"] ]
+        for source, entry in sorted(logs, key=lambda item: item[1]["Begin"]):
+            for day in entry["Days"]:
+                hosts.setdefault(entry["Host"], dict()).setdefault(day, list()).append(source)
+
+        return hosts
+
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump( {"Hosts": self._index(), "Logs": self.entries}, f, indent=1, sort_keys=True )
+        os.replace(tmp_path, self.path)
+
+
+    def find(self, host=None, time_from=None, time_to=None):
+        """
+        Returns the entries (with absolute paths) of |host| that overlap [time_from, time_to], ordered by time.
+
+        (With a time range, only the logs of its days are looked at, see the "Hosts" index.)
+        """
+
+        hosts = self._index()
+        if ( host is not None ):
+            hosts = { host: hosts.get(host, dict()) }
+
+        days = set( _days(time_from, time_to) ) if ( time_from is not None and time_to is not None ) else None
+
+        sources = set()
+        for host_days in hosts.values():
+            for day, logs in host_days.items():
+                if ( days is None or day in days ):
+                    sources.update(logs)
+
+        ret = list()
+        for source in sources:
+            entry = self.entries[source]
+            if ( time_from is not None and entry["End"] < time_from ):
+                continue
+            if ( time_to is not None and entry["Begin"] > time_to ):
+                continue
+
+            entry = dict(entry)
+            entry["Source"] = self._absolute(entry["Source"])
+            entry["Archives"] = [ self._absolute(a) for a in entry["Archives"] ]
+            ret.append(entry)
+
+        return sorted(ret, key=lambda entry: entry["Begin"])
+
+
+
+def convert(paths, output=None, processes=None, parquet=True, verbose=False):
+    """
+    Converts all logs in |paths| that are not up-to-date in the catalogue of |output|.
+
+    Without |output|, the archives are written next to the logs (and the catalogue into the first path).
+
+    Returns (converted, skipped, failed).
+    """
+
+    parquet = parquet and pyarrow is not None
+    in_place = not output
+    output = output if output else ( paths[0] if os.path.isdir(paths[0]) else os.path.dirname(paths[0]) or "." )
+    catalogue = Catalogue(output)
+
+    jobs = list()
+    skipped = 0
+    for source in find_logs(paths):
+        if ( catalogue.is_up_to_date(source) ):
+            skipped += 1
+            continue
+
+        ## Mirror the directory structure below the input path.
+        base = os.path.splitext(source)[0]
+        if ( not in_place ):
+            root = next( (p for p in paths if os.path.isdir(p) and source.startswith(os.path.join(p, ""))), None )
+            relative = os.path.relpath(base, root) if root else os.path.basename(base)
+            base = os.path.join(output, relative)
+
+        jobs.append( (source, base, parquet) )
+
+    converted = 0
+    failed = 0
+    if ( jobs ):
+        last_save = time.time()
+        with Pool(processes) as pool:
+            for entry in pool.imap_unordered(convert_file, jobs):
+                if ( "Error" in entry ):
+                    print( "Skipping '{}': {}".format(entry["Source"], entry["Error"]), file=sys.stderr )
+                    failed += 1
+                    continue
+
+                catalogue.add(entry)
+                converted += 1
+
+                if ( verbose ):
+                    print( "{} -> {}".format(entry["Source"], ", ".join(entry["Archives"]) or "(empty)"), file=sys.stderr )
+
+                ## (Saved in intervals: Rewriting the whole catalogue after each file is quadratic.)
+                if ( time.time() - last_save >= SAVE_INTERVAL ):
+                    catalogue.save()
+                    last_save = time.time()
+
+    catalogue.save()
+
+    return converted, skipped, failed
+
+
+
+## MAIN ##
+if __name__ == "__main__":
+
+    ## Command line arguments
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert CNL logs into columnar archives (.npz, and Parquet if pyarrow is installed).")
+
+    parser.add_argument("paths", nargs="+",
+                        help="CNL files, or directories that are searched for *.cnl files.")
+    parser.add_argument("-o", "--output",
+                        help="Output directory (mirrors the input directories). [Default = next to the logs]")
+    parser.add_argument("-j", "--processes", type=int,
+                        help="Number of parallel processes. [Default = number of CPUs]")
+    parser.add_argument("--no-parquet", action="store_true",
+                        help="Only write .npz archives.")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Print every converted file.")
+
+    args = parser.parse_args()
+
+    if ( not numpy ):
+        sys.exit("cnl-convert requires NumPy.")
+
+    converted, skipped, failed = convert( args.paths, args.output, args.processes, not args.no_parquet, args.verbose )
+
+    print( "Converted {} logs ({} up-to-date, {} failed).".format(converted, skipped, failed), file=sys.stderr )
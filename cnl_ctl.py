@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Controls a running »cpunetlog« (started with --daemon or --control) via its control socket.
+
+Examples:
+  cnl-ctl start
+  cnl-ctl comment "bbr, 10 flows"
+  cnl-ctl environment experiment.json
+  cnl-ctl event "flow 3 started"
+  cnl-ctl add-nics eth1 eth2
+  cnl-ctl interval 0.1
+  cnl-ctl history --seconds 30 --stat max "CPU*.util" "eth0.*"
+  cnl-ctl stop
+'''
+
+import json
+import sys
+
+from control import DEFAULT_SOCKET, send_request
+
+
+
+## MAIN ##
+if __name__ == "__main__":
+
+    ## Command line arguments
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Controls a running cpunetlog (see --daemon).")
+    parser.add_argument("-s", "--socket", default=DEFAULT_SOCKET,
+                        help="Control socket. [Default = {}]".format(DEFAULT_SOCKET))
+
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+
+    commands.add_parser("status", help="Show the logging state and the current settings.")
+    commands.add_parser("start", help="Start logging.")
+    commands.add_parser("stop", help="Stop logging.")
+
+    p = commands.add_parser("comment", help="Set the comment (continues the log in a new segment).")
+    p.add_argument("text")
+
+    p = commands.add_parser("environment", help="Set the environment (continues the log in a new segment).")
+    p.add_argument("file", help="JSON file ('-' for stdin, 'none' to clear it).")
+
+    p = commands.add_parser("path", help="Write subsequent logs into another directory.")
+    p.add_argument("path")
+
+    p = commands.add_parser("interval", help="Set the sampling interval (in seconds).")
+    p.add_argument("interval", type=float)
+
+    p = commands.add_parser("add-nics", help="Also log these NICs (continues the log in a new segment).")
+    p.add_argument("nics", nargs="+")
+
+    p = commands.add_parser("remove-nics", help="Don't log these NICs anymore (continues the log in a new segment).")
+    p.add_argument("nics", nargs="+")
+
+    p = commands.add_parser("event", help="Mark an event in the current log.")
+    p.add_argument("text")
+
+    p = commands.add_parser("history", help="Aggregate the recent measurements (see --history).")
+    p.add_argument("columns", nargs="*", help="Column names or glob patterns, e.g. 'CPU*.util'. [Default = all]")
+    p.add_argument("--seconds", type=float, default=60, help="Length of the window. [Default = 60]")
+    p.add_argument("--stat", choices=("mean", "min", "max", "percentile"), default="mean", help="[Default = mean]")
+    p.add_argument("-q", type=float, default=95, help="Percentile (0-100). [Default = 95] (See --stat.)")
+
+    args = parser.parse_args()
+
+
+    ## Request arguments
+    request_args = dict( (key, value) for key, value in vars(args).items() if key not in ("socket", "command") )
+
+    if ( args.command == "environment" ):
+        if ( args.file == "none" ):
+            environment = None
+        elif ( args.file == "-" ):
+            environment = json.load(sys.stdin)
+        else:
+            with open(args.file) as f:
+                environment = json.load(f)
+
+        request_args = { "environment": environment }
+
+    elif ( args.command == "history" ):
+        request_args["columns"] = args.columns or None
+
+    try:
+        reply = send_request( args.socket, args.command.replace("-", "_"), **request_args )
+    except OSError as e:
+        sys.exit( "Can't reach cpunetlog at {}: {}".format(args.socket, e) )
+
+    if ( not reply["ok"] ):
+        sys.exit( "Error: " + reply["error"] )
+
+    if ( "result" in reply ):
+        for column, value in reply["result"].items():
+            print( "{}: {}".format(column, value) )
+        sys.exit()
+
+    status = reply["status"]
+    print( "State:    " + status["state"] )
+    print( "File:     " + (", ".join(status["files"]) if status.get("files") else str(status["file"])) )
+    print( "Comment:  " + str(status["comment"]) )
+    print( "Path:     " + str(status["path"]) )
+    print( "Interval: " + str(status["interval"]) )
+    print( "NICs:     " + ", ".join(status["nics"]) )
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Merges ».cnl« logs of multiple hosts into a single wide dataset on a common time grid.
+
+Each host (see "General.SystemInfo.hostname") may contribute several logs (e.g. from auto-logging),
+which are concatenated in time order. The measurements are resampled onto the grid using their
+"begin"/"end" columns: Each grid cell holds the time-weighted mean of all measurements overlapping it
+(NaN, if there are none).
+
+The hosts are resampled in parallel (one process per host) into temporary binary files,
+which are then merged in a single streaming pass. Memory usage is independent of the log lengths.
+'''
+
+import array
+import math
+import os
+import shutil
+import sys
+import tempfile
+
+from multiprocessing import Pool
+
+from cnl_reader import CNLFileReader
+
+
+## Columns that are replaced by the grid time.
+TIME_COLUMNS = ("begin", "end", "duration")
+
+
+
+def find_logs(paths):
+    """
+    Returns all ».cnl« files in |paths| (files or directories, recursively).
+    """
+
+    ret = list()
+
+    for path in paths:
+        if ( os.path.isdir(path) ):
+            for dirpath, dirnames, filenames in os.walk(path):
+                ret.extend( os.path.join(dirpath, f) for f in sorted(filenames) if f.endswith(".cnl") )
+        else:
+            ret.append(path)
+
+    return ret
+
+
+def group_by_host(filenames):
+    """
+    Returns {hostname: [(begin, end, filename), ...]} (sorted by time), and the overall time range.
+    """
+
+    hosts = dict()
+    begin = None
+    end = None
+
+    for filename in filenames:
+        try:
+            with CNLFileReader(filename) as reader:
+                time_range = reader.get_time_range()
+                hostname = reader.hostname
+        except (ValueError, KeyError, OSError) as e:
+            print( "Skipping '{}': {}".format(filename, e), file=sys.stderr )
+            continue
+
+        if ( not time_range ):
+            continue
+
+        hosts.setdefault(hostname, list()).append( (time_range[0], time_range[1], filename) )
+        begin = time_range[0] if begin is None else min(begin, time_range[0])
+        end = time_range[1] if end is None else max(end, time_range[1])
+
+    for logs in hosts.values():
+        logs.sort()
+
+    return hosts, begin, end
+
+
+
+def resample(rows, begin_col, end_col, value_cols, t0, step, num_cells):
+    """
+    Generator that yields one list of values per grid cell (time-weighted means, NaN if empty).
+
+    |rows| must be ordered by time.
+    """
+
+    num_values = len(value_cols)
+    nan_row = [ float("nan") ] * num_values
+
+    cell = 0
+    acc = [0.0] * num_values
+    weight = 0.0
+
+    for row in rows:
+        b = max(row[begin_col], t0)
+        e = min(row[end_col], t0 + num_cells * step)
+        if ( e <= b ):
+            continue
+
+        values = [ row[i] for i in value_cols ]
+
+        ## (Overlapping rows are added to the current cell.)
+        idx = max( int((b - t0) // step), cell )
+        while ( b < e and idx < num_cells ):
+            ## Emit all cells before |idx|.
+            while ( cell < idx ):
+                yield [ a / weight for a in acc ] if weight > 0 else nan_row
+                cell += 1
+                acc = [0.0] * num_values
+                weight = 0.0
+
+            ## Add the overlapping part of this measurement.
+            seg_end = min( e, t0 + (idx+1) * step )
+            w = seg_end - b
+            if ( w > 0 ):
+                acc = [ a + v * w for a, v in zip(acc, values) ]
+                weight += w
+
+            b = seg_end
+            idx += 1
+
+    ## Remaining cells.
+    while ( cell < num_cells ):
+        yield [ a / weight for a in acc ] if weight > 0 else nan_row
+        cell += 1
+        acc = [0.0] * num_values
+        weight = 0.0
+
+
+
+def _log_rows(logs, columns):
+    """
+    Concatenates the rows of all |logs|, mapped onto |columns| (missing ones are NaN).
+    """
+
+    for begin, end, filename in logs:
+        with CNLFileReader(filename) as reader:
+            mapping = [ reader.index.get(name) for name in columns ]
+
+            if ( mapping == list(range(len(columns))) ):
+                yield from reader.rows()
+            else:
+                for row in reader.rows():
+                    yield [ row[i] if i is not None else float("nan") for i in mapping ]
+
+
+def resample_host(job):
+    """
+    Resamples all logs of one host into a temporary file (float64, one row per grid cell).
+
+    Returns (hostname, value column names, temporary filename).
+    """
+
+    hostname, logs, t0, step, num_cells, tmpdir = job
+
+    ## The columns of the first log are used for all logs of this host.
+    with CNLFileReader(logs[0][2]) as reader:
+        columns = reader.columns
+
+    value_cols = [ i for i, name in enumerate(columns) if name not in TIME_COLUMNS ]
+    rows = _log_rows(logs, columns)
+
+    fd, tmp_filename = tempfile.mkstemp(prefix=hostname + "-", suffix=".bin", dir=tmpdir)
+    with os.fdopen(fd, "wb") as f:
+        for values in resample(rows, columns.index("begin"), columns.index("end"), value_cols, t0, step, num_cells):
+            array.array("d", values).tofile(f)
+
+    return hostname, [ columns[i] for i in value_cols ], tmp_filename
+
+
+
+def merge(filenames, output, step=1.0, time_from=None, time_to=None, processes=None, tmpdir=None):
+    hosts, begin, end = group_by_host(filenames)
+
+    if ( not hosts ):
+        raise ValueError("No (non-empty) logs found.")
+
+    ## Common time grid.
+    begin = time_from if time_from is not None else begin
+    end = time_to if time_to is not None else end
+    t0 = math.floor(begin / step) * step
+    num_cells = max( int(math.ceil((end - t0) / step)), 0 )
+
+    tmpdir = tempfile.mkdtemp(prefix="cnl-merge-", dir=tmpdir)
+    try:
+        ## Resample all hosts in parallel.
+        jobs = [ (hostname, logs, t0, step, num_cells, tmpdir) for hostname, logs in sorted(hosts.items()) ]
+        with Pool(processes) as pool:
+            results = pool.map(resample_host, jobs, chunksize=1)
+
+        ## Merge (streaming, one grid cell at a time).
+        header = [ "time" ]
+        inputs = list()
+        for hostname, columns, tmp_filename in results:
+            header.extend( hostname + ":" + name for name in columns )
+            inputs.append( (open(tmp_filename, "rb"), len(columns)) )
+
+        out = open(output, "w") if output != "-" else sys.stdout
+        try:
+            out.write( ", ".join(header) + "\n" )
+
+            for cell in range(num_cells):
+                line = array.array("d", [t0 + cell * step])
+                for f, num_values in inputs:
+                    line.fromfile(f, num_values)
+
+                out.write( ", ".join( map(str, line) ) + "\n" )
+        finally:
+            for f, num_values in inputs:
+                f.close()
+            if ( out is not sys.stdout ):
+                out.close()
+
+    finally:
+        shutil.rmtree(tmpdir)
+
+    return len(hosts), num_cells
+
+
+
+## MAIN ##
+if __name__ == "__main__":
+
+    ## Command line arguments
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Merge CNL logs of multiple hosts onto a common time grid.")
+
+    parser.add_argument("paths", nargs="+",
+                        help="CNL files, or directories that are searched for *.cnl files.")
+    parser.add_argument("-o", "--output", default="-",
+                        help="Output CSV file. [Default = stdout]")
+    parser.add_argument("-s", "--step", type=float, default=1.0,
+                        help="Grid resolution (in seconds). [Default = 1]")
+    parser.add_argument("--from", dest="time_from", type=float,
+                        help="Begin of the grid (Unix time). [Default = earliest measurement]")
+    parser.add_argument("--to", dest="time_to", type=float,
+                        help="End of the grid (Unix time). [Default = latest measurement]")
+    parser.add_argument("-j", "--processes", type=int,
+                        help="Number of parallel processes. [Default = number of CPUs]")
+    parser.add_argument("--tmpdir",
+                        help="Directory for the temporary (resampled) data.")
+
+    args = parser.parse_args()
+
+    num_hosts, num_cells = merge( find_logs(args.paths), args.output, args.step,
+                                  args.time_from, args.time_to, args.processes, args.tmpdir )
+
+    print( "Merged {} hosts into {} samples.".format(num_hosts, num_cells), file=sys.stderr )
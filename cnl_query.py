@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Queries a directory of ».cnl« logs by host, time range and columns.
+
+The headers of all logs (host, time range, columns, class definitions) are kept in an index file
+(».cnl-index.json« in the log directory), keyed by the modification time and size of each log.
+Only new or changed logs are opened to update it, so a query usually just reads the index and then
+the matching time ranges (see »CNLFileReader.find_time«) and columns of the relevant logs.
+
+Logs that are converted by »cnl_convert.py« (and unchanged since) are taken from its catalogue instead,
+and read from their ».npz« archives. (This index is kept separately, since it covers all logs, converted
+or not.) Without a log directory, only the archives are queried: The catalogue's index by host and day
+selects the relevant ones (see »Catalogue.find()«).
+
+The result is streamed as CSV, or written as a NumPy ».npy« file.
+'''
+
+import json
+import os
+import struct
+import sys
+import time
+
+from cnl_reader import CNLFileReader, numpy
+from cnl_merge import find_logs
+from cnl_convert import Catalogue
+
+
+INDEX_NAME = ".cnl-index.json"
+
+
+
+def parse_timestamp(text):
+    """
+    Parses a Unix timestamp, or a local date/time "YYYY-MM-DD[ HH:MM[:SS]]" (also with "T").
+    """
+
+    try:
+        return float(text)
+    except ValueError:
+        pass
+
+    text = text.replace("T", " ")
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return time.mktime( time.strptime(text, fmt) )
+        except ValueError:
+            pass
+
+    raise ValueError("Invalid time: " + text)
+
+
+
+class LogIndex:
+    """
+    Cached index over the headers of all logs in a directory.
+
+    Usage:
+      - Constructor( path )
+      - update( catalogue )
+      - find( host, time_from, time_to )
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = os.path.join(path, INDEX_NAME)
+
+        ## { filename (relative): entry }
+        self.entries = dict()
+
+        try:
+            with open(self.index_path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+
+    def update(self, catalogue=None):
+        """
+        Re-reads the headers of new and changed logs, and drops the removed ones.
+
+        Logs with an up-to-date ».npz« archive in the »Catalogue« of »cnl_convert.py« are taken from there,
+        and get its path as "Archive".
+
+        Returns the number of logs that had to be opened.
+        """
+
+        entries = dict()
+        opened = 0
+
+        for filename in find_logs([self.path]):
+            name = os.path.relpath(filename, self.path)
+            stat = os.stat(filename)
+
+            converted = catalogue.get(filename) if catalogue else None
+            archive = next( (a for a in converted["Archives"] if a.endswith(".npz")), None ) if converted else None
+
+            entry = self.entries.get(name)
+            if ( entry and entry["Mtime"] == stat.st_mtime and entry["Size"] == stat.st_size and
+                 entry.get("Archive") == archive ):
+                entries[name] = entry
+                continue
+
+            try:
+                if ( archive ):
+                    ## (Only the header is read; the columns are loaded on demand.)
+                    with numpy.load(archive) as npz:
+                        class_definitions = json.loads( str(npz["_header"]) )["ClassDefinitions"]
+
+                    entry = { "Mtime": stat.st_mtime,
+                              "Size": stat.st_size,
+                              "Host": converted["Host"],
+                              "Begin": converted["Begin"],
+                              "End": converted["End"],
+                              "Columns": converted["Columns"],
+                              "ClassDefinitions": class_definitions,
+                              "Archive": archive }
+                else:
+                    with CNLFileReader(filename) as reader:
+                        time_range = reader.get_time_range()
+                        entry = { "Mtime": stat.st_mtime,
+                                  "Size": stat.st_size,
+                                  "Host": reader.hostname,
+                                  "Begin": time_range[0] if time_range else None,
+                                  "End": time_range[1] if time_range else None,
+                                  "Columns": reader.columns,
+                                  "ClassDefinitions": reader.class_definitions }
+            except (ValueError, KeyError, OSError) as e:
+                print( "Skipping '{}': {}".format(filename, e), file=sys.stderr )
+                continue
+
+            entries[name] = entry
+            opened += 1
+
+        changed = ( entries != self.entries )
+        self.entries = entries
+
+        if ( changed ):
+            self.save()
+
+        return opened
+
+
+    def save(self):
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            ## (e.g. a read-only log directory; the index is just a cache.)
+            print( "Could not save the index: {}".format(e), file=sys.stderr )
+
+
+    def get_hosts(self):
+        return sorted( set( entry["Host"] for entry in self.entries.values() ) )
+
+
+    def find(self, host=None, time_from=None, time_to=None):
+        """
+        Returns [(filename, entry), ...] of the (non-empty) logs of |host| overlapping [time_from, time_to],
+        ordered by host and time.
+        """
+
+        ret = list()
+        for name, entry in self.entries.items():
+            if ( entry["Begin"] is None ):
+                continue
+            if ( host is not None and entry["Host"] != host ):
+                continue
+            if ( time_from is not None and entry["End"] < time_from ):
+                continue
+            if ( time_to is not None and entry["Begin"] > time_to ):
+                continue
+
+            ret.append( (os.path.join(self.path, name), entry) )
+
+        return sorted( ret, key=lambda item: (item[1]["Host"], item[1]["Begin"]) )
+
+
+
+def archive_chunks(archive, columns, chunk_size=100000, time_from=None, time_to=None):
+    """
+    Like »CNLFileReader.column_chunks«, but reads a ».npz« archive of »cnl_convert.py«.
+    (Only the given |columns| are loaded, each as a whole.)
+    """
+
+    with numpy.load(archive) as npz:
+        first = numpy.searchsorted(npz["end"], time_from) if time_from is not None else 0
+        last = numpy.searchsorted(npz["begin"], time_to, "right") if time_to is not None else None
+
+        data = dict( (name, npz[name][first:last]) for name in columns )
+
+    rows = len( data[columns[0]] )
+    for pos in range(0, rows, chunk_size):
+        yield dict( (name, values[pos:pos+chunk_size]) for name, values in data.items() )
+
+
+def query(logs, columns, time_from=None, time_to=None, chunk_size=100000):
+    """
+    Generator over (host, 2D array) chunks with the values of |columns| (NaN, if a log doesn't have a column).
+    """
+
+    for filename, entry in logs:
+        available = [ c for c in columns if c in entry["Columns"] ]
+
+        if ( "Archive" in entry ):
+            chunks = archive_chunks(entry["Archive"], available, chunk_size, time_from, time_to)
+        else:
+            chunks = _log_chunks(filename, available, chunk_size, time_from, time_to)
+
+        for chunk in chunks:
+            rows = len( chunk[available[0]] )
+            data = numpy.column_stack( [ chunk[c] if c in chunk else numpy.full(rows, numpy.nan) for c in columns ] )
+
+            if ( len(data) ):
+                yield entry["Host"], data
+
+
+def find_archives(catalogue, host=None, time_from=None, time_to=None):
+    """
+    Returns [(filename, entry), ...] (like »LogIndex.find()«) of the archived logs in the »Catalogue« of
+    »cnl_convert.py«, read from their ».npz« archives.
+    """
+
+    ret = list()
+    for entry in catalogue.find(host, time_from, time_to):
+        archive = next( (a for a in entry["Archives"] if a.endswith(".npz")), None )
+        if ( archive ):
+            entry["Archive"] = archive
+            ret.append( (entry["Source"], entry) )
+
+    return sorted( ret, key=lambda item: (item[1]["Host"], item[1]["Begin"]) )
+
+
+def _log_chunks(filename, columns, chunk_size, time_from, time_to):
+    with CNLFileReader(filename) as reader:
+        for chunk in reader.column_chunks(columns, chunk_size, time_from, time_to):
+            yield chunk
+
+
+
+def write_csv(chunks, columns, out, with_host):
+    out.write( ", ".join( (["host"] if with_host else []) + columns ) + "\n" )
+
+    for host, data in chunks:
+        prefix = host + ", " if with_host else ""
+        for row in data.tolist():
+            out.write( prefix + ", ".join( map(repr, row) ) + "\n" )
+
+
+def _npy_header(rows, num_columns):
+    """
+    Header of a (format version 1.0) ».npy« file, padded to a fixed size so that it can be rewritten in place.
+    """
+
+    HEADER_SIZE = 128
+
+    text = "{{'descr': '<f8', 'fortran_order': False, 'shape': ({}, {}), }}".format(rows, num_columns)
+    text = text.ljust(HEADER_SIZE - 10 - 1) + "\n"
+
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(text)) + text.encode("latin1")
+
+
+def write_npy(chunks, columns, filename):
+    """
+    Streams the chunks into a ».npy« file. (The number of rows is filled in at the end.)
+    """
+
+    rows = 0
+    with open(filename, "wb") as f:
+        f.write( _npy_header(0, len(columns)) )
+
+        for host, data in chunks:
+            f.write( data.astype("<f8").tobytes() )
+            rows += len(data)
+
+        f.seek(0)
+        f.write( _npy_header(rows, len(columns)) )
+
+    return rows
+
+
+
+## MAIN ##
+if __name__ == "__main__":
+
+    ## Command line arguments
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query a directory of CNL logs.")
+
+    parser.add_argument("--path",
+                        help="Log directory (searched recursively). [Default = only the archives of --archives]")
+    parser.add_argument("--host",
+                        help="Only logs of this host.")
+    parser.add_argument("--from", dest="time_from",
+                        help="Begin of the time range: Unix time or 'YYYY-MM-DD[ HH:MM[:SS]]'.")
+    parser.add_argument("--to", dest="time_to",
+                        help="End of the time range. (Same formats as --from.)")
+    parser.add_argument("-c", "--columns",
+                        help="Comma separated list of columns, e.g. 'eth0.send,CPU3.util'. ('begin' and 'end' are always included.)")
+    parser.add_argument("-f", "--format", choices=("csv", "npy"), default="csv",
+                        help="Output format. [Default = csv]")
+    parser.add_argument("-o", "--output", default="-",
+                        help="Output file. [Default = stdout; required for npy]")
+    parser.add_argument("--archives",
+                        help="Output directory of cnl-convert (with its catalogue): Converted logs are read from their .npz archives. [Default = --path]")
+    parser.add_argument("--list", action="store_true",
+                        help="Only list the matching logs.")
+    parser.add_argument("--chunk-size", type=int, default=100000,
+                        help="Rows per chunk. [Default = 100000]")
+
+    args = parser.parse_args()
+
+    if ( not args.path and not args.archives ):
+        parser.error("--path or --archives is required.")
+
+    if ( not numpy ):
+        sys.exit("cnl-query requires NumPy.")
+
+    time_from = parse_timestamp(args.time_from) if args.time_from else None
+    time_to = parse_timestamp(args.time_to) if args.time_to else None
+
+    catalogue = Catalogue(args.archives if args.archives else args.path)
+    if ( args.path ):
+        index = LogIndex(args.path)
+        index.update(catalogue)
+        logs = index.find(args.host, time_from, time_to)
+    else:
+        logs = find_archives(catalogue, args.host, time_from, time_to)
+
+    if ( args.list ):
+        for filename, entry in logs:
+            print( "{}  {}  {} - {}{}".format( filename, entry["Host"],
+                        time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["Begin"])),
+                        time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["End"])),
+                        "  (" + entry["Archive"] + ")" if "Archive" in entry else "" ) )
+        sys.exit(0)
+
+    ## Columns (default: all columns of the first log)
+    if ( args.columns ):
+        columns = ["begin", "end"] + [ c.strip() for c in args.columns.split(",") if c.strip() not in ("begin", "end") ]
+    else:
+        columns = logs[0][1]["Columns"] if logs else ["begin", "end"]
+
+    unknown = [ c for c in columns if not any( c in entry["Columns"] for filename, entry in logs ) ]
+    if ( logs and unknown ):
+        sys.exit( "Unknown columns: " + ", ".join(unknown) )
+
+    hosts = set( entry["Host"] for filename, entry in logs )
+    chunks = query(logs, columns, time_from, time_to, args.chunk_size)
+
+    if ( args.format == "npy" ):
+        if ( args.output == "-" ):
+            sys.exit("The npy format needs an output file (-o).")
+        if ( len(hosts) > 1 ):
+            sys.exit("The npy format holds a single host; please select one with --host.")
+
+        rows = write_npy(chunks, columns, args.output)
+        print( "Wrote {} rows.".format(rows), file=sys.stderr )
+
+    else:
+        out = open(args.output, "w") if args.output != "-" else sys.stdout
+        try:
+            write_csv(chunks, columns, out, len(hosts) > 1)
+        finally:
+            if ( out is not sys.stdout ):
+                out.close()
@@ -0,0 +1,283 @@
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Streaming reader for files in the »CNL« format (as written by the »CNLFileWriter«).
+
+Only the header is parsed on opening. The body is read lazily, row by row (or chunk by chunk),
+so even huge logs can be processed in bounded memory.
+'''
+
+import json
+import os
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class CNLFileReader:
+    """
+    Reads a ».cnl« file.
+
+    Usage:
+      - Constructor( filename )
+      - header, columns, hostname, ...
+      - Loop:
+          - rows()  /  chunks( size )
+      - close()
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, "rb")
+
+        self.header = None
+        self.columns = None
+
+        self._read_header()
+
+        self.class_names = self.header["General"]["Classes"]
+        self.class_definitions = self.header["ClassDefinitions"]
+        self.hostname = self.header["General"]["SystemInfo"]["hostname"]
+        self.index = dict( (name, i) for i, name in enumerate(self.columns) )
+
+        ## Byte offset of the first data row.
+        self.body_offset = self.file.tell()
+
+
+    def _read_header(self):
+        line = self.file.readline()
+        if ( not line.startswith(b"%% CPUnetLOG") ):
+            raise ValueError("Not a CNL file: " + self.filename)
+
+        ## JSON header
+        json_lines = list()
+        in_header = False
+        for line in iter(self.file.readline, b""):
+            if ( line.startswith(b"%% Begin_Header") ):
+                in_header = True
+            elif ( line.startswith(b"%% End_Header") ):
+                in_header = False
+            elif ( line.startswith(b"%% Begin_Body") ):
+                break
+            elif ( in_header ):
+                json_lines.append(line)
+
+        self.header = json.loads( b"".join(json_lines).decode("utf-8") )
+
+        ## CSV header
+        self.columns = [ name.strip() for name in self.file.readline().decode("utf-8").split(",") ]
+
+
+    @staticmethod
+    def _parse(line):
+        """
+        Returns the values of a data line, or None if it's not a (complete) data line.
+        """
+
+        if ( line.startswith(b"%%") or not line.endswith(b"\n") ):
+            return None
+
+        try:
+            return [ float(x) for x in line.split(b",") ]
+        except ValueError:
+            return None
+
+
+    def rows(self, offset=None):
+        """
+        Generator over all data rows (lists of floats), from the beginning of the body.
+
+        With |offset| (see |find_time()|), reading starts at that position instead.
+        """
+
+        self.file.seek(offset if offset is not None else self.body_offset)
+
+        for line in self.file:
+            values = self._parse(line)
+            if ( values ):
+                yield values
+
+
+    def chunks(self, size=10000):
+        """
+        Generator over lists of (at most |size|) data rows.
+        """
+
+        chunk = list()
+
+        for values in self.rows():
+            chunk.append(values)
+
+            if ( len(chunk) >= size ):
+                yield chunk
+                chunk = list()
+
+        if ( chunk ):
+            yield chunk
+
+
+    def column_chunks(self, columns, chunk_size=100000, time_from=None, time_to=None):
+        """
+        Generator over dicts { column name: NumPy array } with (at most) |chunk_size| rows each.
+
+        Only the given |columns| are converted. With |time_from| and |time_to|, only rows
+        overlapping that time range are returned (the start is found by |find_time()|).
+
+        (Requires NumPy.)
+        """
+
+        if ( not numpy ):
+            raise ImportError("NumPy is required for columnar access to CNL files.")
+
+        usecols = [ self.index[name] for name in columns ]
+        begin_col = self.index["begin"]
+
+        self.file.seek( self.find_time(time_from) if time_from is not None else self.body_offset )
+
+        done = False
+        while ( not done ):
+            lines = self.file.readlines( chunk_size * len(self.columns) * 12 )   # (size hint: ~12 bytes per value)
+            if ( not lines ):
+                break
+
+            ## Only complete data lines. (The last one might still be written.)
+            lines = [ line for line in lines if not line.startswith(b"%%") and line.endswith(b"\n") ]
+            if ( not lines ):
+                continue
+
+            data = numpy.loadtxt(lines, delimiter=",", usecols=usecols + [begin_col], ndmin=2)
+
+            if ( time_to is not None ):
+                inside = data[:, -1] <= time_to
+                if ( not inside.all() ):
+                    data = data[inside]
+                    done = True
+
+            for pos in range(0, len(data), chunk_size):
+                part = data[pos:pos+chunk_size]
+                yield dict( (name, part[:, i]) for i, name in enumerate(columns) )
+
+
+    def parse_time(self, text):
+        """
+        Parses a point in time of this log: A Unix timestamp, an offset "+SECONDS" from the beginning,
+        or a time of day "HH:MM[:SS]" (on the day the log begins).
+        """
+
+        time_range = self.get_time_range()
+        if ( not time_range ):
+            raise ValueError("Empty log: " + self.filename)
+
+        first = time_range[0]
+
+        try:
+            if ( text.startswith("+") ):
+                return first + float(text[1:])
+
+            if ( ":" in text ):
+                parts = [ int(x) for x in text.split(":") ]
+                if ( len(parts) > 3 ):
+                    raise ValueError
+                parts += [0] * (3 - len(parts))
+                day = time.localtime(first)
+                return time.mktime( day[:3] + tuple(parts) + day[6:] )
+
+            return float(text)
+        except ValueError:
+            raise ValueError("Invalid time (expected a timestamp, +SECONDS or HH:MM[:SS]): " + text)
+
+
+    def find_time(self, timestamp):
+        """
+        Returns the byte offset of the first row that ends at or after |timestamp|. (Binary search over the file.)
+        """
+
+        end_col = self.index["end"]
+        lo = self.body_offset
+        hi = os.path.getsize(self.filename)
+
+        ## Narrow down to a row that ends before |timestamp|.
+        while ( hi - lo > 65536 ):
+            mid = (lo + hi) // 2
+            self.file.seek(mid)
+            self.file.readline()    # (probably) a partial line
+
+            pos = self.file.tell()
+            row = self._parse( self.file.readline() )
+            if ( row and row[end_col] < timestamp ):
+                lo = pos
+            else:
+                hi = mid
+
+        ## Linear scan from there.
+        self.file.seek(lo)
+        pos = lo
+        for line in iter(self.file.readline, b""):
+            row = self._parse(line)
+            if ( row and row[end_col] >= timestamp ):
+                break
+            pos += len(line)
+
+        return pos
+
+
+    def get_time_range(self):
+        """
+        Returns (begin of the first row, end of the last row), or None if the body is empty.
+
+        Only reads the beginning and the end of the file.
+        """
+
+        begin_col = self.index["begin"]
+        end_col = self.index["end"]
+
+        ## First row.
+        self.file.seek(self.body_offset)
+        first = None
+        for line in self.file:
+            first = self._parse(line)
+            if ( first ):
+                break
+        if ( not first ):
+            return None
+
+        ## Last row: Scan backwards through the tail of the file.
+        size = os.path.getsize(self.filename)
+        tail_size = 4096
+        while True:
+            offset = max(size - tail_size, self.body_offset)
+            self.file.seek(offset)
+            lines = self.file.read().splitlines(True)
+
+            ## (The first line might be cut.)
+            for line in reversed( lines if offset == self.body_offset else lines[1:] ):
+                last = self._parse(line)
+                if ( last ):
+                    return first[begin_col], last[end_col]
+
+            if ( offset == self.body_offset ):
+                return first[begin_col], first[end_col]
+            tail_size *= 4
+
+
+    def close(self):
+        self.file.close()
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Offline statistics over ».cnl« logs:
+
+  - NIC throughput percentiles (send/receive), and the peak rolling mean over a time window
+  - CPU utilization histograms, the share of time above a threshold, and the peak rolling mean
+  - Correlation between the softirq load of each CPU and the receive rate of each NIC
+
+All statistics are weighted by the duration of the measurements. The logs are evaluated chunk by
+chunk with NumPy (see »CNLFileReader.column_chunks«), so memory usage does not depend on their size.
+Percentiles are computed from fine-grained logarithmic histograms (relative error below 2.5%).
+'''
+
+import json
+import math
+import sys
+
+from cnl_reader import CNLFileReader, numpy
+
+
+
+class Histogram:
+    """
+    Weighted histograms of several series at once. (Bins given by their upper |edges|.)
+    """
+
+    def __init__(self, num_series, edges):
+        self.edges = edges
+        self.num_bins = len(edges) + 1    # (plus one overflow bin)
+        self.counts = numpy.zeros( (num_series, self.num_bins) )
+
+    def update(self, values, weights):
+        """ |values|: rows x series;  |weights|: rows """
+
+        bins = numpy.searchsorted(self.edges, values, side="left")
+        flat = (bins + numpy.arange(values.shape[1]) * self.num_bins).ravel()
+        weights = numpy.repeat(weights, values.shape[1])
+
+        self.counts += numpy.bincount(flat, weights, self.counts.size).reshape(self.counts.shape)
+
+    def percentiles(self, percentiles):
+        """ Returns series x percentiles (lower bin edges, thus 0 for the first bin). """
+
+        cumulative = numpy.cumsum(self.counts, axis=1)
+        total = cumulative[:, -1:]
+        lower_edges = numpy.concatenate( ([0], self.edges) )
+
+        ret = numpy.empty( (self.counts.shape[0], len(percentiles)) )
+        for j, p in enumerate(percentiles):
+            idx = (cumulative < total * p / 100.0).sum(axis=1)
+            ret[:, j] = lower_edges[ numpy.minimum(idx, self.num_bins - 1) ]
+
+        return ret
+
+    def fractions(self):
+        total = self.counts.sum(axis=1, keepdims=True)
+        return self.counts / numpy.where(total > 0, total, 1)
+
+
+
+class RollingMean:
+    """
+    Tracks the maximum of the (duration-weighted) rolling mean over |window| seconds, across chunks.
+    """
+
+    def __init__(self, num_series, window):
+        self.window = window
+        self.maximum = numpy.full(num_series, -numpy.inf)
+
+        ## Rows of the previous chunk, that still fall into the window.
+        self.carry_end = numpy.empty(0)
+        self.carry_duration = numpy.empty(0)
+        self.carry_values = numpy.empty( (0, num_series) )
+
+    def update(self, end, duration, values):
+        end = numpy.concatenate( (self.carry_end, end) )
+        duration = numpy.concatenate( (self.carry_duration, duration) )
+        values = numpy.concatenate( (self.carry_values, values) )
+        first_new = len(self.carry_end)
+
+        cum_weighted = numpy.vstack( (numpy.zeros(values.shape[1]), numpy.cumsum(values * duration[:, None], axis=0)) )
+        cum_duration = numpy.concatenate( ([0], numpy.cumsum(duration)) )
+
+        ## Window of row i: all rows that end within (end[i] - window, end[i]].
+        rows = numpy.arange(first_new, len(end))
+        start = numpy.searchsorted(end, end[rows] - self.window, side="right")
+
+        ## Only full windows count.
+        full = end[rows] - end[start] + duration[start] >= self.window
+        rows = rows[full]
+        start = start[full]
+
+        if ( len(rows) ):
+            span = (cum_duration[rows+1] - cum_duration[start])[:, None]
+            means = (cum_weighted[rows+1] - cum_weighted[start]) / span
+            self.maximum = numpy.maximum(self.maximum, means.max(axis=0))
+
+        keep = end > end[-1] - self.window
+        self.carry_end = end[keep]
+        self.carry_duration = duration[keep]
+        self.carry_values = values[keep]
+
+    def result(self):
+        return numpy.where( numpy.isfinite(self.maximum), self.maximum, numpy.nan )
+
+
+
+class Correlation:
+    """
+    Weighted Pearson correlation between every series of |x| and every series of |y|, accumulated across chunks.
+    """
+
+    def __init__(self, num_x, num_y):
+        self.w = 0.0
+        self.sx = numpy.zeros(num_x)
+        self.sy = numpy.zeros(num_y)
+        self.sxx = numpy.zeros(num_x)
+        self.syy = numpy.zeros(num_y)
+        self.sxy = numpy.zeros( (num_x, num_y) )
+
+    def update(self, x, y, weights):
+        wx = x * weights[:, None]
+
+        self.w += weights.sum()
+        self.sx += wx.sum(axis=0)
+        self.sy += (y * weights[:, None]).sum(axis=0)
+        self.sxx += (wx * x).sum(axis=0)
+        self.syy += (y * y * weights[:, None]).sum(axis=0)
+        self.sxy += wx.T.dot(y)
+
+    def result(self):
+        if ( self.w == 0 ):
+            return numpy.full( self.sxy.shape, numpy.nan )
+
+        mx = self.sx / self.w
+        my = self.sy / self.w
+        cov = self.sxy / self.w - numpy.outer(mx, my)
+        var_x = self.sxx / self.w - mx * mx
+        var_y = self.syy / self.w - my * my
+
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return cov / numpy.sqrt( numpy.outer(var_x, var_y) )
+
+
+
+class LogStatistics:
+    """
+    Computes all statistics of one log.
+    """
+
+    def __init__(self, reader, percentiles=(50, 90, 99), threshold=90, window=10, cpu_bins=10):
+        self.reader = reader
+        self.percentiles = percentiles
+        self.threshold = threshold
+        self.window = window
+
+        definitions = reader.class_definitions
+        self.cpus = list( definitions["CPU"]["Siblings"] )
+        self.nics = list( definitions["NIC"]["Siblings"] or () )
+
+        self.cpu_util_columns = [ cpu + ".util" for cpu in self.cpus ]
+        self.cpu_softirq_columns = [ cpu + ".softirq" for cpu in self.cpus ]
+        self.nic_columns = [ nic + "." + field for nic in self.nics for field in ("send", "receive") ]
+        self.nic_receive_columns = [ nic + ".receive" for nic in self.nics ]
+
+        ## Accumulators
+        self.begin = None
+        self.end = None
+        self.total_duration = 0.0
+        self.num_rows = 0
+
+        self.nic_mean = numpy.zeros( len(self.nic_columns) )
+        self.nic_max = numpy.full( len(self.nic_columns), -numpy.inf )
+        self.nic_histogram = Histogram( len(self.nic_columns), numpy.logspace(0, 13, 13*100+1) )   # 1 bit/s .. 10 Tbit/s
+        self.nic_rolling = RollingMean( len(self.nic_columns), window )
+
+        self.cpu_mean = numpy.zeros( len(self.cpus) )
+        self.cpu_histogram = Histogram( len(self.cpus), numpy.linspace(0, 100, cpu_bins+1)[1:-1] )
+        self.cpu_above = numpy.zeros( len(self.cpus) )
+        self.cpu_rolling = RollingMean( len(self.cpus), window )
+
+        self.correlation = Correlation( len(self.cpus), len(self.nics) )
+
+
+    def process(self, time_from=None, time_to=None, chunk_size=100000):
+        columns = ["begin", "end", "duration"] + self.cpu_util_columns + self.cpu_softirq_columns + self.nic_columns
+
+        for chunk in self.reader.column_chunks(columns, chunk_size, time_from, time_to):
+            self.update(chunk, time_from, time_to)
+
+        return self
+
+
+    def update(self, chunk, time_from=None, time_to=None):
+        begin = chunk["begin"]
+        end = chunk["end"]
+
+        ## Weights: The part of each measurement inside the time range.
+        duration = numpy.minimum(end, time_to if time_to is not None else numpy.inf) - \
+                   numpy.maximum(begin, time_from if time_from is not None else -numpy.inf)
+        duration = numpy.clip(duration, 0, None)
+
+        nic = numpy.column_stack( [ chunk[c] for c in self.nic_columns ] ) if self.nic_columns else numpy.empty( (len(begin), 0) )
+        util = numpy.column_stack( [ chunk[c] for c in self.cpu_util_columns ] )
+        softirq = numpy.column_stack( [ chunk[c] for c in self.cpu_softirq_columns ] )
+        receive = nic[:, 1::2]
+
+        self.begin = begin[0] if self.begin is None else self.begin
+        self.end = end[-1]
+        self.total_duration += duration.sum()
+        self.num_rows += len(begin)
+
+        self.nic_mean += (nic * duration[:, None]).sum(axis=0)
+        if ( len(begin) and nic.shape[1] ):
+            self.nic_max = numpy.maximum( self.nic_max, nic.max(axis=0) )
+        self.nic_histogram.update(nic, duration)
+        self.nic_rolling.update(end, duration, nic)
+
+        self.cpu_mean += (util * duration[:, None]).sum(axis=0)
+        self.cpu_histogram.update(util, duration)
+        self.cpu_above += ((util > self.threshold) * duration[:, None]).sum(axis=0)
+        self.cpu_rolling.update(end, duration, util)
+
+        self.correlation.update(softirq, receive, duration)
+
+
+    def result(self):
+        total = self.total_duration if self.total_duration > 0 else float("nan")
+
+        ret = dict()
+        ret["File"] = self.reader.filename
+        ret["Host"] = self.reader.hostname
+        ret["Begin"] = self.begin
+        ret["End"] = self.end
+        ret["Duration"] = self.total_duration
+        ret["Rows"] = self.num_rows
+
+        ## NICs
+        percentiles = self.nic_histogram.percentiles(self.percentiles)
+        rolling = self.nic_rolling.result()
+        nics = dict()
+        for i, column in enumerate(self.nic_columns):
+            nic, field = column.rsplit(".", 1)
+            stats = { "mean": self.nic_mean[i] / total,
+                      "max": self.nic_max[i],
+                      "rolling_max": rolling[i] }
+            for p, value in zip(self.percentiles, percentiles[i]):
+                stats["p" + str(p)] = value
+            nics.setdefault(nic, dict())[field] = stats
+        ret["NIC"] = nics
+
+        ## CPUs
+        fractions = self.cpu_histogram.fractions()
+        rolling = self.cpu_rolling.result()
+        cpus = dict()
+        for i, cpu in enumerate(self.cpus):
+            cpus[cpu] = { "mean": self.cpu_mean[i] / total,
+                          "above_threshold": self.cpu_above[i] / total,
+                          "rolling_max": rolling[i],
+                          "histogram": list(fractions[i]) }
+        ret["CPU"] = cpus
+
+        ## Correlation (softirq vs. receive)
+        correlation = self.correlation.result()
+        ret["Correlation"] = dict( (cpu, dict( (nic, correlation[i][j]) for j, nic in enumerate(self.nics) ))
+                                        for i, cpu in enumerate(self.cpus) )
+
+        return ret
+
+
+
+def _to_json(value):
+    """ Plain Python types; NaN (e.g. no full rolling window) becomes None, since it is not valid JSON. """
+
+    if ( isinstance(value, dict) ):
+        return dict( (k, _to_json(v)) for k, v in value.items() )
+    if ( isinstance(value, (list, tuple)) ):
+        return [ _to_json(v) for v in value ]
+    if ( isinstance(value, (float, numpy.floating)) ):
+        return float(value) if math.isfinite(value) else None
+
+    return value
+
+
+def _format_rate(bits):
+    if ( bits is None or not math.isfinite(bits) ):
+        return "-"
+
+    for unit, divisor in ( ("Gbit/s", 1e9), ("Mbit/s", 1e6), ("kbit/s", 1e3) ):
+        if ( bits >= divisor ):
+            return "{:.2f} {}".format(bits / divisor, unit)
+
+    return "{:.0f} bit/s".format(bits)
+
+
+def print_report(result, percentiles, threshold, window, out=sys.stdout):
+    print( "== {} ({}) ==".format(result["File"], result["Host"]), file=out )
+    print( "{} rows, {:.1f} seconds".format(result["Rows"], result["Duration"]), file=out )
+
+    print( "\nNIC throughput (mean, percentiles, max, peak {}s mean):".format(window), file=out )
+    for nic, fields in sorted(result["NIC"].items()):
+        for field, stats in sorted(fields.items(), reverse=True):
+            values = [ stats["mean"] ] + [ stats["p" + str(p)] for p in percentiles ] + [ stats["max"], stats["rolling_max"] ]
+            print( "  {:>12} {:>7}: {}".format(nic, field, " | ".join( _format_rate(v) for v in values )), file=out )
+
+    print( "\nCPU utilization (mean, time above {}%, peak {}s mean, histogram):".format(threshold, window), file=out )
+    for cpu, stats in sorted(result["CPU"].items(), key=lambda item: int(item[0][3:])):
+        histogram = " ".join( "{:3.0f}".format(100 * f) for f in stats["histogram"] )
+        print( "  {:>8}: {:6.2f}% | {:6.2f}% | {:6.2f}% | [{}]".format(
+                    cpu, stats["mean"], 100 * stats["above_threshold"], stats["rolling_max"], histogram), file=out )
+
+    print( "\nCorrelation softirq (CPU) vs. receive rate (NIC):", file=out )
+    for cpu, nics in sorted(result["Correlation"].items(), key=lambda item: int(item[0][3:])):
+        print( "  {:>8}: {}".format(cpu, "  ".join( "{}: {:+.2f}".format(nic, r) for nic, r in sorted(nics.items()) )), file=out )
+
+    print( file=out )
+
+
+
+## MAIN ##
+if __name__ == "__main__":
+
+    ## Command line arguments
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Statistics over CNL logs.")
+
+    parser.add_argument("files", nargs="+",
+                        help="CNL files")
+    parser.add_argument("--from", dest="time_from",
+                        help="Only evaluate from this point in time: Unix time, '+SECONDS' or 'HH:MM[:SS]'.")
+    parser.add_argument("--to", dest="time_to",
+                        help="Only evaluate up to this point in time. (Same formats as --from.)")
+    parser.add_argument("-p", "--percentiles", default="50,90,99",
+                        help="NIC throughput percentiles. [Default = 50,90,99]")
+    parser.add_argument("-t", "--threshold", type=float, default=90,
+                        help="CPU utilization threshold (in percent) for the 'time above' statistic. [Default = 90]")
+    parser.add_argument("-w", "--window", type=float, default=10,
+                        help="Rolling window (in seconds). [Default = 10]")
+    parser.add_argument("-b", "--bins", type=int, default=10,
+                        help="Number of bins of the CPU utilization histogram. [Default = 10]")
+    parser.add_argument("--chunk-size", type=int, default=100000,
+                        help="Rows per chunk. (Bounds the memory usage.) [Default = 100000]")
+    parser.add_argument("--json", action="store_true",
+                        help="Print the results as JSON.")
+
+    args = parser.parse_args()
+
+    if ( not numpy ):
+        sys.exit("cnl-stats requires NumPy.")
+
+    percentiles = [ float(p) if "." in p else int(p) for p in args.percentiles.split(",") ]
+
+    results = list()
+    for filename in args.files:
+        with CNLFileReader(filename) as reader:
+            try:
+                time_from = reader.parse_time(args.time_from) if args.time_from else None
+                time_to = reader.parse_time(args.time_to) if args.time_to else None
+            except ValueError as e:
+                parser.error(str(e))
+
+            stats = LogStatistics(reader, percentiles, args.threshold, args.window, args.bins)
+            result = stats.process(time_from, time_to, args.chunk_size).result()
+
+        if ( args.json ):
+            results.append(result)
+        else:
+            print_report(result, percentiles, args.threshold, args.window)
+
+    if ( args.json ):
+        print( json.dumps(_to_json(results), indent=4) )
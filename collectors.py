@@ -0,0 +1,1161 @@
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Collectors: Optional sources of values, each logged as a logging class of its own (see --collect).
+
+A »Collector« is read along with every »Reading«, and turned into values by the »Measurement«
+(usually counter deltas per second). The »MeasurementEncoder« appends the classes of all active
+collectors to the built-in ones.
+
+Collectors read procfs/sysfs files through persistent file handles (located by the system backend,
+see »backends.py«), and look up where their values are only once. So each sample costs just a
+read() and a few splits per file.
+
+Available collectors: see |COLLECTORS|.
+
+Plugins: Further collectors can be added without touching cpunetlog, as subclasses of »Collector«:
+  - A module (file or importable name, see --plugin) that defines a dict |COLLECTORS| (name -> class),
+    like this one. All its collectors are enabled.
+  - Or an installed package that declares them as entry points of the group |PLUGIN_GROUP|, e.g.
+      entry_points={"cpunetlog.collectors": ["gpu = cnl_gpu:GPUCollector"]}
+    These are enabled like the built-in ones (--collect gpu).
+
+A plugin defines the schema of its logging class (|name|, |fields|, |description|, |get_siblings()|),
+read() and compute(), and may draw itself in the curses UI (|display|). The time each collector takes
+for reading and computing is logged as class "CollectorOverhead".
+'''
+
+import glob
+import importlib
+import importlib.util
+import os
+import re
+import sys
+import time
+
+from logging import LoggingClass
+
+## NumPy is only imported by the collectors that use it (see |_import_numpy()|), not on every start.
+numpy = None
+
+
+def _import_numpy():
+    global numpy
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+
+
+class ProcFile:
+    """
+    A procfs file that is read again and again through the same file handle.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+
+    def read_lines(self):
+        self.file.seek(0)
+        return self.file.read().split(b"\n")
+
+    def close(self):
+        self.file.close()
+
+
+
+class ProcTableFile(ProcFile):
+    """
+    A file with pairs of "Section: names..." / "Section: values..." lines, like /proc/net/snmp and /proc/net/netstat.
+
+    The positions of the wanted |keys| [(section, name), ...] are looked up once. Keys that are missing
+    (e.g. on older kernels) are read as 0.
+    """
+
+    def __init__(self, path, keys):
+        ProcFile.__init__(self, path)
+
+        self.num_keys = len(keys)
+
+        ## Header positions: (section, name) -> (line index of the values, column)
+        positions = dict()
+        lines = self.read_lines()
+        i = 0
+        while ( i < len(lines) - 1 ):
+            names = lines[i].split()
+            values = lines[i+1].split()
+            if ( names and values and names[0] == values[0] ):
+                section = names[0].rstrip(b":").decode()
+                for column, name in enumerate(names[1:], 1):
+                    positions[(section, name.decode())] = (i + 1, column)
+                i += 2
+            else:
+                i += 1
+
+        ## Grouped by line: [ (line index, [(position in the result, column), ...]), ... ]
+        groups = dict()
+        for pos, key in enumerate(keys):
+            if ( key in positions ):
+                line, column = positions[key]
+                groups.setdefault(line, list()).append( (pos, column) )
+
+        self.groups = sorted( groups.items() )
+
+
+    def read(self):
+        """
+        Returns the values of the |keys|, in the same order.
+        """
+
+        lines = self.read_lines()
+        ret = [0] * self.num_keys
+
+        for line, columns in self.groups:
+            values = lines[line].split()
+            for pos, column in columns:
+                ret[pos] = int( values[column] )
+
+        return ret
+
+
+
+class SysfsFiles:
+    """
+    Many small sysfs files (holding a single number each), kept open and re-read with pread() in one batch.
+
+    Paths that are None (or files that can't be read) are read as |default|. Files with more than a number
+    (e.g. cgroup »cpu.stat«) are read with a larger |size| and parsed by |convert|.
+
+    Large batches (at least |PARALLEL_THRESHOLD| files, on a host with several CPUs) are split among
+    |THREADS| threads. (pread() releases the GIL.)
+    """
+
+    PARALLEL_THRESHOLD = 2000
+    THREADS = 4
+
+    def __init__(self, paths, size=32, convert=int, default=0):
+        self.size = size
+        self.convert = convert
+        self.default = default
+
+        self.fds = [ os.open(path, os.O_RDONLY) if path else None for path in paths ]
+
+        self.pool = None
+        if ( len(self.fds) >= self.PARALLEL_THRESHOLD and (os.cpu_count() or 1) > 1 ):
+            from multiprocessing.pool import ThreadPool
+            self.pool = ThreadPool(self.THREADS)
+
+        self._split()
+
+
+    def _split(self):
+        self.chunks = [ self.fds ]
+        if ( self.pool ):
+            size = -(-len(self.fds) // self.THREADS)
+            self.chunks = [ self.fds[i:i+size] for i in range(0, len(self.fds), size) ]
+
+
+    def _read_chunk(self, fds):
+        size = self.size
+        convert = self.convert
+        default = self.default
+
+        try:
+            return [ convert( os.pread(fd, size, 0) ) if fd is not None else default for fd in fds ]
+        except (OSError, ValueError):
+            ## (Some attributes can't be read in some states, e.g. while a device is down.)
+            return [ self._read_one(fd) for fd in fds ]
+
+    def _read_one(self, fd):
+        try:
+            return self.convert( os.pread(fd, self.size, 0) ) if fd is not None else self.default
+        except (OSError, ValueError):
+            return self.default
+
+
+    def read(self):
+        if ( not self.pool ):
+            return self._read_chunk(self.fds)
+
+        ret = list()
+        for values in self.pool.map(self._read_chunk, self.chunks):
+            ret.extend(values)
+
+        return ret
+
+
+    def reopen(self, i, path):
+        """
+        Replaces the |i|-th file by |path| (e.g. after it was deleted and created again). None: read as |default|.
+        """
+
+        if ( self.fds[i] is not None ):
+            os.close( self.fds[i] )
+            self.fds[i] = None
+
+        if ( path ):
+            self.fds[i] = os.open(path, os.O_RDONLY)
+
+        self._split()
+
+
+    def close(self):
+        if ( self.pool ):
+            self.pool.terminate()
+
+        for fd in self.fds:
+            if ( fd is not None ):
+                os.close(fd)
+
+
+
+class Collector:
+    """
+    Base class of all collectors.
+
+    Subclasses define the »LoggingClass« (|name|, |fields|, |description| and |get_siblings()|), and
+      - read()                          -->  raw values (stored in the »Reading«)
+      - compute( old, new, timespan )   -->  flat list of values in logging order (stored in the »Measurement«)
+
+    The default |compute()| logs the values marked in |is_counter| per second, and the others as they are.
+
+    Optionally, |display( stdscr, y, values )|  -->  next y  draws the values (from |compute()|) in the curses UI,
+    starting at line |y|. (Built-in collectors have their views in »curses_display«.)
+
+    The constructor raises an OSError (or a ValueError), if the collector isn't available on |backend|.
+    (|nics| are the monitored NICs; |options| is a dict of further settings from the command line, e.g. "disks".)
+    """
+
+    name = None
+    fields = ()
+    description = None
+    display = None
+
+    def __init__(self, backend, nics, options):
+        self.backend = backend
+        self.nics = nics
+        self.options = options
+
+        # Time spent in the last read() and compute() (in seconds; see |read_collectors()|).
+        self.read_time = 0
+        self.compute_time = 0
+
+    def _proc_path(self, name):
+        path = self.backend.proc_path(name)
+        if ( not path ):
+            raise ValueError("Not available on this system backend.")
+
+        return path
+
+    def get_siblings(self):
+        return None
+
+    def get_class(self):
+        return LoggingClass( name        = self.name,
+                             fields      = self.fields,
+                             siblings    = self.get_siblings(),
+                             description = self.description )
+
+    def get_empty(self):
+        siblings = self.get_siblings()
+        return [0] * ( len(self.fields) * (len(siblings) if siblings else 1) )
+
+    def compute(self, old, new, timespan):
+        return [ (n - o) / timespan if counter else n for o, n, counter in zip(old, new, self.is_counter) ]
+
+    def close(self):
+        pass
+
+
+
+class TCPCollector(Collector):
+    """
+    TCP statistics of the whole host (/proc/net/snmp and /proc/net/netstat).
+    """
+
+    name = "TCP"
+
+    ## (field, file, section, name)
+    #   All but "tcp.estab" are counters and logged per second.
+    VALUES = ( ("tcp.estab",            "snmp",    "Tcp",    "CurrEstab"),
+               ("tcp.active_opens",     "snmp",    "Tcp",    "ActiveOpens"),
+               ("tcp.passive_opens",    "snmp",    "Tcp",    "PassiveOpens"),
+               ("tcp.in_segs",          "snmp",    "Tcp",    "InSegs"),
+               ("tcp.out_segs",         "snmp",    "Tcp",    "OutSegs"),
+               ("tcp.retrans_segs",     "snmp",    "Tcp",    "RetransSegs"),
+               ("tcp.fast_retrans",     "netstat", "TcpExt", "TCPFastRetrans"),
+               ("tcp.lost_retrans",     "netstat", "TcpExt", "TCPLostRetransmit"),
+               ("tcp.timeouts",         "netstat", "TcpExt", "TCPTimeouts"),
+               ("tcp.ofo_queue",        "netstat", "TcpExt", "TCPOFOQueue"),
+               ("tcp.ofo_drop",         "netstat", "TcpExt", "TCPOFODrop"),
+               ("tcp.in_errs",          "snmp",    "Tcp",    "InErrs"),
+               ("tcp.out_rsts",         "snmp",    "Tcp",    "OutRsts"),
+               ("tcp.listen_overflows", "netstat", "TcpExt", "ListenOverflows"),
+               ("tcp.listen_drops",     "netstat", "TcpExt", "ListenDrops"),
+               ("tcp.backlog_drops",    "netstat", "TcpExt", "TCPBacklogDrop"),
+               ("tcp.rcvq_drops",       "netstat", "TcpExt", "TCPRcvQDrop"),
+               ("tcp.mem_pressures",    "netstat", "TcpExt", "TCPMemoryPressures") )
+
+    GAUGES = ("tcp.estab",)
+
+    fields = tuple( v[0] for v in VALUES )
+    description = "TCP statistics: established connections, and (per second) opened connections, segments, retransmissions, timeouts, out-of-order segments, errors, resets, drops and memory pressure events"
+
+
+    def __init__(self, backend, nics, options):
+        Collector.__init__(self, backend, nics, options)
+
+        self.files = list()
+        for filename in ("snmp", "netstat"):
+            keys = [ (section, key) for field, f, section, key in self.VALUES if f == filename ]
+            positions = [ i for i, v in enumerate(self.VALUES) if v[1] == filename ]
+
+            self.files.append( (ProcTableFile( self._proc_path("proc/net/" + filename), keys ), positions) )
+
+        self.is_counter = [ field not in self.GAUGES for field in self.fields ]
+
+
+    def read(self):
+        ret = [0] * len(self.fields)
+
+        for f, positions in self.files:
+            for pos, value in zip( positions, f.read() ):
+                ret[pos] = value
+
+        return ret
+
+
+    def close(self):
+        for f, positions in self.files:
+            f.close()
+
+
+
+class QueueCollector(Collector):
+    """
+    Per TX queue of the monitored NICs (/sys/class/net/<nic>/queues/tx-<n>/): bytes in flight and the limit of
+    the byte queue limits (BQL), and transmit timeouts. Siblings are named "<nic>.tx-<n>".
+
+    (The kernel has no per-queue packet or byte counters in sysfs, and the RX queues only hold RPS settings.)
+    """
+
+    name = "NICQueue"
+
+    ## (field, file below the queue directory, counter?)
+    VALUES = ( ("inflight", "byte_queue_limits/inflight", False),
+               ("limit",    "byte_queue_limits/limit",    False),
+               ("timeouts", "tx_timeout",                 True) )
+
+    fields = tuple( v[0] for v in VALUES )
+    description = "Per TX queue: bytes in flight and limit (byte queue limits, bytes), and transmit timeouts (per second)"
+
+
+    def __init__(self, backend, nics, options):
+        Collector.__init__(self, backend, nics, options)
+
+        self.queues = list()
+        paths = list()
+        for nic in nics:
+            directory = self._proc_path( "sys/class/net/{}/queues".format(nic) )
+            try:
+                queues = [ q for q in os.listdir(directory) if q.startswith("tx-") ]
+            except OSError:
+                continue
+
+            for queue in sorted( queues, key=lambda q: int(q[3:]) ):
+                self.queues.append( nic + "." + queue )
+                for field, filename, counter in self.VALUES:
+                    path = os.path.join(directory, queue, filename)
+                    paths.append( path if os.path.exists(path) else None )
+
+        if ( not self.queues ):
+            raise ValueError("None of the NICs has TX queues in sysfs.")
+
+        self.files = SysfsFiles(paths)
+        self.is_counter = [ counter for q in self.queues for field, filename, counter in self.VALUES ]
+
+
+    def get_siblings(self):
+        return self.queues
+
+    def read(self):
+        return self.files.read()
+
+    def close(self):
+        self.files.close()
+
+
+
+class NICStatsCollector(Collector):
+    """
+    Error and drop counters of the monitored NICs (/sys/class/net/<nic>/statistics/), per second.
+    """
+
+    name = "NICStats"
+    fields = ("rx_errors", "rx_dropped", "rx_missed_errors", "rx_fifo_errors", "rx_over_errors", "rx_crc_errors",
+              "rx_nohandler", "tx_errors", "tx_dropped", "tx_fifo_errors", "tx_carrier_errors", "collisions")
+    description = "Per NIC: receive and transmit errors and drops (per second)"
+
+
+    def __init__(self, backend, nics, options):
+        Collector.__init__(self, backend, nics, options)
+
+        paths = list()
+        for nic in nics:
+            directory = self._proc_path( "sys/class/net/{}/statistics".format(nic) )
+            for field in self.fields:
+                path = os.path.join(directory, field)
+                paths.append( path if os.path.exists(path) else None )
+
+        if ( not any(paths) ):
+            raise ValueError("None of the NICs has statistics in sysfs.")
+
+        self.files = SysfsFiles(paths)
+        self.is_counter = [True] * len(paths)
+
+
+    def get_siblings(self):
+        return self.nics
+
+    def read(self):
+        return self.files.read()
+
+    def close(self):
+        self.files.close()
+
+
+
+class CPUFreqCollector(Collector):
+    """
+    Per CPU: current frequency (cpufreq), and thermal throttling events (/sys/devices/system/cpu/cpu<n>/...).
+    """
+
+    name = "CPUFreq"
+
+    ## (field, file below the CPU directory, counter?)
+    VALUES = ( ("freq",              "cpufreq/scaling_cur_freq",               False),
+               ("core_throttles",    "thermal_throttle/core_throttle_count",    True),
+               ("package_throttles", "thermal_throttle/package_throttle_count", True) )
+
+    fields = tuple( v[0] for v in VALUES )
+    description = "Per CPU: current frequency (MHz), and thermal throttling events of the core and the package (per second)"
+
+
+    def __init__(self, backend, nics, options):
+        Collector.__init__(self, backend, nics, options)
+
+        self.cpus = [ "CPU" + str(i) for i in range( backend.cpu_count() ) ]
+
+        paths = list()
+        for i in range( len(self.cpus) ):
+            directory = self._proc_path( "sys/devices/system/cpu/cpu" + str(i) )
+            for field, filename, counter in self.VALUES:
+                path = os.path.join(directory, filename)
+                paths.append( path if os.path.exists(path) else None )
+
+        if ( not any(paths) ):
+            raise ValueError("Neither cpufreq nor thermal_throttle is available.")
+
+        self.files = SysfsFiles(paths)
+        self.is_counter = [ counter for cpu in self.cpus for field, filename, counter in self.VALUES ]
+
+
+    def get_siblings(self):
+        return self.cpus
+
+    def read(self):
+        return self.files.read()
+
+    def compute(self, old, new, timespan):
+        ret = Collector.compute(self, old, new, timespan)
+        ret[0::3] = [ freq / 1000.0 for freq in ret[0::3] ]    # kHz --> MHz
+
+        return ret
+
+    def close(self):
+        self.files.close()
+
+
+
+class PressureCollector(Collector):
+    """
+    Pressure stall information (/proc/pressure/{cpu,memory,io}): The share of the time in which some (or all)
+    non-idle tasks were stalled, calculated from the "total" stall times (so exactly for each measurement).
+    """
+
+    name = "Pressure"
+    RESOURCES = ("cpu", "memory", "io")
+
+    fields = tuple( "psi.{}.{}".format(resource, kind) for resource in RESOURCES for kind in ("some", "full") )
+    description = "Pressure stall information: share of the time (in percent) in which some / all non-idle tasks were stalled on CPU, memory and IO"
+
+
+    def __init__(self, backend, nics, options):
+        Collector.__init__(self, backend, nics, options)
+
+        self.files = [ ProcFile( self._proc_path("proc/pressure/" + resource) ) for resource in self.RESOURCES ]
+
+
+    def read(self):
+        ## Lines: "some avg10=0.00 avg60=0.00 avg300=0.00 total=12345"  (total: microseconds)
+        ret = [0] * len(self.fields)
+
+        for i, f in enumerate(self.files):
+            for line in f.read_lines():
+                if ( line.startswith(b"some") ):
+                    ret[2*i] = int( line.rsplit(b"=", 1)[1] )
+                elif ( line.startswith(b"full") ):
+                    ret[2*i+1] = int( line.rsplit(b"=", 1)[1] )
+
+        return ret
+
+
+    def compute(self, old, new, timespan):
+        return [ (n - o) / (timespan * 1e4) for o, n in zip(old, new) ]     # us / (s * 1e6) * 100%
+
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+
+
+class DiskCollector(Collector):
+    """
+    Per block device (/proc/diskstats): read and written bytes/s, IOPS, I/Os in flight, average queue depth
+    and utilization (like »iostat -x«).
+
+    Devices: |options["disks"]|, or all disks (without partitions, loop and ram devices).
+
+    The lines of the devices are located once (and again, if a device was added or removed). All devices
+    are then parsed in one go and derived as a matrix (with NumPy, if available), so even hundreds of
+    NVMe namespaces only cost a few microseconds.
+
+    The devices must exist when the collector is created. Devices that disappear later (e.g. an unplugged
+    USB disk, or a removed NVMe namespace) are logged as 0 until they are back.
+    """
+
+    name = "Disk"
+    fields = ("read", "write", "read_iops", "write_iops", "inflight", "queue", "util")
+    description = "Per disk: read and written bytes/s, read and write operations/s, I/Os in flight, average queue depth, utilization (percent)"
+
+    ## Columns after "major minor name" (the first 11 are present on all kernels)
+    NUM_COLUMNS = 11
+    READS, SECTORS_READ, WRITES, SECTORS_WRITTEN, IN_FLIGHT, IO_TICKS, TIME_IN_QUEUE = 0, 2, 4, 6, 8, 9, 10
+
+    SECTOR_SIZE = 512
+
+    ## Raw values of a missing device (counters are never negative)
+    MISSING = (b"-1",) * NUM_COLUMNS
+
+
+    def __init__(self, backend, nics, options):
+        Collector.__init__(self, backend, nics, options)
+        _import_numpy()
+
+        self.diskstats = ProcFile( self._proc_path("proc/diskstats") )
+
+        if ( options.get("disks") ):
+            self.disks = list( options["disks"] )
+        else:
+            path = self._proc_path("sys/block")
+            self.disks = sorted( d for d in os.listdir(path) if not d.startswith( ("loop", "ram", "zram") ) )
+
+        self._locate( self.diskstats.read_lines() )
+
+        missing = [ d for d, i in zip(self.disks, self.line_numbers) if i is None ]
+        if ( missing ):
+            raise ValueError("Unknown block devices: " + ", ".join(missing))
+
+
+    def _locate(self, lines):
+        ## Line of each device (None: missing). (|num_lines| tells when to look for missing devices again.)
+        numbers = dict()
+        for i, line in enumerate(lines):
+            parts = line.split(None, 3)
+            if ( len(parts) > 2 ):
+                numbers[ parts[2].decode() ] = i
+
+        self.line_numbers = [ numbers.get(d) for d in self.disks ]
+        self.num_lines = len(lines)
+        self.complete = None not in self.line_numbers
+
+
+    def get_siblings(self):
+        return self.disks
+
+
+    def _parse(self, lines):
+        ## Rows of the devices; None if a device isn't where it was located.
+        rows = list()
+        for i, disk in zip(self.line_numbers, self.disks):
+            if ( i is None ):
+                rows.append(self.MISSING)
+                continue
+
+            parts = lines[i].split() if i < len(lines) else ()
+            if ( len(parts) < 3 or parts[2].decode() != disk ):
+                return None
+
+            rows.append( parts[3:3+self.NUM_COLUMNS] )
+
+        return rows
+
+
+    def read(self):
+        lines = self.diskstats.read_lines()
+
+        if ( not self.complete and len(lines) != self.num_lines ):
+            self._locate(lines)
+
+        rows = self._parse(lines)
+        if ( rows is None ):
+            self._locate(lines)
+            rows = self._parse(lines)
+
+        if ( numpy is not None ):
+            text = b" ".join( b" ".join(row) for row in rows )
+            return numpy.fromstring(text, dtype=numpy.int64, sep=" ").reshape( len(rows), self.NUM_COLUMNS )
+
+        return [ [ int(x) for x in row ] for row in rows ]
+
+
+    def compute(self, old, new, timespan):
+        ## [disk0.read, disk0.write, ..., disk1.read, ...]
+        #   (Devices missing in either reading, or whose counters were reset, e.g. a re-plugged disk, are 0.)
+        if ( numpy is not None ):
+            d = new - old
+            values = numpy.column_stack( ( d[:,self.SECTORS_READ] * (self.SECTOR_SIZE / timespan),
+                                           d[:,self.SECTORS_WRITTEN] * (self.SECTOR_SIZE / timespan),
+                                           d[:,self.READS] / timespan,
+                                           d[:,self.WRITES] / timespan,
+                                           new[:,self.IN_FLIGHT],
+                                           d[:,self.TIME_IN_QUEUE] / (timespan * 1000),
+                                           d[:,self.IO_TICKS] / (timespan * 10) ) )
+            invalid = (old[:,self.READS] < 0) | (new[:,self.READS] < 0) | (d[:,self.READS] < 0) | (d[:,self.WRITES] < 0)
+            values[invalid] = 0
+
+            return values.ravel().tolist()
+
+        ret = list()
+        for o, n in zip(old, new):
+            d = [ b - a for a, b in zip(o, n) ]
+            if ( o[self.READS] < 0 or n[self.READS] < 0 or d[self.READS] < 0 or d[self.WRITES] < 0 ):
+                ret.extend( (0,) * len(self.fields) )
+                continue
+
+            ret.extend( ( d[self.SECTORS_READ] * self.SECTOR_SIZE / timespan,
+                          d[self.SECTORS_WRITTEN] * self.SECTOR_SIZE / timespan,
+                          d[self.READS] / timespan,
+                          d[self.WRITES] / timespan,
+                          n[self.IN_FLIGHT],
+                          d[self.TIME_IN_QUEUE] / (timespan * 1000),
+                          d[self.IO_TICKS] / (timespan * 10) ) )
+
+        return ret
+
+
+    def close(self):
+        self.diskstats.close()
+
+
+
+def _parse_cpu_stat(data):
+    ## "usage_usec 123\nuser_usec 100\n..."  (Keys without the cpu controller, e.g. throttling, are read as 0.)
+    parts = data.split()
+    stat = dict( zip(parts[0::2], parts[1::2]) )
+
+    return [ int( stat.get(key, 0) ) for key in CgroupCollector.CPU_KEYS ]
+
+
+class CgroupCollector(Collector):
+    """
+    Per cgroup (v2): CPU usage and throttling (cpu.stat), and the traffic of the cgroup's network namespace
+    (/proc/<pid>/net/dev of one of its processes, without »lo«). Siblings are the cgroup paths, e.g.
+    "system.slice/docker-<id>.scope".
+
+    Cgroups: |options["cgroups"]|, paths or glob patterns below the cgroup root (default: its children).
+    Cgroups in the network namespace of cpunetlog itself (the host) get no network values, since these
+    would just repeat the host's traffic.
+
+    The siblings are fixed when the collector is created (they go into the log header): Patterns are
+    expanded once. Cgroups that are named explicitly are logged as soon as they exist (e.g. containers
+    that are started later), and are attached again when they are created anew (e.g. a restarted container).
+
+    Discovery index: The directory, »cpu.stat« file and network namespace of each cgroup are looked up
+    once and kept open. Only cgroups that couldn't be read are looked up again, at most every
+    |RESCAN_INTERVAL| seconds. Namespaces shared by several cgroups (e.g. pods) are read only once.
+    So a sample costs one pread() per cgroup and one read per network namespace.
+    """
+
+    name = "Cgroup"
+    fields = ("cpu.usage", "cpu.user", "cpu.system", "cpu.throttled", "cpu.throttled_time",
+              "net.rx", "net.tx", "net.rx_packets", "net.tx_packets")
+    description = "Per cgroup: CPU usage, user and system time (percent of one CPU), throttled periods (per second) and throttled time (percent), and the traffic of its network namespace (bytes and packets per second)"
+
+    CPU_KEYS = (b"usage_usec", b"user_usec", b"system_usec", b"nr_throttled", b"throttled_usec")
+
+    ## Network namespace of cgroups in the host's namespace (no network values)
+    HOST = "host"
+    NO_NET = (0, 0, 0, 0)
+
+    DEFAULT_PATTERNS = ("*",)
+    RESCAN_INTERVAL = 5
+
+
+    def __init__(self, backend, nics, options):
+        Collector.__init__(self, backend, nics, options)
+
+        self.root = self._find_root()
+
+        self.cgroups = list()
+        for pattern in options.get("cgroups") or self.DEFAULT_PATTERNS:
+            pattern = pattern.strip("/")
+            if ( glob.has_magic(pattern) ):
+                names = sorted( os.path.relpath(path, self.root) for path in glob.glob( os.path.join(self.root, pattern) )
+                                if os.path.isdir(path) )
+            else:
+                names = [ pattern ]
+
+            self.cgroups.extend( name for name in names if name not in self.cgroups )
+
+        if ( not self.cgroups ):
+            raise ValueError("No cgroup matches: " + ", ".join(options.get("cgroups") or self.DEFAULT_PATTERNS))
+
+        try:
+            self.host_netns = os.stat( self._proc_path("proc/self/ns/net") ).st_ino
+        except OSError:
+            self.host_netns = None
+
+        ## Discovery index: per cgroup, the inode of its directory (None: doesn't exist) and its network
+        #    namespace (inode, |HOST|, or None: not found yet). Network namespace -> its »net/dev« file.
+        self.inodes = [None] * len(self.cgroups)
+        self.cgroup_netns = [None] * len(self.cgroups)
+        self.netns_files = dict()
+        self.stale_netns = list()
+
+        self.cpu_files = SysfsFiles( [None] * len(self.cgroups), size=1024, convert=_parse_cpu_stat, default=None )
+
+        self._update( range( len(self.cgroups) ) )
+        self.broken = set()
+        self.next_rescan = time.monotonic() + self.RESCAN_INTERVAL
+
+
+    def _find_root(self):
+        for name in ("sys/fs/cgroup", "sys/fs/cgroup/unified"):
+            path = self._proc_path(name)
+            if ( os.path.exists( os.path.join(path, "cgroup.controllers") ) ):
+                return path
+
+        raise ValueError("No cgroup v2 hierarchy (at /sys/fs/cgroup or /sys/fs/cgroup/unified).")
+
+
+    def _update(self, indices):
+        """
+        Looks up the cgroups |indices| again (those that are new, recreated, gone, or whose processes have exited).
+        """
+
+        ## (The processes through which these namespaces were read have exited.)
+        for netns in self.stale_netns:
+            self.netns_files.pop(netns).close()
+        self.stale_netns = list()
+
+        for i in indices:
+            path = os.path.join(self.root, self.cgroups[i])
+            try:
+                inode = os.stat(path).st_ino
+            except OSError:
+                inode = None
+
+            if ( inode != self.inodes[i] ):
+                self.inodes[i] = inode
+                try:
+                    self.cpu_files.reopen( i, os.path.join(path, "cpu.stat") if inode else None )
+                except OSError:
+                    self.inodes[i] = None
+
+            self.cgroup_netns[i] = self._find_netns(path) if self.inodes[i] else None
+
+        ## Drop the namespaces that aren't used anymore.
+        used = set(self.cgroup_netns)
+        for netns in [ netns for netns in self.netns_files if netns not in used ]:
+            self.netns_files.pop(netns).close()
+
+
+    def _find_netns(self, path):
+        ## The network namespace of the first process in the cgroup (or in one below it, e.g. in a pod).
+        for directory, subdirs, files in os.walk(path):
+            try:
+                with open( os.path.join(directory, "cgroup.procs"), "rb" ) as f:
+                    pid = int( f.readline() or 0 )
+
+                if ( not pid ):
+                    continue
+
+                netns = os.stat( self._proc_path("proc/{}/ns/net".format(pid)) ).st_ino
+                if ( netns == self.host_netns ):
+                    return self.HOST
+
+                if ( netns not in self.netns_files ):
+                    self.netns_files[netns] = ProcFile( self._proc_path("proc/{}/net/dev".format(pid)) )
+
+                return netns
+
+            except (OSError, ValueError):
+                continue
+
+        return None
+
+
+    @staticmethod
+    def _read_net_dev(f):
+        ## Sum over all interfaces but »lo«: rx bytes, tx bytes, rx packets, tx packets
+        try:
+            lines = f.read_lines()
+        except OSError:
+            return None
+
+        rx_bytes = tx_bytes = rx_packets = tx_packets = 0
+        for line in lines[2:]:
+            name, sep, data = line.partition(b":")
+            if ( not sep or name.strip() == b"lo" ):
+                continue
+
+            values = data.split()
+            rx_bytes += int(values[0])
+            rx_packets += int(values[1])
+            tx_bytes += int(values[8])
+            tx_packets += int(values[9])
+
+        ## (The file of an exited process is empty.)
+        if ( len(lines) < 3 ):
+            return None
+
+        return (rx_bytes, tx_bytes, rx_packets, tx_packets)
+
+
+    def get_siblings(self):
+        return self.cgroups
+
+
+    def read(self):
+        now = time.monotonic()
+        if ( self.broken and now >= self.next_rescan ):
+            self._update( sorted(self.broken) )
+            self.next_rescan = now + self.RESCAN_INTERVAL
+
+        cpu = self.cpu_files.read()
+        net = dict( (netns, self._read_net_dev(f)) for netns, f in self.netns_files.items() )
+        self.stale_netns = [ netns for netns, counters in net.items() if counters is None ]
+        net[self.HOST] = net[None] = self.NO_NET
+
+        ret = [ (c, net[netns]) for c, netns in zip(cpu, self.cgroup_netns) ]
+
+        ## Missing cgroups, cgroups without processes (yet), and those whose namespace was read through
+        #    a process that has exited, are looked up again (see |_update()|).
+        self.broken = set( i for i, (c, n) in enumerate(ret) if c is None or n is None )
+        self.broken.update( i for i, netns in enumerate(self.cgroup_netns) if netns is None )
+
+        return ret
+
+
+    def compute(self, old, new, timespan):
+        ## (Values of cgroups that weren't readable in both readings, or were created anew in between, are 0.)
+        ret = list()
+        for (old_cpu, old_net), (new_cpu, new_net) in zip(old, new):
+            if ( old_cpu is None or new_cpu is None or new_cpu[0] < old_cpu[0] ):
+                ret.extend( (0, 0, 0, 0, 0) )
+            else:
+                usage, user, system, throttled, throttled_time = [ n - o for o, n in zip(old_cpu, new_cpu) ]
+                ret.extend( ( usage / (timespan * 1e4),             # us / (s * 1e6) * 100%
+                              user / (timespan * 1e4),
+                              system / (timespan * 1e4),
+                              throttled / timespan,
+                              throttled_time / (timespan * 1e4) ) )
+
+            if ( old_net is None or new_net is None or new_net[0] < old_net[0] or new_net[1] < old_net[1] ):
+                ret.extend( (0, 0, 0, 0) )
+            else:
+                ret.extend( (n - o) / timespan for o, n in zip(old_net, new_net) )
+
+        return ret
+
+
+    def close(self):
+        self.cpu_files.close()
+
+        for f in self.netns_files.values():
+            f.close()
+
+
+
+def _parse_counts(line, num_cpus):
+    """
+    Parses the per-CPU counters of a /proc/softirqs or /proc/interrupts line ("LABEL: count count ... [text]").
+    """
+
+    counts = line.split(b":", 1)[1]
+
+    if ( numpy is not None ):
+        return numpy.fromstring(counts, dtype=numpy.int64, sep=" ", count=num_cpus)
+
+    return [ int(x) for x in counts.split(None, num_cpus)[:num_cpus] ]
+
+
+
+class IRQCollector(Collector):
+    """
+    Per CPU: NET_RX and NET_TX softirqs (/proc/softirqs), and the interrupts of the monitored NICs (/proc/interrupts).
+
+    The interrupts of a NIC are found by their name ("eth0", "eth0-TxRx-3", "eth0@pci...", ...) and by the
+    MSI interrupts of its device (/sys/class/net/<nic>/device/msi_irqs).
+
+    Both files have one column per (online) CPU and can be long, so only the relevant lines are parsed
+    (with NumPy, if available). The lines are located once, and only looked up again if an interrupt
+    line has moved (e.g. when a driver got loaded).
+    """
+
+    name = "IRQ"
+    fields = ("net_rx", "net_tx", "nic_irqs")
+    description = "Per CPU: NET_RX and NET_TX softirqs, and interrupts of the monitored NICs (per second)"
+
+
+    def __init__(self, backend, nics, options):
+        Collector.__init__(self, backend, nics, options)
+        _import_numpy()
+
+        self.softirqs = ProcFile( self._proc_path("proc/softirqs") )
+        self.interrupts = ProcFile( self._proc_path("proc/interrupts") )
+
+        ## CPUs (Only the online ones have a column.)
+        lines = self.softirqs.read_lines()
+        self.cpus = [ cpu.decode() for cpu in lines[0].split() ]
+        self.num_cpus = len(self.cpus)
+
+        labels = [ line.split(b":", 1)[0].strip() for line in lines ]
+        self.net_rx_line = labels.index(b"NET_RX")
+        self.net_tx_line = labels.index(b"NET_TX")
+
+        ## Interrupts of the NICs
+        self.nic_irqs = self._find_nic_irqs()
+        self.irq_lines = list()
+        self._locate_irqs( self.interrupts.read_lines() )
+
+
+    def _find_nic_irqs(self):
+        """
+        Returns the numbers (as bytes, e.g. b"45") of all interrupts of the monitored NICs.
+        """
+
+        ret = set()
+
+        ## MSI interrupts of the NICs' devices
+        for nic in self.nics:
+            path = self.backend.proc_path( "sys/class/net/{}/device/msi_irqs".format(nic) )
+            try:
+                ret.update( irq.encode() for irq in os.listdir(path) )
+            except OSError:
+                pass
+
+        ## Interrupts named after the NICs
+        if ( self.nics ):
+            pattern = re.compile( "^(" + "|".join( re.escape(nic) for nic in self.nics ) + ")([-_@.:]|$)" )
+
+            for line in self.interrupts.read_lines()[1:]:
+                parts = line.split()
+                if ( parts and any( pattern.match(p.decode(errors="replace")) for p in parts[self.num_cpus+1:] ) ):
+                    ret.add( parts[0].rstrip(b":") )
+
+        return ret
+
+
+    def _locate_irqs(self, lines):
+        self.irq_lines = [ (i, line.split(b":", 1)[0].strip()) for i, line in enumerate(lines)
+                           if line.split(b":", 1)[0].strip() in self.nic_irqs ]
+
+
+    def get_siblings(self):
+        return self.cpus
+
+
+    def read(self):
+        lines = self.softirqs.read_lines()
+        net_rx = _parse_counts(lines[self.net_rx_line], self.num_cpus)
+        net_tx = _parse_counts(lines[self.net_tx_line], self.num_cpus)
+
+        ## Interrupts (summed over all queues of all monitored NICs)
+        lines = self.interrupts.read_lines()
+        if ( any( i >= len(lines) or not lines[i].lstrip().startswith(irq + b":") for i, irq in self.irq_lines ) ):
+            self._locate_irqs(lines)
+
+        irqs = [0] * self.num_cpus
+        for i, irq in self.irq_lines:
+            counts = _parse_counts(lines[i], self.num_cpus)
+            irqs = counts + irqs if numpy is not None else [ a + b for a, b in zip(irqs, counts) ]
+
+        if ( numpy is not None ):
+            return numpy.array( (net_rx, net_tx, irqs), dtype=numpy.int64 )
+
+        return (net_rx, net_tx, irqs)
+
+
+    def compute(self, old, new, timespan):
+        ## [CPU0.net_rx, CPU0.net_tx, CPU0.nic_irqs, CPU1.net_rx, ...]
+        if ( numpy is not None ):
+            return ( (new - old) / timespan ).T.ravel().tolist()
+
+        ret = list()
+        for cpu in zip( *( [ (n - o) / timespan for o, n in zip(old_row, new_row) ] for old_row, new_row in zip(old, new) ) ):
+            ret.extend(cpu)
+
+        return ret
+
+
+    def close(self):
+        self.softirqs.close()
+        self.interrupts.close()
+
+
+
+## name -> class  (see --collect)
+COLLECTORS = { "tcp": TCPCollector,
+               "irq": IRQCollector,
+               "queues": QueueCollector,
+               "nicstats": NICStatsCollector,
+               "cpufreq": CPUFreqCollector,
+               "psi": PressureCollector,
+               "disk": DiskCollector,
+               "cgroups": CgroupCollector }
+
+
+## Entry point group of installed collector plugins
+PLUGIN_GROUP = "cpunetlog.collectors"
+
+
+def register_collector(name, cls):
+    """
+    Makes the collector class |cls| available as |name| (e.g. for --collect).
+    """
+
+    if ( not (isinstance(cls, type) and issubclass(cls, Collector)) ):
+        raise ValueError("Collector '{}' is not a subclass of collectors.Collector.".format(name))
+
+    if ( COLLECTORS.get(name, cls) is not cls ):
+        raise ValueError("Collector '{}' is already defined (by {}).".format(name, COLLECTORS[name].__module__))
+
+    COLLECTORS[name] = cls
+
+
+def load_plugin(plugin):
+    """
+    Loads the plugin module |plugin| (a file, or the name of an importable module), and registers the
+    collectors in its |COLLECTORS|. Returns their names.
+    """
+
+    if ( os.path.isfile(plugin) ):
+        name = "cnl_plugin_" + os.path.splitext( os.path.basename(plugin) )[0]
+        spec = importlib.util.spec_from_file_location(name, plugin)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(plugin)
+
+    plugin_collectors = getattr(module, "COLLECTORS", None)
+    if ( not isinstance(plugin_collectors, dict) ):
+        raise ValueError("Plugin '{}' defines no COLLECTORS.".format(plugin))
+
+    for name, cls in plugin_collectors.items():
+        register_collector(name, cls)
+
+    return list(plugin_collectors)
+
+
+def load_entry_points(verbose=True):
+    """
+    Registers the collectors of all installed plugins (entry points of |PLUGIN_GROUP|). Returns their names.
+
+    (Only called when needed: Looking through the installed packages takes a while.)
+    """
+
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return list()
+
+    eps = entry_points()
+    eps = eps.select(group=PLUGIN_GROUP) if hasattr(eps, "select") else eps.get(PLUGIN_GROUP, ())
+
+    ret = list()
+    for ep in eps:
+        try:
+            register_collector( ep.name, ep.load() )
+            ret.append(ep.name)
+        except Exception as e:
+            if ( verbose ):
+                print( "Plugin '{}' can't be loaded: {}".format(ep.value, e), file=sys.stderr )
+
+    return ret
+
+
+def read_collectors(collectors):
+    """
+    Reads all |collectors| in one go (for a »Reading«), and keeps track of the time each of them takes.
+    """
+
+    ret = list()
+    clock = time.perf_counter
+
+    for c in collectors:
+        t0 = clock()
+        values = c.read()
+        c.read_time = clock() - t0
+
+        ret.append( (c, values) )
+
+    return ret
+
+
+def compute_collectors(old, new, timespan):
+    """
+    Returns the values of all collectors (name -> values) from two |read_collectors()| results (for a »Measurement«).
+    """
+
+    ret = dict()
+    clock = time.perf_counter
+
+    for (c, old_values), (_, new_values) in zip(old, new):
+        t0 = clock()
+        ret[c.name] = c.compute(old_values, new_values, timespan)
+        c.compute_time = clock() - t0
+
+    return ret
+
+
+def create_collectors(names, backend, nics, options=None, verbose=True):
+    """
+    Returns the collectors |names| that are available on |backend|. (The others are reported on stderr, if |verbose|.)
+    """
+
+    options = options if options else dict()
+
+    ret = list()
+
+    for name in names:
+        try:
+            ret.append( COLLECTORS[name](backend, nics, options) )
+        except (OSError, ValueError) as e:
+            if ( verbose ):
+                print( "Collector '{}' is not available: {}".format(name, e), file=sys.stderr )
+
+    return ret
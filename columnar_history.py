@@ -0,0 +1,276 @@
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+The values of the last N measurements, by column, for range queries and windowed aggregates
+(e.g. over the control socket, see »control.py«).
+
+(A module of its own, apart from »history_store.py«: NumPy is only loaded if there is such a history.)
+'''
+
+import fnmatch
+import math
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+
+class ColumnarHistory:
+    """
+    The last |capacity| measurements, stored by column (laid out by the logging schema of |encoder|, a
+    »MeasurementEncoder«) in fixed-size ring buffers: NumPy arrays, or an »array« per column without NumPy.
+
+    Appending costs one write per column, independent of the length of the history. The rows are indexed by
+    time (the "end" of each measurement), so ranges are found by binary search.
+
+    Columns are selected by name (see »MeasurementEncoder.get_column_names()«), or by glob patterns,
+    e.g. "CPU*.util" or "eth0.*".
+
+    The |capacity| is fixed, unless it's changed with |resize()| (e.g. for a shorter sampling interval).
+
+    Usage:
+      - Constructor( encoder, capacity )
+      - append( measurement )      (for each measurement; or append_vector(), if it's already encoded)
+      - resize( capacity )
+      - Queries:
+          - latest( columns )
+          - range( columns, t_from, t_to )              -->  { column: values }
+          - window( columns, seconds, stat, q )         -->  { column: aggregate }
+    """
+
+    STATS = ("mean", "min", "max", "percentile")
+
+    def __init__(self, encoder, capacity):
+        self.encoder = encoder
+        self.capacity = capacity
+
+        self.columns = encoder.get_column_names()
+        self.index = dict( (name, i) for i, name in enumerate(self.columns) )
+        self.end_column = self.index["end"]
+        self.duration_column = self.index["duration"]
+
+        if ( numpy is not None ):
+            self.data = numpy.full( (len(self.columns), capacity), numpy.nan )
+        else:
+            self.data = [ array("d", [math.nan]) * capacity for column in self.columns ]
+
+        # Position of the next row, and number of rows.
+        self.pos = 0
+        self.size = 0
+
+
+    def __len__(self):
+        return self.size
+
+
+    def append(self, measurement):
+        self.append_vector( self.encoder.encode(measurement) )
+
+
+    def append_vector(self, vector):
+        if ( numpy is not None ):
+            self.data[:, self.pos] = vector
+        else:
+            pos = self.pos
+            for column, value in zip(self.data, vector):
+                column[pos] = value
+
+        self.pos = (self.pos + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+
+    def resize(self, capacity):
+        """
+        Changes the capacity to |capacity| rows, keeping the most recent ones.
+        """
+
+        keep = min(self.size, capacity)
+
+        if ( numpy is not None ):
+            data = numpy.full( (len(self.columns), capacity), numpy.nan )
+        else:
+            data = [ array("d", [math.nan]) * capacity for column in self.columns ]
+
+        for i, column in enumerate(self.columns):
+            data[i][:keep] = self._get(column, self.size - keep, self.size)
+
+        self.data = data
+        self.capacity = capacity
+        self.pos = keep % capacity
+        self.size = keep
+
+
+
+    ## Indexing ##
+
+    def select(self, columns=None):
+        """
+        Returns the names of the |columns| (names or glob patterns; None: all) in schema order.
+        Raises a KeyError for names (or patterns) without a match.
+        """
+
+        if ( columns is None ):
+            return list(self.columns)
+
+        selected = set()
+        for pattern in columns:
+            if ( pattern in self.index ):
+                selected.add(pattern)
+                continue
+
+            matches = fnmatch.filter(self.columns, pattern)
+            if ( not matches ):
+                raise KeyError("No such column: " + pattern)
+            selected.update(matches)
+
+        return sorted( selected, key=self.index.get )
+
+
+    def _physical(self, i):
+        ## Logical row |i| (0 = oldest)  -->  position in the ring buffer
+        return (self.pos - self.size + i) % self.capacity
+
+
+    def _end(self, i):
+        return self.data[self.end_column][ self._physical(i) ]
+
+
+    def _find(self, t):
+        ## First logical row with end > |t|.
+        lo, hi = 0, self.size
+        while ( lo < hi ):
+            mid = (lo + hi) // 2
+            if ( self._end(mid) > t ):
+                hi = mid
+            else:
+                lo = mid + 1
+
+        return lo
+
+
+    def _get(self, column, first, last):
+        ## Values of |column| in the logical rows [first, last), in time order.
+        a = self._physical(first)
+        n = last - first
+        values = self.data[ self.index[column] ]
+
+        if ( a + n <= self.capacity ):
+            return values[a:a+n]
+
+        if ( numpy is not None ):
+            return numpy.concatenate( (values[a:], values[:a+n-self.capacity]) )
+
+        return values[a:] + values[:a+n-self.capacity]
+
+
+
+    ## Queries ##
+
+    def get_time_range(self):
+        """
+        Returns (begin, end) of the history, or None if it's empty.
+        """
+
+        if ( not self.size ):
+            return None
+
+        return ( float( self.data[self.index["begin"]][ self._physical(0) ] ), float( self._end(self.size - 1) ) )
+
+
+    def latest(self, columns=None):
+        """
+        Returns the values of the last measurement: { column: value }
+        """
+
+        if ( not self.size ):
+            return dict()
+
+        pos = self._physical(self.size - 1)
+        return dict( (c, float(self.data[self.index[c]][pos])) for c in self.select(columns) )
+
+
+    def range(self, columns=None, t_from=None, t_to=None):
+        """
+        Returns the values of the measurements that end after |t_from| and no later than |t_to|: { column: values }
+        (NumPy arrays, or »array«s; in time order.)
+        """
+
+        first = self._find(t_from) if t_from is not None else 0
+        last = self._find(t_to) if t_to is not None else self.size
+        last = max(first, last)
+
+        return dict( (c, self._get(c, first, last)) for c in self.select(columns) )
+
+
+    def window(self, columns=None, seconds=60, stat="mean", q=95):
+        """
+        Aggregates the measurements of the last |seconds| (up to the latest one): { column: value }
+
+        |stat|: "mean" (weighted by the duration of the measurements), "min", "max" or "percentile" (|q|, 0-100).
+        Values are NaN if the window is empty.
+        """
+
+        if ( stat not in self.STATS ):
+            raise ValueError("Unknown statistic: {} (available: {})".format(stat, ", ".join(self.STATS)))
+
+        selected = self.select(columns)
+
+        if ( not self.size ):
+            return dict.fromkeys(selected, math.nan)
+
+        first = self._find( self._end(self.size - 1) - seconds )
+        last = self.size
+        durations = self._get("duration", first, last)
+
+        ret = dict()
+        for c in selected:
+            ret[c] = _aggregate( self._get(c, first, last), durations, stat, q )
+
+        return ret
+
+
+
+def _aggregate(values, durations, stat, q):
+    if ( not len(values) ):
+        return math.nan
+
+    if ( numpy is not None ):
+        if ( stat == "mean" ):
+            total = durations.sum()
+            return float( (values * durations).sum() / total if total > 0 else values.mean() )
+        elif ( stat == "min" ):
+            return float( values.min() )
+        elif ( stat == "max" ):
+            return float( values.max() )
+        else:
+            return float( numpy.percentile(values, q) )
+
+    if ( stat == "mean" ):
+        total = sum(durations)
+        if ( total > 0 ):
+            return sum( v * d for v, d in zip(values, durations) ) / total
+        return sum(values) / len(values)
+    elif ( stat == "min" ):
+        return min(values)
+    elif ( stat == "max" ):
+        return max(values)
+    else:
+        ## (Linear interpolation between the closest ranks, like numpy.percentile.)
+        ordered = sorted(values)
+        k = (len(ordered) - 1) * q / 100.0
+        lo = int(math.floor(k))
+        hi = min(lo + 1, len(ordered) - 1)
+        return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
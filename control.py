@@ -0,0 +1,320 @@
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Control socket of a long-running »cpunetlog« (see --daemon / --control, and the client »cnl_ctl.py«).
+
+Protocol: One JSON object per line, in both directions.
+  request:  {"command": "comment", "args": {"text": "run 2"}}
+  reply:    {"ok": true, "status": {...}}   or   {"ok": false, "error": "..."}
+
+Commands:
+  - status
+  - start / stop                    (the measurement logger)
+  - comment       {text}
+  - environment   {environment}     (JSON object, or null)
+  - path          {path}
+  - interval      {interval}        (seconds; a shorter one grows the history, to keep its time span)
+  - add_nics / remove_nics  {nics}
+  - event         {text}            (written into the current log as "%% Event: {...}" line)
+  - history       {columns, seconds, stat, q}   (windowed aggregates of the recent measurements, see
+                                     »ColumnarHistory.window()«; the reply holds them as "result")
+
+Requests are received by a background thread, but executed by the sampling thread (in the main loop,
+see »ControlServer.process()«), so that the sampler and the loggers don't need any locking.
+Settings that go into the log header (comment, environment, NICs) continue the current log in a new
+segment with an updated header.
+'''
+
+import json
+import math
+import os
+import queue
+import socket
+import threading
+from socketserver import StreamRequestHandler, ThreadingUnixStreamServer
+
+import backends
+
+
+DEFAULT_SOCKET = "/tmp/cpunetlog.sock"
+
+## Time a client waits for the main loop to execute its request (in seconds; at least two sampling intervals).
+#  Requests that time out are cancelled.
+REQUEST_TIMEOUT = 10
+
+
+
+class _ControlRequestHandler(StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads( line.decode("utf-8") )
+                reply = self.server.control.submit(request)
+            except ValueError as e:
+                reply = { "ok": False, "error": "Invalid request: " + str(e) }
+
+            self.wfile.write( (json.dumps(reply) + "\n").encode("utf-8") )
+
+
+
+class ControlServer:
+    """
+    Accepts requests on the UNIX socket |path|, and executes them with |controller| (a »Controller«).
+
+    Usage:
+      - Constructor( path, controller )
+      - Loop (in the main loop):
+          - process()
+      - close()
+    """
+
+    def __init__(self, path, controller):
+        self.path = path
+        self.controller = controller
+
+        ## Pending requests: (request, receive time, reply-slot)
+        #   reply-slot: [reply, done (Event), state ("queued", "running" or "cancelled")]
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+
+        self._remove_stale_socket()
+
+        self.server = ThreadingUnixStreamServer(path, _ControlRequestHandler)
+        self.server.daemon_threads = True
+        self.server.control = self
+
+        self.thread = threading.Thread(target=self.server.serve_forever, name="cpunetlog-control")
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def _remove_stale_socket(self):
+        if ( not os.path.exists(self.path) ):
+            return
+
+        ## Another instance may still be listening.
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.connect(self.path)
+        except OSError:
+            os.unlink(self.path)
+        else:
+            raise OSError("Control socket is in use (is another cpunetlog running?): " + self.path)
+        finally:
+            s.close()
+
+
+    def submit(self, request):
+        """
+        Called by the server threads: Queues |request| for the main loop, and waits for the reply.
+        (The time it was received is passed along, e.g. for events: The main loop may be sleeping.)
+        """
+
+        slot = [None, threading.Event(), "queued"]
+        self.queue.put( (request, backends.get_backend().time(), slot) )
+
+        timeout = max( REQUEST_TIMEOUT, 2 * (getattr(self.controller.source, "interval", None) or 0) )
+        if ( not slot[1].wait(timeout) ):
+            ## Cancel it, unless the main loop is already executing it.
+            with self.lock:
+                cancelled = ( slot[2] == "queued" )
+                if ( cancelled ):
+                    slot[2] = "cancelled"
+
+            if ( cancelled ):
+                return { "ok": False, "error": "Timeout (the main loop didn't respond). The request is cancelled." }
+
+            slot[1].wait()
+
+        return slot[0]
+
+
+    def process(self):
+        """
+        Called by the main loop: Executes all pending requests.
+        """
+
+        while True:
+            try:
+                request, timestamp, slot = self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+            ## (The client gave up on it.)
+            with self.lock:
+                if ( slot[2] == "cancelled" ):
+                    continue
+                slot[2] = "running"
+
+            slot[0] = self.controller.handle(request, timestamp)
+            slot[1].set()
+
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+
+class Controller:
+    """
+    Executes control requests on the running »LoggingManager« and the measurement |source| (e.g. the »Sampler«).
+
+    |display| is the (curses) UI module, if there is one: It's kept on the same NICs as the logger.
+    |history| is the »ColumnarHistory« of the recent measurements, if there is one, that keeps the last
+    |history_seconds| seconds.
+    """
+
+    def __init__(self, logging_manager, source, display=None, history=None, history_seconds=None):
+        self.logging_manager = logging_manager
+        self.source = source
+        self.display = display
+        self.history = history
+        self.history_seconds = history_seconds
+
+        ## Time the current request was received
+        self.timestamp = None
+
+
+    def handle(self, request, timestamp=None):
+        ## (|timestamp|: when the request was received; default: now)
+        self.timestamp = timestamp if timestamp is not None else backends.get_backend().time()
+
+        try:
+            command = request["command"]
+            func = getattr(self, "cmd_" + command, None)
+            if ( not func ):
+                raise ValueError("Unknown command: " + str(command))
+
+            result = func( **request.get("args", dict()) )
+
+        except (ValueError, TypeError, KeyError, OSError) as e:
+            return { "ok": False, "error": "{}: {}".format(type(e).__name__, e) }
+
+        reply = { "ok": True, "status": self.get_status() }
+        if ( result is not None ):
+            reply["result"] = result
+
+        return reply
+
+
+    def get_status(self):
+        lm = self.logging_manager
+        files = lm.get_filenames()
+
+        return { "state": lm.get_logging_state(),
+                 "file": files[0] if files else None,
+                 "files": files,
+                 "comment": lm.get_logging_comment(),
+                 "path": lm.path,
+                 "nics": lm.nics,
+                 "interval": getattr(self.source, "interval", None) }
+
+
+    ## Commands ##
+
+    def cmd_status(self):
+        pass
+
+    def cmd_start(self):
+        self.logging_manager.enable_measurement_logger()
+
+    def cmd_stop(self):
+        self.logging_manager.disable_measurement_logger()
+
+    def cmd_comment(self, text):
+        self.logging_manager.comment = text
+        self.logging_manager.new_segment()
+
+    def cmd_environment(self, environment):
+        if ( environment is not None and not isinstance(environment, dict) ):
+            raise ValueError("The environment must be a JSON object.")
+
+        self.logging_manager.environment = environment
+        self.logging_manager.new_segment()
+
+    def cmd_path(self, path):
+        self.logging_manager.set_path(path)
+        self.logging_manager.new_segment()
+
+    def cmd_interval(self, interval):
+        if ( not hasattr(self.source, "interval") ):
+            raise ValueError("The interval can't be changed for this source.")
+
+        interval = float(interval)
+        if ( interval <= 0 ):
+            raise ValueError("The interval must be positive.")
+
+        self.source.interval = interval
+
+        ## More rows for the same time span. (The history grows, but never shrinks.)
+        if ( self.history is not None and self.history_seconds ):
+            shortest_interval = min( interval, getattr(self.source, "fast_interval", interval) )
+            capacity = int( math.ceil(self.history_seconds / shortest_interval) ) + 1
+            if ( capacity > self.history.capacity ):
+                self.history.resize(capacity)
+
+    def cmd_add_nics(self, nics):
+        self._set_nics( self.logging_manager.nics + [ nic for nic in nics if nic not in self.logging_manager.nics ] )
+
+    def cmd_remove_nics(self, nics):
+        self._set_nics( [ nic for nic in self.logging_manager.nics if nic not in nics ] )
+
+    def cmd_event(self, text):
+        if ( not self.logging_manager.mark_event(text, self.timestamp) ):
+            raise ValueError("Not logging (or the log sink doesn't support events).")
+
+    def cmd_history(self, columns=None, seconds=60, stat="mean", q=95):
+        if ( self.history is None ):
+            raise ValueError("No history is kept (see --history and --control).")
+
+        ## (NaN isn't valid JSON.)
+        return dict( (column, value if value == value else None)
+                     for column, value in self.history.window(columns, float(seconds), stat, float(q)).items() )
+
+
+    def _set_nics(self, nics):
+        ## (New lists: The old ones may still be shared, e.g. with the exporter.)
+        if ( hasattr(self.source, "nics") ):
+            self.source.nics = list(nics)
+        if ( self.display ):
+            self.display.nics = list(nics)
+
+        self.logging_manager.nics = list(nics)
+        self.logging_manager.new_segment()
+
+
+
+def send_request(path, command, **args):
+    """
+    Client side: Sends a request to the control socket |path| and returns the reply.
+    """
+
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+        s.sendall( (json.dumps( {"command": command, "args": args} ) + "\n").encode("utf-8") )
+
+        f = s.makefile("rb")
+        line = f.readline()
+    finally:
+        s.close()
+
+    if ( not line ):
+        return { "ok": False, "error": "No reply." }
+
+    return json.loads( line.decode("utf-8") )
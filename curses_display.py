@@ -53,11 +53,22 @@ CPU_TYPE_LABELS = { "user": "user: ",
                     "softirq": "sftirq: ",
                     "steal": "steal: ",
                     "guest": "guest: ",
-                    "guest_nice": "g_nice: " }
+                    "guest_nice": "g_nice: ",
+                    "other": "other: " }
 
 ## Reference to the logging manager, to display its state.
 logging_manager = None
 
+## Active collectors (see »collectors.py«). Those with a view (see |COLLECTOR_VIEWS|, or their own |display|)
+#    are displayed below the CPUs.
+collectors = None
+
+## Optional hooks (e.g. for a replay):
+#   key_handler(key) is called with all keys that are not handled here;
+#   status() returns a text that is shown in the top border.
+key_handler = None
+status = None
+
 ## GUI, positions of fields
 LABEL_Sent = 18
 LABEL_Received = 48
@@ -105,6 +116,10 @@ def adjust_nic_speeds(send, receive, nic):
 
     cur = max(send, receive)
 
+    ## NICs with an unknown speed start with the lowest one.
+    if ( nic not in nic_speeds ):
+        nic_speeds[nic] = EXISTING_NIC_SPEEDS[0]
+
     if ( cur > nic_speeds[nic] + MARGIN ):
         new_speed = nic_speeds[nic]
         for x in EXISTING_NIC_SPEEDS:
@@ -122,6 +137,14 @@ def _format_net_speed(speed):
     return str( round(speed / divisor, rounding_digits) )
 
 
+def _format_count(value):
+    for factor, suffix in ( (1e9, "G"), (1e6, "M"), (1e3, "k") ):
+        if ( value >= factor ):
+            return "{:.1f}{}".format(value / factor, suffix)
+
+    return "{:.0f}".format(value)
+
+
 def _calculate_net_ratio( cur_speed, max_speed ):
     ratio = cur_speed / max_speed
 
@@ -170,8 +193,8 @@ def init():
     global stdscr
     global nic_speeds
 
-    if not nic_speeds:
-        nic_speeds = helpers.get_nic_speeds()
+    if nic_speeds is None:
+        nic_speeds = helpers.get_nic_speeds(nics)
 
     stdscr = curses.initscr()
     curses.noecho()
@@ -224,11 +247,15 @@ def _display(measurement):
         return False
     elif pressedkey == ord('-'):
         reset_nic_speeds()
+    elif pressedkey != -1 and key_handler:
+        key_handler(pressedkey)
 
     ## Header
     stdscr.clear()
     stdscr.border(0)
-    timenow = time.strftime("%H:%M:%S")
+    if status:
+        stdscr.addstr(0, 3, " {} ".format( status() ), curses.A_BOLD)
+    timenow = time.strftime("%H:%M:%S", time.localtime( measurement.get_end() ))
     stdscr.addstr(1, 1, 'CPUnetLOG', curses.A_BOLD)
     stdscr.addstr(1, LABEL_Sent, 'Time: {}'.format( timenow ), curses.A_BOLD)
     stdscr.addstr(1, 39, 'Interval: {}s'.format( round(measurement.timespan, 1) ), curses.A_BOLD)
@@ -265,6 +292,21 @@ def _display(measurement):
         y += 1
 
 
+    ## Collectors ##
+    collected = getattr(measurement, "collected", dict())
+    views = [ (COLLECTOR_VIEWS.get(c.name), c, collected[c.name]) for c in collectors or ()
+              if (c.name in COLLECTOR_VIEWS or c.display) and c.name in collected ]
+    if ( views ):
+        y += 1
+        stdscr.hline(y, 1, "-", 78)
+        y += 1
+
+        for view, collector, values in views:
+            if ( view ):
+                y = view(y, collector, values)
+            else:
+                ## (Plugins draw themselves.)
+                y = collector.display(stdscr, y, values)
 
 
     ## Network ##
@@ -355,6 +397,127 @@ def _display(measurement):
     return True
 
 
+def _display_irq(y, collector, values):
+    """
+    Softirqs and NIC interrupts per CPU (»IRQCollector«): The busiest CPUs first, as many as fit into a line.
+    """
+
+    num_fields = len(collector.fields)
+    ## (Numbered like the CPUs above, i.e. starting with 1.)
+    cpus = [ "CPU{}".format( int(cpu[3:]) + 1 ) for cpu in collector.get_siblings() ]
+
+    for i, label in enumerate( ("NET_RX/s", "NET_TX/s", "NIC IRQs/s") ):
+        stdscr.addstr(y, 1, label, curses.color_pair(2))
+
+        x = LABEL_CPU_UTIL
+        for rate, cpu in sorted( zip(values[i::num_fields], cpus), reverse=True ):
+            text = "{}: {}".format( cpu, _format_count(rate) )
+            if ( x + len(text) > 78 ):
+                break
+
+            stdscr.addstr(y, x, cpu + ":", curses.color_pair(1))
+            stdscr.addstr(y, x + len(cpu) + 2, _format_count(rate), curses.color_pair(3))
+            x += len(text) + 2
+
+        y += 1
+
+    return y
+
+
+def _display_cpufreq(y, collector, values):
+    """
+    CPU frequencies (»CPUFreqCollector«) in a single line: min / avg / max, and the throttling events of all CPUs.
+    """
+
+    freqs = values[0::3]
+    throttles = sum(values[1::3]) + sum(values[2::3])
+
+    stdscr.addstr(y, 1, "Freq (MHz)", curses.color_pair(2))
+    stdscr.addstr(y, LABEL_CPU_UTIL, "min/avg/max: ", curses.color_pair(4))
+    stdscr.addstr("{:.0f} / {:.0f} / {:.0f}".format( min(freqs), sum(freqs) / len(freqs), max(freqs) ), curses.color_pair(3))
+    stdscr.addstr(y, LABEL_CPU_2 - 3, "throttles: ", curses.color_pair(4))
+    stdscr.addstr(_format_count(throttles) + "/s", curses.color_pair(3)|curses.A_BOLD if throttles else curses.color_pair(3))
+
+    return y + 1
+
+
+def _display_pressure(y, collector, values):
+    """
+    Pressure stall information (»PressureCollector«) in a single line: some / full, per resource.
+    """
+
+    stdscr.addstr(y, 1, "Pressure", curses.color_pair(2))
+
+    x = LABEL_CPU_UTIL
+    for i, resource in enumerate(collector.RESOURCES):
+        stdscr.addstr(y, x, resource + ": ", curses.color_pair(4))
+        stdscr.addstr("{:.1f}/{:.1f}%".format(values[2*i], values[2*i+1]), curses.color_pair(3))
+        x += 20
+
+    return y + 1
+
+
+def _display_disk(y, collector, values):
+    """
+    Block devices (»DiskCollector«): The busiest devices first (by utilization), one line each, at most |MAX_DISKS|.
+    """
+
+    MAX_DISKS = 3
+    num_fields = len(collector.fields)
+
+    rows = [ (values[i*num_fields:(i+1)*num_fields], disk) for i, disk in enumerate(collector.get_siblings()) ]
+    rows.sort( key=lambda row: row[0][6], reverse=True )
+
+    for (read, write, read_iops, write_iops, inflight, queue, util), disk in rows[:MAX_DISKS]:
+        stdscr.addstr(y, 1, "Disk " + disk[:10], curses.color_pair(2))
+        stdscr.addstr(y, LABEL_CPU_UTIL, "r/w: ", curses.color_pair(4))
+        stdscr.addstr("{}B/{}B".format( _format_count(read), _format_count(write) ), curses.color_pair(3))
+        stdscr.addstr(y, LABEL_CPU_UTIL + 19, "IOPS: ", curses.color_pair(4))
+        stdscr.addstr("{}/{}".format( _format_count(read_iops), _format_count(write_iops) ), curses.color_pair(3))
+        stdscr.addstr(y, LABEL_CPU_2 - 6, "qd: ", curses.color_pair(4))
+        stdscr.addstr("{:.1f}".format(queue), curses.color_pair(3))
+        stdscr.addstr(y, LABEL_CPU_2 + 4, "util: ", curses.color_pair(4))
+        stdscr.addstr("{:.0f}%".format(util), curses.color_pair(3)|curses.A_BOLD if util >= 90 else curses.color_pair(3))
+        y += 1
+
+    return y
+
+
+def _display_cgroups(y, collector, values):
+    """
+    Cgroups (»CgroupCollector«): The busiest cgroups first (by CPU usage), one line each, at most |MAX_CGROUPS|.
+    """
+
+    MAX_CGROUPS = 3
+    num_fields = len(collector.fields)
+
+    rows = [ (values[i*num_fields:(i+1)*num_fields], cgroup) for i, cgroup in enumerate(collector.get_siblings()) ]
+    rows.sort( key=lambda row: row[0][0], reverse=True )
+
+    for row, cgroup in rows[:MAX_CGROUPS]:
+        usage, throttled_time, rx, tx = row[0], row[4], row[5], row[6]
+
+        stdscr.addstr(y, 1, cgroup.rsplit("/", 1)[-1][:15], curses.color_pair(2))
+        stdscr.addstr(y, LABEL_CPU_UTIL, "cpu: ", curses.color_pair(4))
+        stdscr.addstr("{:.1f}%".format(usage), curses.color_pair(3))
+        stdscr.addstr(y, LABEL_CPU_UTIL + 19, "rx/tx: ", curses.color_pair(4))
+        stdscr.addstr("{}B/{}B".format( _format_count(rx), _format_count(tx) ), curses.color_pair(3))
+        stdscr.addstr(y, LABEL_CPU_2 - 6, "throttled: ", curses.color_pair(4))
+        stdscr.addstr("{:.0f}%".format(throttled_time), curses.color_pair(3)|curses.A_BOLD if throttled_time >= 1 else curses.color_pair(3))
+        y += 1
+
+    return y
+
+
+## Collector name -> function( y, collector, values )  -->  next y
+COLLECTOR_VIEWS = { "IRQ": _display_irq,
+                    "CPUFreq": _display_cpufreq,
+                    "Pressure": _display_pressure,
+                    "Disk": _display_disk,
+                    "Cgroup": _display_cgroups }
+
+
+
 def close():
     global stdscr
 
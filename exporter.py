@@ -0,0 +1,218 @@
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Prometheus exporter for »cpunetlog«.
+
+Serves the latest »Measurement« (in the Prometheus text exposition format) over a small built-in HTTP server.
+
+The exposition is rendered exactly once per sample (by the sampling thread) into a byte buffer.
+Scrapes only pick up a reference to the latest buffer, so they are cheap and never block the sampler.
+'''
+
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+METRIC_PREFIX = "cpunetlog"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+
+def parse_address(address):
+    """
+    Parses "[host]:port" into a (host, port) tuple. An empty host means: all interfaces.
+    """
+
+    host, sep, port = address.rpartition(":")
+
+    if ( not sep ):
+        raise ValueError("Invalid exporter address (expected [host]:port): " + address)
+
+    return host.strip("[]"), int(port)
+
+
+def _metric_name(*parts):
+    name = "_".join( [METRIC_PREFIX] + [ p.lower() for p in parts ] )
+
+    return re.sub("[^a-zA-Z0-9_]", "_", name)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+
+        if ( path == "/metrics" ):
+            body = self.server.exporter.get_exposition()
+
+            if ( body is None ):
+                self._reply(503, b"No measurement available, yet.\n")
+            else:
+                self._reply(200, body, CONTENT_TYPE)
+
+        elif ( path == "/" ):
+            self._reply(200, b"CPUnetLOG exporter. Metrics are served at /metrics\n")
+
+        else:
+            self._reply(404, b"Not found.\n")
+
+
+    def _reply(self, code, body, content_type="text/plain; charset=utf-8"):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        ## Keep quiet, stderr would mess up the curses display.
+        pass
+
+
+
+class MetricsExporter:
+    """
+    Renders »Measurements« into the Prometheus text format and serves them via HTTP.
+
+    Usage:
+      - Constructor( »MeasurementEncoder«, (host, port) )
+      - Loop:
+          - update( »Measurement« )
+      - close()
+    """
+
+    def __init__(self, encoder, address):
+        self.encoder = encoder
+
+        ## The latest rendered exposition (bytes). Replaced as a whole, never modified.
+        self.exposition = None
+
+        ## Pre-computed metric names and labels, in the order of |encoder.encode()|.
+        self.series = self._init_series(encoder.get_classes())
+
+        ## Start HTTP server.
+        self.server = ThreadingHTTPServer(address, _MetricsRequestHandler)
+        self.server.daemon_threads = True
+        self.server.exporter = self
+
+        self.thread = threading.Thread(target=self.server.serve_forever, name="cpunetlog-exporter")
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def _init_series(self, classes):
+        """
+        Returns a list of (header, [sample prefix per value]) for each metric, one metric per field of each class.
+        """
+
+        ret = list()
+        index = 0
+
+        for c in classes:
+            fields = c.values["Fields"]
+            siblings = c.values["Siblings"]
+
+            ## Values are ordered by sibling, then by field.
+            #    Collect the prefixes per field to group each metric in the output.
+            per_field = [ list() for f in fields ]
+            for sibling in ( siblings if siblings else (None,) ):
+                for i, field in enumerate(fields):
+                    name = _metric_name(c.name, field)
+                    if ( sibling is None ):
+                        prefix = name + " "
+                    else:
+                        prefix = '{}{{{}="{}"}} '.format(name, c.name.lower(), _escape_label(sibling))
+
+                    per_field[i].append( (index, prefix) )
+                    index += 1
+
+            for field, samples in zip(fields, per_field):
+                name = _metric_name(c.name, field)
+                header = "# HELP {} {} ({})\n# TYPE {} gauge\n".format(name, c.values["Description"], field, name)
+
+                ret.append( (header, samples) )
+
+        return ret
+
+
+    def _render_counters(self, measurement, out):
+        """
+        Renders the cumulative raw counters of the younger »Reading« of |measurement|.
+        """
+
+        reading = measurement.r2
+
+        ## (Recorded measurements, see »replay.py«, have no raw counters.)
+        if ( reading.cpu_times is None ):
+            return
+
+        ## CPU times (seconds).
+        name = _metric_name("cpu", "seconds_total")
+        out.append( "# HELP {} Cumulative CPU time (in seconds) per mode.\n# TYPE {} counter\n".format(name, name) )
+        for i, cpu in enumerate(reading.cpu_times):
+            for mode in cpu._fields:
+                out.append( '{}{{cpu="CPU{}",mode="{}"}} {}\n'.format(name, i, mode, getattr(cpu, mode)) )
+
+        ## NIC counters (bytes, packets, errors, ...).
+        nics = [ nic for nic in self.encoder.nics if nic in reading.net_io ]
+        if ( nics ):
+            for field in reading.net_io[nics[0]]._fields:
+                name = _metric_name("nic", field, "total")
+                out.append( "# HELP {} Cumulative network counter ({}).\n# TYPE {} counter\n".format(name, field, name) )
+                for nic in nics:
+                    out.append( '{}{{nic="{}"}} {}\n'.format(name, _escape_label(nic), getattr(reading.net_io[nic], field)) )
+
+
+    def update(self, measurement, values=None):
+        """
+        Renders |measurement| and makes it the one served to subsequent scrapes.
+        (|values|: the measurement, if it's already encoded with the schema of the encoder.)
+        """
+
+        if ( values is None ):
+            values = self.encoder.encode(measurement)
+
+        out = list()
+        for header, samples in self.series:
+            out.append(header)
+            for index, prefix in samples:
+                out.append(prefix)
+                out.append(repr(float(values[index])))
+                out.append("\n")
+
+        self._render_counters(measurement, out)
+
+        ## Swap in the new buffer (a single reference assignment, no locking needed).
+        self.exposition = "".join(out).encode("utf-8")
+
+
+    def get_exposition(self):
+        return self.exposition
+
+
+    def get_address(self):
+        """
+        Returns the (host, port) the server is actually bound to. (Useful, if port 0 was requested.)
+        """
+
+        return self.server.server_address[:2]
+
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
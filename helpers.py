@@ -11,7 +11,6 @@
 
 
 import os
-import netifaces
 import operator
 
 
@@ -21,12 +20,19 @@ def get_nb_open_files():
     return int(data.split('\t')[0])
 
 def get_nics():
+    ## (Imported here: Only needed if the NICs aren't given explicitly.)
+    import netifaces
+
     return netifaces.interfaces()
 
-def get_nic_speeds():
+def get_nic_speeds(nics=None):
+    """
+    Returns the speeds (in bit/s) of |nics| (default: all NICs), as far as they are known.
+    """
+
     ret = dict()
 
-    for nic in get_nics():
+    for nic in nics if nics is not None else get_nics():
         try:
             with open("/sys/class/net/" + nic + "/speed", "r") as f:
                 speed = int( f.read().strip() ) * 1000 * 1000
@@ -0,0 +1,104 @@
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Publishes the latest »Measurement« into a shared memory segment (an mmap'd file, by default in /dev/shm).
+
+Other local processes can read it with »live_metrics_reader.py«, without any syscalls on the fast path.
+
+Layout (native byte order):
+  offset  0: magic "CNLLIVE1"
+  offset  8: uint32  valid        (1 while the publisher is alive, 0 afterwards)
+  offset 12: uint32  num_values
+  offset 16: uint64  sequence     (seqlock: odd while the values are being written)
+  offset 24: uint32  schema_offset
+  offset 28: uint32  schema_size
+  offset 32: uint32  values_offset
+  offset 64: schema  (JSON: column names and the logging class definitions)
+  values_offset: float64 * num_values  (in the order of the CSV-header)
+'''
+
+import json
+import mmap
+import os
+import struct
+
+from live_metrics_reader import MAGIC, HEADER, SEQUENCE, HEADER_SIZE, VALID_OFFSET, SEQUENCE_OFFSET
+
+
+class LiveMetricsPublisher:
+    """
+    Writes the values of each »Measurement« (as given by a »MeasurementEncoder«) into a shared memory segment.
+
+    Usage:
+      - Constructor( »MeasurementEncoder«, path )
+      - Loop:
+          - update( »Measurement« )
+      - close()
+    """
+
+    def __init__(self, encoder, path):
+        self.encoder = encoder
+        self.path = path
+
+        ## Schema
+        columns = encoder.get_column_names()
+        class_definitions = dict( (c.name, c.values) for c in encoder.get_classes() )
+
+        schema = json.dumps( {"Columns": columns, "ClassDefinitions": class_definitions} ).encode("utf-8")
+
+        self.values = struct.Struct( "={}d".format(len(columns)) )
+        values_offset = HEADER_SIZE + len(schema)
+        values_offset += -values_offset % 8    # align
+
+        ## Create the segment in a temporary file and move it in place,
+        #    so that readers never see a partially initialized segment.
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.truncate(values_offset + self.values.size)
+        self.fd = os.open(tmp_path, os.O_RDWR)
+        self.mm = mmap.mmap(self.fd, values_offset + self.values.size)
+
+        HEADER.pack_into(self.mm, 0, MAGIC, 1, len(columns), 0, HEADER_SIZE, len(schema), values_offset)
+        self.mm[HEADER_SIZE:HEADER_SIZE+len(schema)] = schema
+
+        os.rename(tmp_path, path)
+
+        self.values_offset = values_offset
+        self.sequence = 0
+
+
+    def update(self, measurement, values=None):
+        ## (|values|: the measurement, if it's already encoded with the schema of the encoder.)
+        if ( values is None ):
+            values = self.encoder.encode(measurement)
+
+        ## Seqlock: odd sequence number while writing.
+        self.sequence += 1
+        SEQUENCE.pack_into(self.mm, SEQUENCE_OFFSET, self.sequence)
+
+        self.values.pack_into(self.mm, self.values_offset, *values)
+
+        self.sequence += 1
+        SEQUENCE.pack_into(self.mm, SEQUENCE_OFFSET, self.sequence)
+
+
+    def close(self):
+        ## Tell the readers that the values won't be updated anymore, then remove the segment.
+        struct.pack_into("=I", self.mm, VALID_OFFSET, 0)
+
+        self.mm.close()
+        os.close(self.fd)
+
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
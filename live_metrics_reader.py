@@ -0,0 +1,124 @@
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Reader for the live metrics that »cpunetlog --shm« publishes. (See »live_metrics.py« for the layout.)
+
+This module has no dependencies, so it can be copied into other tools.
+
+Usage:
+    reader = LiveMetricsReader("/dev/shm/cpunetlog")
+    values = reader.read_dict()     # {"begin": ..., "CPU0.util": ..., "eth0.send": ..., ...}
+'''
+
+import json
+import mmap
+import struct
+
+
+MAGIC = b"CNLLIVE1"
+HEADER = struct.Struct("=8sIIQIII")
+SEQUENCE = struct.Struct("=Q")
+HEADER_SIZE = 64
+
+VALID_OFFSET = 8
+SEQUENCE_OFFSET = 16
+
+
+class StaleSegmentError(Exception):
+    """ The publisher has quit (or replaced the segment). Re-open to continue. """
+    pass
+
+
+class LiveMetricsReader:
+    def __init__(self, path="/dev/shm/cpunetlog", max_retries=1000):
+        self.path = path
+        self.max_retries = max_retries
+
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, valid, num_values, sequence, schema_offset, schema_size, values_offset = HEADER.unpack_from(self.mm, 0)
+        if ( magic != MAGIC ):
+            raise ValueError("Not a cpunetlog live metrics segment: " + path)
+
+        schema = json.loads( self.mm[schema_offset:schema_offset+schema_size].decode("utf-8") )
+        self.columns = schema["Columns"]
+        self.class_definitions = schema["ClassDefinitions"]
+        self.index = { name: i for i, name in enumerate(self.columns) }
+
+        self.values = struct.Struct( "={}d".format(num_values) )
+        self.values_offset = values_offset
+
+        ## Sequence number of the last snapshot (even; increases by 2 per measurement).
+        self.sequence = 0
+
+
+    def get_sequence(self):
+        """
+        Returns the current sequence number. (Cheap way to poll for a new measurement.)
+        """
+
+        return SEQUENCE.unpack_from(self.mm, SEQUENCE_OFFSET)[0]
+
+
+    def read(self):
+        """
+        Returns a consistent snapshot of all values (tuple, in the order of |self.columns|).
+        """
+
+        for i in range(self.max_retries):
+            before = SEQUENCE.unpack_from(self.mm, SEQUENCE_OFFSET)[0]
+
+            ## Odd: The publisher is writing right now.
+            if ( before & 1 ):
+                continue
+
+            values = self.values.unpack_from(self.mm, self.values_offset)
+
+            if ( SEQUENCE.unpack_from(self.mm, SEQUENCE_OFFSET)[0] == before ):
+                if ( before == 0 ):
+                    return None    # no measurement published, yet
+
+                if ( not struct.unpack_from("=I", self.mm, VALID_OFFSET)[0] ):
+                    raise StaleSegmentError(self.path)
+
+                self.sequence = before
+                return values
+
+        raise RuntimeError("Could not get a consistent snapshot (publisher too busy?)")
+
+
+    def read_dict(self):
+        values = self.read()
+
+        if ( values is None ):
+            return None
+
+        return dict( zip(self.columns, values) )
+
+
+    def get(self, column):
+        return self.read()[ self.index[column] ]
+
+
+    def close(self):
+        self.mm.close()
+
+
+
+## MAIN ##
+if __name__ == "__main__":
+    import sys
+
+    reader = LiveMetricsReader(*sys.argv[1:2])
+    for name, value in zip(reader.columns, reader.read() or ()):
+        print( "{}: {}".format(name, value) )
@@ -12,13 +12,11 @@
 import json
 import time
 import os
-import psutil
-
-## experimental "tcp_probe"
-#import subprocess
-#import signal
+import sys
 
 from history_store import HistoryStore
+from overhead import NO_OVERHEAD
+import backends
 
 
 class LoggingClass:
@@ -32,36 +30,38 @@ class LoggingClass:
 
 
 
-class MeasurementLogger:
-    """
-    Logs the given »Measurements« (derived from two »Readings«) into a JSON-header CSV-body file.
+class MeasurementEncoder:
     """
+    Turns »Measurements« into flat vectors of values, as described by the logging class definitions.
 
-    ## Initialization ##
+    This is the common base of all consumers that need the logging schema (e.g. the »MeasurementLogger«).
+
+    The classes of the optional |collectors| (see »collectors.py«) are logged after the built-in ones,
+    followed by what each of them cost ("CollectorOverhead").
 
-    def __init__(self, num_cpus, nics, begin, system_info, environment, comment, filename):
+    With |classes|, only these classes are encoded (and "Time", which always comes first).
+    """
+
+    def __init__(self, num_cpus, nics, collectors=(), classes=None):
         ## Attributes
         self.num_cpus = num_cpus
         self.nics = nics
-        self.filename = filename
+        self.collectors = collectors
 
         ## Constants / Characteristics
-        self.class_names = ("Time", "CPU", "NIC", "Memory", "Files")
-        self.type_string = "CPUnetLOG:MeasurementLog"
+        self.class_names = ("Time", "CPU", "NIC", "Memory", "Files", "Overhead") + tuple( c.name for c in collectors )
+        if ( collectors ):
+            self.class_names += ("CollectorOverhead",)
 
-        ## Run "outsourced" init functions.
-        self.class_defs = self._init_class_definitions(num_cpus, nics)
+        if ( classes ):
+            unknown = [ c for c in classes if c not in self.class_names ]
+            if ( unknown ):
+                raise ValueError("Unknown logging classes: {} (available: {})".format(", ".join(unknown), ", ".join(self.class_names)))
 
-        self.json_header = self._create_json_header(self.class_names,
-                                                    self.class_defs.values(),
-                                                    self.type_string,
-                                                    begin,
-                                                    system_info,
-                                                    environment,
-                                                    comment)
-
-        self.csv_header = self._create_csv_header(self.json_header)
+            self.class_names = tuple( c for c in self.class_names if c == "Time" or c in classes )
 
+        ## Run "outsourced" init functions.
+        self.class_defs = self._init_class_definitions(num_cpus, nics)
 
         ## Register special logging functions.
         self.log_functions = dict()
@@ -70,14 +70,19 @@ class MeasurementLogger:
         self.log_functions["NIC"] = self._log_nics
         self.log_functions["Memory"] = self._log_memory
         self.log_functions["Files"] = self._log_files
+        self.log_functions["Overhead"] = self._log_overhead
 
+        for c in collectors:
+            self.class_defs[c.name] = c.get_class()
+            self.log_functions[c.name] = lambda measurement, out_vector, collector=c: \
+                                                self._log_collected(collector, measurement, out_vector)
 
-        ## Initialize file writer.
-        self.writer = CNLFileWriter(filename)
-
-        # Write header.
-        self.writer.write_header(self.json_header)
-        self.writer.write_vector(self.csv_header)
+        if ( collectors ):
+            self.class_defs["CollectorOverhead"] = LoggingClass( name        = "CollectorOverhead",
+                                                                 fields      = ("self.read", "self.compute"),
+                                                                 siblings    = [ c.name for c in collectors ],
+                                                                 description = "Overhead of each collector: time spent reading and computing (seconds)" )
+            self.log_functions["CollectorOverhead"] = self._log_collector_overhead
 
 
 
@@ -119,9 +124,174 @@ class MeasurementLogger:
                               description = "Number of open file descriptors (this includes network sockets)" )
         class_defs["Files"] = files
 
+        # set up "Overhead" class
+        overhead = LoggingClass( name        = "Overhead",
+                                 fields      = ("self.cpu_time", "self.rss", "self.read", "self.compute", "self.log", "self.display", "self.jitter", "self.queue"),
+                                 siblings    = None,
+                                 description = "Overhead of CPUnetLOG itself: CPU time (seconds), resident memory (bytes), time spent reading, computing, logging and displaying (seconds; logging and displaying of the previous measurement), deviation from the sampling interval (seconds), rows queued for the log sink" )
+        class_defs["Overhead"] = overhead
+
         return class_defs
 
 
+    def get_classes(self):
+        """
+        Returns the »LoggingClasses« in logging order.
+        """
+
+        return [ self.class_defs[c] for c in self.class_names ]
+
+
+    def get_column_names(self):
+        """
+        Returns the names of the values in the vectors returned by |encode()|. (Same as the CSV-header.)
+        """
+
+        columns = list()
+
+        for c in self.get_classes():
+            if ( c.values["Siblings"] ):
+                for sibling in c.values["Siblings"]:
+                    for field in c.values["Fields"]:
+                        columns.append( ".".join([sibling, field]) )
+            else:
+                columns.extend( c.values["Fields"] )
+
+        return columns
+
+
+
+    ## Logging functions ##
+
+    def _log_time(self, measurement, out_vector):
+        out_vector.extend( [measurement.r1.timestamp, measurement.r2.timestamp, measurement.timespan] )
+
+
+    def _log_cpus(self, measurement, out_vector):
+        for cpu in measurement.cpu_times_percent:
+            cpu_util = 100-cpu.idle
+            other = 100 - sum( (cpu.user, cpu.system, cpu.irq, cpu.softirq, cpu.idle) )
+
+            out_vector.extend( [cpu_util, cpu.idle, cpu.user, cpu.system, cpu.irq, cpu.softirq, other] )
+
+
+    def _log_nics(self, measurement, out_vector):
+        for nic in self.nics:
+            try:
+                values = measurement.net_io[nic]
+
+                out_vector.extend( [values.ratio["bytes_sent"] * 8,    # Bits/s
+                                    values.ratio["bytes_recv"] * 8,    # Bits/s
+                                    values.ratio["packets_sent"],      # Packets/s
+                                    values.ratio["packets_recv"]] )    # Packets/s
+            except KeyError:
+                ## TODO: is 0 a good value to log, in this case?
+                out_vector.extend( (0, 0, 0, 0) )
+
+
+    def _log_memory(self, measurement, out_vector):
+        mem = measurement.memory
+        out_vector.extend( [mem.total, mem.available, mem.used, mem.free, mem.active, mem.inactive, mem.buffers, mem.cached, mem.shared] )
+
+    def _log_files(self, measurement, out_vector):
+        out_vector.extend( [measurement.nb_open_files] )
+
+    def _log_overhead(self, measurement, out_vector):
+        out_vector.extend( getattr(measurement, "overhead", NO_OVERHEAD) )
+
+    def _log_collected(self, collector, measurement, out_vector):
+        ## (Measurements without the values of this collector, e.g. replayed ones, get zeros.)
+        values = getattr(measurement, "collected", dict()).get(collector.name)
+        out_vector.extend( values if values is not None else collector.get_empty() )
+
+
+    def _log_collector_overhead(self, measurement, out_vector):
+        overhead = getattr(measurement, "collector_overhead", dict())
+        for c in self.collectors:
+            out_vector.extend( overhead.get(c.name, (0, 0)) )
+
+
+    def encode(self, measurement):
+        """
+        Returns the values of |measurement| as a flat vector (in the order of the CSV-header).
+        """
+
+        out_vector = list()
+
+        ## Call the specific log-function for each class (in the proper order).
+        for c in self.class_names:
+            self.log_functions[c](measurement, out_vector)
+
+        return out_vector
+
+
+
+class MeasurementLogger(MeasurementEncoder):
+    """
+    Logs the given »Measurements« (derived from two »Readings«) into a JSON-header CSV-body file.
+
+    With |every| > 1, only every |every|-th measurement is logged; or, with |aggregate|, one row per |every|
+    measurements: from the begin of the first to the end of the last, with the (duration-weighted) mean values.
+    (Except for the values that are spent since the last measurement, like the CPU time of the overhead: these
+    are summed up.)
+    (|classes|: see »MeasurementEncoder«.)
+    """
+
+    ## Fields that hold what was spent since the last measurement (not a rate or a level); summed up by |aggregate|
+    PER_SAMPLE_FIELDS = { "Overhead":          ("self.cpu_time", "self.read", "self.compute", "self.log", "self.display"),
+                          "CollectorOverhead": ("self.read", "self.compute") }
+
+
+    ## Initialization ##
+
+    def __init__(self, num_cpus, nics, begin, system_info, environment, comment, filename, writer=None, collectors=(),
+                 classes=None, every=1, aggregate=False):
+        MeasurementEncoder.__init__(self, num_cpus, nics, collectors, classes)
+
+        ## Attributes
+        self.filename = filename
+        self.every = every
+        self.aggregate = aggregate
+
+        # Measurements since the last row; the rows waiting to be aggregated.
+        self.count = 0
+        self.pending = list()
+
+        # Columns to sum up (instead of averaging them).
+        self.summed_columns = set()
+        column = 0
+        for c in self.get_classes():
+            fields = c.values["Fields"]
+            per_sample = self.PER_SAMPLE_FIELDS.get(c.name, ())
+            for sibling in ( c.values["Siblings"] or (None,) ):
+                for field in fields:
+                    if ( field in per_sample ):
+                        self.summed_columns.add(column)
+                    column += 1
+
+        ## Constants / Characteristics
+        self.type_string = "CPUnetLOG:MeasurementLog"
+
+        self.json_header = self._create_json_header(self.class_names,
+                                                    self.class_defs.values(),
+                                                    self.type_string,
+                                                    begin,
+                                                    system_info,
+                                                    environment,
+                                                    comment)
+
+        self.csv_header = self._create_csv_header(self.json_header)
+
+
+        ## Initialize file writer. (Unless another writer, e.g. a »CNLNetworkWriter«, is given.)
+        self.writer = writer if writer else CNLFileWriter(filename)
+
+        # Write header.
+        self.writer.write_header(self.json_header)
+        self.writer.write_vector(self.csv_header)
+
+
+
     ## TODO Move this outside the class?
     def _create_json_header(self, class_names, class_defs, type, begin, system_info, environment, comment):
         top_level = dict()
@@ -172,56 +342,64 @@ class MeasurementLogger:
 
 
 
-    ## Logging functions ##
-
-    def _log_time(self, measurement, out_vector):
-        out_vector.extend( [measurement.r1.timestamp, measurement.r2.timestamp, measurement.timespan] )
-
-
-    def _log_cpus(self, measurement, out_vector):
-        for cpu in measurement.cpu_times_percent:
-            cpu_util = 100-cpu.idle
-            other = 100 - sum( (cpu.user, cpu.system, cpu.irq, cpu.softirq, cpu.idle) )
-
-            out_vector.extend( [cpu_util, cpu.idle, cpu.user, cpu.system, cpu.irq, cpu.softirq, other] )
+    def log(self, measurement):
+        if ( self.every <= 1 ):
+            self.writer.write_vector( self.encode(measurement) )
 
+        elif ( self.aggregate ):
+            self.pending.append( self.encode(measurement) )
+            if ( len(self.pending) >= self.every ):
+                self.writer.write_vector( self._aggregate(self.pending, self.summed_columns) )
+                self.pending = list()
 
-    def _log_nics(self, measurement, out_vector):
-        for nic in self.nics:
-            try:
-                values = measurement.net_io[nic]
-
-                out_vector.extend( [values.ratio["bytes_sent"] * 8,    # Bits/s
-                                    values.ratio["bytes_recv"] * 8,    # Bits/s
-                                    values.ratio["packets_sent"],      # Packets/s
-                                    values.ratio["packets_recv"]] )    # Packets/s
-            except KeyError:
-                ## TODO: is 0 a good value to log, in this case?
-                out_vector.extend( (0, 0, 0, 0) )
+        else:
+            if ( self.count == 0 ):
+                self.writer.write_vector( self.encode(measurement) )
+            self.count = (self.count + 1) % self.every
+
+
+    @staticmethod
+    def _aggregate(rows, summed_columns=()):
+        ## "Time" comes first: begin, end, duration
+        durations = [ row[2] for row in rows ]
+        total = sum(durations)
+        weights = durations if total > 0 else [1] * len(rows)
+        norm = total if total > 0 else len(rows)
+
+        ret = [ rows[0][0], rows[-1][1], total ]
+        for i, column in enumerate( list( zip(*rows) )[3:], 3 ):
+            if ( i in summed_columns ):
+                ret.append( sum(column) )
+            else:
+                ret.append( sum( v * w for v, w in zip(column, weights) ) / norm )
 
+        return ret
 
-    def _log_memory(self, measurement, out_vector):
-        mem = measurement.memory
-        out_vector.extend( [mem.total, mem.available, mem.used, mem.free, mem.active, mem.inactive, mem.buffers, mem.cached, mem.shared] )
 
-    def _log_files(self, measurement, out_vector):
-        out_vector.extend( [measurement.nb_open_files] )
+    def write_event(self, timestamp, text):
+        """
+        Marks an event in the log (as "%% Event: {"Time": ..., "Text": ...}" line, which readers skip).
 
+        Returns False, if the writer can't store events.
+        """
 
-    def log(self, measurement):
-        out_vector = list()
+        if ( not hasattr(self.writer, "write_line") ):
+            return False
 
-        ## Call the specific log-function for each class (in the proper order).
-        for c in self.class_names:
-            self.log_functions[c](measurement, out_vector)
+        self.writer.write_line( "%% Event: " + json.dumps( {"Time": timestamp, "Text": text}, sort_keys=True ) )
 
-        self.writer.write_vector( out_vector )
+        return True
 
 
 
     ## Close ##
 
     def close(self):
+        ## (Partial aggregate at the end.)
+        if ( self.pending ):
+            self.writer.write_vector( self._aggregate(self.pending, self.summed_columns) )
+            self.pending = list()
+
         self.writer.close()
 
 
@@ -273,8 +451,8 @@ class CNLFileWriter:
         self.header_written = True
 
 
-    #def write_line(self, line):
-        #self._write( line + "\n" )
+    def write_line(self, line):
+        self._write( line + "\n" )
 
     def write_vector(self, out_vector):
         line = ", ".join( map(str, out_vector) ) + "\n"
@@ -293,54 +471,91 @@ class CNLFileWriter:
 
 
 
-class LoggingManager:
-    """If path == None, logs will be written to stdout"""
-    def __init__(self, num_cpus, nics, system_info, environment, comment, path, autologging, watch_experiment):
-        self.num_cpus = num_cpus
-        self.nics = nics
-        self.comment = comment
+def is_active(measurement, nics, min_rate=0, min_cpu_util=None):
+    """
+    Activity detection (for auto-logging and adaptive sampling): True, if any of the |nics| sent or received
+    more than |min_rate| bits/s, or (if |min_cpu_util| is given) any CPU was busier than |min_cpu_util| percent.
+    """
+
+    min_bytes = min_rate / 8.0
+
+    for nic in nics or ():
+        try:
+            values = measurement.net_io[nic]
+
+            if ( values.ratio["bytes_sent"] > min_bytes or values.ratio["bytes_recv"] > min_bytes ):
+                return True
+        except KeyError:
+            pass
+
+    if ( min_cpu_util is not None ):
+        for cpu in measurement.cpu_times_percent:
+            if ( 100 - cpu.idle > min_cpu_util ):
+                return True
+
+    return False
+
+
+
+class LogOutput:
+    """
+    One log of the »LoggingManager«, with its own
+      - destination: files in |path|, stdout (path == None), or a |sink| (e.g. a »RemoteSink« or a »SQLiteSink«)
+      - selection of logging |classes| (default: all)
+      - reduction: every |every|-th measurement, or (with |aggregate|) the mean of |every| measurements
+      - auto-logging policy (|autologging|: log only on network activity)
+
+    The shared settings (NICs, comment, environment, ...) are taken from the |manager|.
+    """
+
+    INACTIVITY_THRESHOLD       = 30   # seconds
+    HISTORY_SIZE               = 5    # samples
+
+    def __init__(self, manager, path=None, sink=None, autologging=False, classes=None, every=1, aggregate=False):
+        self.manager = manager
+        self.sink = sink
+        self.classes = classes
+        self.every = every
+        self.aggregate = aggregate
         self.auto_comment = None
-        self.path = path
-        self.system_info = system_info
-        self.hostname = system_info["hostname"]
-        self.environment = environment
-        self.watch_experiment = watch_experiment
 
         # auto-logging
-        self.INACTIVITY_THRESHOLD       = 30   # seconds
-        self.HISTORY_SIZE               = 5    # samples
         self.auto_logging = autologging
         if ( autologging ):
             self.log_history = HistoryStore(self.HISTORY_SIZE)
             self.logging_active = False
             self.inactivity_count = 0
 
-
         # "mkdir" on path, if necessary.
-        if ( path and not os.path.exists(path) ):
-            os.makedirs(path)
-
+        self.set_path(path)
 
         ## Logger.
         self.measurement_logger = None
-        self.measurement_logger_enabled = False
-
 
 
 
     def _start_new_measurement_logger(self, measurement=None):
         assert( not self.measurement_logger )
 
+        manager = self.manager
+
         # find start time
         if ( measurement ):
             t = measurement.get_begin()
         else:
-            t = time.time()
+            t = backends.get_backend().time()
 
         date = time.strftime("%Y-%m-%d_%H:%M:%S", time.localtime(t))
-        if self.path:
+        writer = None
+        if self.sink:
+            # One stream per log, named like a log file.
+            writer = self.sink.open_stream(date + "-" + manager.hostname)
+            filename = writer.filename
+
+            print( "Logging to: " + filename, file=sys.stderr )
+        elif self.path:
             # Create filename from start time.
-            filename_prefix = self.path + "/" + date + "-" + self.hostname
+            filename_prefix = self.path + "/" + date + "-" + manager.hostname
             filename = filename_prefix + ".cnl"
 
             # Make sure the filename is unique.
@@ -349,40 +564,31 @@ class LoggingManager:
                 filename = filename_prefix + "-" + str(i) + ".cnl"
                 i += 1
 
-            ## experimental "tcp_probe"
-            #tcpprobe_filename = filename[:-4] + ".tcpprobe"
-
-            print( "Logging to file: " + filename )
+            print( "Logging to file: " + filename, file=sys.stderr )
         else:
             filename = "/dev/stdout"
 
 
         # Auto-comment: Store the command line of the observed tool/experiment.
-        if ( self.watch_experiment ):
-            self.auto_comment = self._find_cmd_line_of(self.watch_experiment)
-
-        ## Read environment file (if given).
-        if ( self.environment ):
-            with open(self.environment) as f:
+        if ( manager.watch_experiment ):
+            self.auto_comment = manager._find_cmd_line_of(manager.watch_experiment)
+
+        ## Read environment file (if given). (Set via the control socket, it's the environment itself.)
+        if ( isinstance(manager.environment, dict) ):
+            environment = manager.environment
+        elif ( manager.environment ):
+            with open(manager.environment) as f:
                 environment = json.load(f)
         else:
             environment = None
 
 
         # Create Logger.
-        self.measurement_logger = MeasurementLogger(self.num_cpus, self.nics, [date,t],
-                                                    self.system_info, environment,
-                                                    self.auto_comment if self.auto_comment else self.comment,
-                                                    filename)
-
-
-        ## experimental "tcp_probe"
-        ## test if tcp_probe file is readable
-        #PATH_TO_TCP_PROBE = "/proc/net/tcpprobe"
-        #self.use_tcpprobe = os.access(PATH_TO_TCP_PROBE, os.R_OK)
-        #if ( self.use_tcpprobe ):
-            ### start "cat /proc/net/tcpprobe > file" in parallel (and send quit signal, when logging is stopped)
-            #self.tcpprobe = subprocess.Popen("cat " + PATH_TO_TCP_PROBE + " > " + tcpprobe_filename, shell=True, preexec_fn=os.setsid)
+        self.measurement_logger = MeasurementLogger(manager.num_cpus, manager.nics, [date,t],
+                                                    manager.system_info, environment,
+                                                    self.auto_comment if self.auto_comment else manager.comment,
+                                                    filename, writer, manager.collectors,
+                                                    self.classes, self.every, self.aggregate)
 
 
 
@@ -394,23 +600,9 @@ class LoggingManager:
         self.measurement_logger = None
         self.auto_comment = None
 
-        ## experimental "tcp_probe"
-        ## kill "cat /proc/net/tcpprobe > file"
-        #if ( self.use_tcpprobe ):
-            #os.killpg(self.tcpprobe.pid, signal.SIGTERM)
-
 
     def _is_activity_on_nics(self, measurement):
-        for nic in self.nics:
-            try:
-                values = measurement.net_io[nic]
-
-                if ( values.ratio["bytes_sent"] > 0 or values.ratio["bytes_recv"] > 0 ):
-                    return True
-            except KeyError:
-                pass
-
-        return False
+        return is_active(measurement, self.manager.nics)
 
 
 
@@ -420,26 +612,12 @@ class LoggingManager:
 
 
 
-    def _find_cmd_line_of(self, name):
-        hits = list()
-
-        for p in psutil.process_iter():
-            if ( p.name == name ):
-                hits.append( " ".join(p.cmdline) )
-
-        if ( len(hits) > 0 ):
-            return "; ".join(hits)
-            #return hits  ## TODO return a list; maybe introduce field "comments"/"watched_experiments"?
-
-        return None
-
-
     def _auto_logging_transition_to_active(self):
         self.logging_active = True
         self.inactivity_count = 0
 
         ## Create a new measurement logger (if enabled).
-        if ( self.measurement_logger_enabled ):
+        if ( self.manager.measurement_logger_enabled ):
             self._start_new_measurement_logger()
 
         ## Log the new measurement, but also some history.
@@ -466,7 +644,7 @@ class LoggingManager:
 
             ## Inactivity phase too long: Stop logging.
             if ( self.inactivity_count >= self.INACTIVITY_THRESHOLD ):
-                if ( self.measurement_logger_enabled ):
+                if ( self.measurement_logger ):
                     self._stop_measurement_logger()
 
                 self.logging_active = False
@@ -498,13 +676,35 @@ class LoggingManager:
         assert( False )
 
 
-    def enable_measurement_logger(self):
-        self.measurement_logger_enabled = True
+    def start(self):
+        if ( not self.measurement_logger and (not self.auto_logging or self.logging_active) ):
+            self._start_new_measurement_logger()
 
-        if ( not self.auto_logging ):
+
+    def stop(self):
+        if ( self.measurement_logger ):
+            self._stop_measurement_logger()
+
+
+    def new_segment(self):
+        if ( self.measurement_logger ):
+            self._stop_measurement_logger()
             self._start_new_measurement_logger()
 
 
+    def set_path(self, path):
+        if ( path and not os.path.exists(path) ):
+            os.makedirs(path)
+
+        self.path = path
+
+
+    def mark_event(self, timestamp, text):
+        if ( not self.measurement_logger ):
+            return False
+
+        return self.measurement_logger.write_event(timestamp, text)
+
 
     def log(self, measurement):
 
@@ -519,11 +719,7 @@ class LoggingManager:
             return self._auto_logging(measurement)
 
 
-
     def get_logging_state(self):
-        if ( not self.measurement_logger_enabled ):
-            return "Disabled"
-
         # BRANCH: no auto-logging
         if ( not self.auto_logging ):
             return "Enabled"
@@ -539,12 +735,175 @@ class LoggingManager:
                 return "Standby"
 
 
+    def close(self):
+        if ( self.measurement_logger ):
+            self._stop_measurement_logger()
+
+        if ( self.sink ):
+            self.sink.close()
+
+
+
+class LoggingManager:
+    """
+    Feeds all »Measurements« into one or more logs (»LogOutput«), which are enabled and disabled together.
+
+    By default, there's one log: If path == None, it's written to stdout (or to |sink|, if given: e.g. a
+    »RemoteSink« or a »SQLiteSink«). Or |outputs| describes each log (a dict of the keyword arguments of
+    »LogOutput«), e.g. a fast log of a few classes, next to an aggregated log of everything. The first log
+    is the "main" one (its path can be changed, and its state and file are shown).
+
+    The values of the |collectors| (see »collectors.py«) are logged, too.
+    """
+    def __init__(self, num_cpus, nics, system_info, environment, comment, path, autologging, watch_experiment, sink=None,
+                 collectors=(), outputs=None):
+        self.num_cpus = num_cpus
+        self.nics = nics
+        self.collectors = collectors
+        self.comment = comment
+        self.system_info = system_info
+        self.hostname = system_info["hostname"]
+        self.environment = environment
+        self.watch_experiment = watch_experiment
+
+        self.measurement_logger_enabled = False
+
+        ## Logs.
+        if ( not outputs ):
+            outputs = [ dict(path=path, sink=sink, autologging=autologging) ]
+
+        self.outputs = list()
+        for output in outputs:
+            self.add_output(**output)
+
+        self.path = self.outputs[0].path
+
+
+
+    def add_output(self, **kwargs):
+        """
+        Adds a log (see »LogOutput« for the arguments). Raises a ValueError on unknown |classes|,
+        or if the log doesn't fit into its |sink| (see »SQLiteSink.check_columns()«).
+        """
+
+        ## (Check the class selection right away, not only when the log is started.)
+        encoder = MeasurementEncoder(self.num_cpus, self.nics, self.collectors, kwargs.get("classes"))
+
+        sink = kwargs.get("sink")
+        if ( hasattr(sink, "check_columns") ):
+            sink.check_columns( encoder.get_column_names() )
+
+        output = LogOutput(self, **kwargs)
+        self.outputs.append(output)
+
+        if ( self.measurement_logger_enabled ):
+            output.start()
+
+        return output
+
+
+
+    def _find_cmd_line_of(self, name):
+        import psutil
+
+        hits = list()
+
+        for p in psutil.process_iter():
+            if ( p.name == name ):
+                hits.append( " ".join(p.cmdline) )
+
+        if ( len(hits) > 0 ):
+            return "; ".join(hits)
+            #return hits  ## TODO return a list; maybe introduce field "comments"/"watched_experiments"?
+
+        return None
+
+
+    def enable_measurement_logger(self):
+        if ( self.measurement_logger_enabled ):
+            return
+
+        self.measurement_logger_enabled = True
+
+        for output in self.outputs:
+            output.start()
+
+
+    def disable_measurement_logger(self):
+        self.measurement_logger_enabled = False
+
+        for output in self.outputs:
+            output.stop()
+
+
+    def new_segment(self):
+        """
+        Continues the current logs (if any) in a new segment, whose header reflects the current settings
+        (comment, environment, NICs, path).
+        """
+
+        for output in self.outputs:
+            output.new_segment()
+
+
+    def set_path(self, path):
+        ## (Only the main log.)
+        self.outputs[0].set_path(path)
+        self.path = path
+
+
+    def mark_event(self, text, timestamp=None):
+        """
+        Marks an event (at |timestamp|, default: now) in the current logs. Returns False, if nothing is being logged.
+        """
+
+        if ( timestamp is None ):
+            timestamp = backends.get_backend().time()
+
+        return any( [ output.mark_event(timestamp, text) for output in self.outputs ] )
+
+
+
+    def log(self, measurement):
+        running = True
+
+        for output in self.outputs:
+            running &= output.log(measurement)
+
+        return running
+
+
+
+    def get_logging_state(self):
+        if ( not self.measurement_logger_enabled ):
+            return "Disabled"
+
+        return self.outputs[0].get_logging_state()
+
+
     def get_logging_comment(self):
-        return self.auto_comment if self.auto_comment else self.comment
+        main = self.outputs[0]
+        return main.auto_comment if main.auto_comment else self.comment
 
 
+    def get_filenames(self):
+        """
+        Returns the files (or streams) that are currently logged to.
+        """
 
-    def close(self):
-        if ( self.measurement_logger ):
-            self._stop_measurement_logger()
+        return [ output.measurement_logger.filename for output in self.outputs if output.measurement_logger ]
+
+
+    def get_sinks(self):
+        return [ output.sink for output in self.outputs if output.sink ]
 
+
+    def get_queue_depth(self):
+        ## Rows queued in all sinks (see »OverheadMonitor«).
+        return sum( sink.get_queue_depth() for sink in self.get_sinks() )
+
+
+
+    def close(self):
+        for output in self.outputs:
+            output.close()
@@ -0,0 +1,544 @@
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Streaming of »CNL« logs to a remote collector (see »cnl_collector.py«).
+
+Each log (segment) is a "stream", identified by a name like "<date>-<hostname>".
+All streams of one »cpunetlog« instance share a single connection (TCP or UDP).
+
+Wire format: Every message is a frame of
+  - 4 byte length (network byte order) of the rest of the frame
+  - 1 byte type: H (JSON header + CSV header), D (a batch of CSV lines), E (end of stream)
+  - the stream name, terminated by "\\n"
+  - the body (UTF-8 text, exactly as it would appear in a ».cnl« file)
+
+Each frame is sent once, except the one that is being sent when the connection fails: It is sent again
+after reconnecting (from the spool), i.e. at least once. (Frames that the kernel accepted shortly before
+a connection failure may still be lost: There are no acknowledgements.)
+'''
+
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+
+
+FRAME_LENGTH = struct.Struct("!I")
+
+TYPE_HEADER = b"H"
+TYPE_DATA = b"D"
+TYPE_END = b"E"
+
+## Keep UDP datagrams well below the maximum payload size.
+MAX_DATAGRAM_SIZE = 60000
+
+
+
+def parse_url(url):
+    """
+    Parses "tcp://host:port" or "udp://host:port" into (protocol, (host, port)).
+    """
+
+    protocol, sep, address = url.partition("://")
+    if ( not sep or protocol not in ("tcp", "udp") ):
+        raise ValueError("Invalid collector URL (expected tcp://host:port or udp://host:port): " + url)
+
+    host, sep, port = address.rpartition(":")
+    if ( not sep ):
+        raise ValueError("Invalid collector URL (port missing): " + url)
+
+    return protocol, (host.strip("[]"), int(port))
+
+
+def encode_frame(frame_type, stream, body):
+    payload = frame_type + stream.encode("utf-8") + b"\n" + body
+
+    return FRAME_LENGTH.pack(len(payload)) + payload
+
+
+def decode_frames(buffer):
+    """
+    Splits all complete frames off |buffer|.
+
+    Returns a list of (type, stream, body) and the remaining (incomplete) bytes.
+    """
+
+    frames = list()
+    pos = 0
+
+    while ( len(buffer) - pos >= FRAME_LENGTH.size ):
+        length = FRAME_LENGTH.unpack_from(buffer, pos)[0]
+        end = pos + FRAME_LENGTH.size + length
+        if ( end > len(buffer) ):
+            break
+
+        payload = buffer[pos + FRAME_LENGTH.size : end]
+        stream, _, body = payload[1:].partition(b"\n")
+        frames.append( (payload[0:1], stream.decode("utf-8"), body) )
+
+        pos = end
+
+    return frames, buffer[pos:]
+
+
+def _count_rows(frame):
+    """ Returns the number of CSV lines in an encoded frame. """
+
+    if ( frame[FRAME_LENGTH.size:FRAME_LENGTH.size+1] != TYPE_DATA ):
+        return 0
+
+    ## (The first "\n" terminates the stream name.)
+    return frame.count(b"\n", FRAME_LENGTH.size) - 1
+
+
+def _frame_info(frame):
+    """ Returns (type, stream) of an encoded frame. """
+
+    payload = frame[FRAME_LENGTH.size:]
+    stream = payload[1:].partition(b"\n")[0]
+
+    return payload[0:1], stream.decode("utf-8")
+
+
+
+class Spool:
+    """
+    A bounded on-disk queue of encoded frames.
+
+    Frames are appended to segment files. If |max_bytes| is exceeded, the oldest segments are dropped.
+    """
+
+    def __init__(self, path, max_bytes, segment_size=1024*1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.segment_size = segment_size
+
+        self.dropped_bytes = 0
+
+        if ( not os.path.exists(path) ):
+            os.makedirs(path)
+
+        ## Continue with the segments of a previous run (if any).
+        self.segments = sorted( int(name[:-6]) for name in os.listdir(path) if name.endswith(".spool") )
+        self.total_bytes = sum( os.path.getsize(self._filename(s)) for s in self.segments )
+
+
+    def _filename(self, segment):
+        return os.path.join(self.path, "{:012d}.spool".format(segment))
+
+
+    def append(self, frames):
+        data = b"".join(frames)
+
+        ## Start a new segment, if necessary.
+        if ( not self.segments or os.path.getsize(self._filename(self.segments[-1])) >= self.segment_size ):
+            self.segments.append( self.segments[-1] + 1 if self.segments else 0 )
+
+        with open(self._filename(self.segments[-1]), "ab") as f:
+            f.write(data)
+        self.total_bytes += len(data)
+
+        ## Enforce the size limit. (The current segment is kept in any case.)
+        while ( self.total_bytes > self.max_bytes and len(self.segments) > 1 ):
+            segment = self.segments.pop(0)
+            size = os.path.getsize(self._filename(segment))
+            os.remove(self._filename(segment))
+
+            self.total_bytes -= size
+            self.dropped_bytes += size
+
+
+    def is_empty(self):
+        return len(self.segments) == 0
+
+
+    def peek(self):
+        """
+        Returns the frames of the oldest segment. (Call |consume()| once they are delivered.)
+        """
+
+        with open(self._filename(self.segments[0]), "rb") as f:
+            data = f.read()
+
+        frames = list()
+        pos = 0
+        while ( pos < len(data) ):
+            end = pos + FRAME_LENGTH.size + FRAME_LENGTH.unpack_from(data, pos)[0]
+            frames.append( data[pos:end] )
+            pos = end
+
+        return frames
+
+
+    def consume(self, count):
+        """
+        Removes the first |count| frames of the oldest segment (see |peek()|), once they are delivered.
+
+        (The header frames are kept, so that the rest of the segment stays self-contained. The collector
+        ignores the headers of streams it knows.)
+        """
+
+        frames = self.peek()
+        if ( count >= len(frames) ):
+            self.pop()
+            return
+
+        filename = self._filename(self.segments[0])
+        old_size = os.path.getsize(filename)
+
+        data = b"".join( [ f for f in frames[:count] if _frame_info(f)[0] == TYPE_HEADER ] + frames[count:] )
+        with open(filename + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(filename + ".tmp", filename)
+
+        self.total_bytes += len(data) - old_size
+
+
+    def pop(self):
+        segment = self.segments.pop(0)
+        self.total_bytes -= os.path.getsize(self._filename(segment))
+        os.remove(self._filename(segment))
+
+
+
+class RemoteSink:
+    """
+    Sends »CNL« streams to a remote collector, from a background thread.
+
+    Rows are queued without blocking, batched and sent either every |batch_size| rows or every |flush_interval| seconds.
+    While the collector is unreachable, batches are spooled to disk (if a |spool_path| is given),
+    and re-sent after reconnecting (with exponential backoff).
+    """
+
+    def __init__(self, url, spool_path=None, spool_size=64*1024*1024,
+                 batch_size=100, flush_interval=1.0, queue_size=10000):
+        self.url = url
+        self.protocol, self.address = parse_url(url)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        ## Backoff
+        self.MIN_BACKOFF = 0.5     # seconds
+        self.MAX_BACKOFF = 30      # seconds
+        self.HEADER_REPEAT = 10    # seconds (UDP only, in case the collector missed it)
+
+        ## (Only data rows count towards |queue_size|, see |enqueue()|.)
+        self.queue = queue.Queue()
+        self.queue_size = queue_size
+        self.spool = Spool(spool_path, spool_size) if spool_path else None
+
+        self.sock = None
+        self.backoff = 0
+        self.next_connect = 0
+        self.last_header_time = 0
+
+        ## Header frames of all streams that are not finished, yet.
+        self.headers = dict()
+        self.spooled_headers = set()
+
+        ## Rows waiting for the next batch: (stream, line, enqueue-time)
+        self.pending = list()
+
+        ## Statistics (of the sender thread; the rows dropped by a full queue are counted by the sampling thread)
+        self.stats = dict.fromkeys( ("rows_sent", "bytes_sent", "frames_sent", "rows_spooled", "rows_unspooled",
+                                     "rows_dropped", "reconnects", "latency_sum", "latency_max"), 0 )
+        self.rows_dropped_queue = 0
+
+        self.thread = threading.Thread(target=self._run, name="cpunetlog-remote-sink")
+        self.thread.daemon = True
+        self.thread.start()
+
+
+
+    ## Interface (sampling thread) ##
+
+    def open_stream(self, stream):
+        return CNLNetworkWriter(self, stream)
+
+
+    def enqueue(self, item):
+        """
+        Queues |item| for the sender thread. Never blocks: If the queue is full, the data row is dropped.
+        (Headers and ends of streams are always queued, so that no stream is left without them.)
+        """
+
+        if ( item[0] == TYPE_DATA and self.queue.qsize() >= self.queue_size ):
+            self.rows_dropped_queue += 1
+            return
+
+        self.queue.put_nowait(item)
+
+
+    def get_queue_depth(self):
+        return self.queue.qsize() + len(self.pending)
+
+
+    def get_stats(self):
+        """
+        Returns throughput and latency counters. (Latencies are measured from queuing till sending or spooling,
+        in seconds.)
+
+        Each row is counted once: as sent, spooled or dropped. Spooled rows that are delivered later are
+        counted as "rows_unspooled", too.
+        """
+
+        ret = dict(self.stats)
+        ret["rows_dropped"] += self.rows_dropped_queue
+        latency_sum = ret.pop("latency_sum")
+        handled = ret["rows_sent"] + ret["rows_spooled"]
+        ret["latency_avg"] = latency_sum / handled if handled else 0
+        ret["connected"] = self.sock is not None
+        ret["queue_depth"] = self.get_queue_depth()
+        ret["spool_bytes"] = self.spool.total_bytes if self.spool else 0
+        ret["spool_dropped_bytes"] = self.spool.dropped_bytes if self.spool else 0
+
+        return ret
+
+
+    def close(self, timeout=5):
+        """
+        Flushes all queued rows (to the collector, or to the spool) and stops the sender thread.
+        """
+
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+
+        self.thread.join(timeout)
+
+
+
+    ## Sender thread ##
+
+    def _run(self):
+        while True:
+            ## Wait for the next item, but not longer than the oldest pending row may wait.
+            if ( self.pending ):
+                timeout = max(self.pending[0][2] + self.flush_interval - time.time(), 0)
+            else:
+                timeout = self.flush_interval
+
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+
+            ## Shutdown.
+            if ( item is None ):
+                self._flush()
+                self._disconnect()
+                return
+
+            ## Timeout.
+            if ( item is False ):
+                self._flush()
+
+            ## Header
+            elif ( item[0] == TYPE_HEADER ):
+                frame = encode_frame(TYPE_HEADER, item[1], item[2])
+                self.headers[item[1]] = frame
+                self._transmit([frame], 0)
+
+            ## Data
+            elif ( item[0] == TYPE_DATA ):
+                self.pending.append( item[1:] )
+
+                if ( len(self.pending) >= self.batch_size ):
+                    self._flush()
+
+            ## End of stream
+            elif ( item[0] == TYPE_END ):
+                self._flush()
+                self._transmit([encode_frame(TYPE_END, item[1], b"")], 0)
+
+            ## UDP: Repeat the headers every now and then.
+            if ( self.protocol == "udp" and self.sock and time.time() - self.last_header_time > self.HEADER_REPEAT ):
+                self._send_headers()
+
+
+    def _flush(self):
+        """
+        Packs the pending rows into data frames and transmits them.
+        """
+
+        if ( not self.pending ):
+            return
+
+        frames = list()
+        now = time.time()
+
+        ## One frame per run of rows of the same stream (and below the datagram size).
+        stream = None
+        lines = list()
+        size = 0
+        for row_stream, line, t in self.pending:
+            if ( row_stream != stream or size + len(line) > MAX_DATAGRAM_SIZE ):
+                if ( lines ):
+                    frames.append( encode_frame(TYPE_DATA, stream, b"".join(lines)) )
+                stream = row_stream
+                lines = list()
+                size = 0
+
+            lines.append(line)
+            size += len(line)
+
+            latency = now - t
+            self.stats["latency_sum"] += latency
+            self.stats["latency_max"] = max(self.stats["latency_max"], latency)
+
+        frames.append( encode_frame(TYPE_DATA, stream, b"".join(lines)) )
+
+        self._transmit(frames, len(self.pending))
+        self.pending = list()
+
+
+    def _transmit(self, frames, num_rows):
+        """
+        Sends |frames| to the collector, or spools them, if it is unreachable.
+        """
+
+        if ( not self.sock and time.time() >= self.next_connect ):
+            self._connect()
+
+        if ( self.sock ):
+            try:
+                self._send(frames)
+                self.stats["rows_sent"] += num_rows
+                return
+            except OSError:
+                self._disconnect()
+                self._schedule_reconnect()
+
+        ## Spool (or drop).
+        if ( self.spool ):
+            ## Keep the spool self-contained (e.g., across restarts): Spool the header of each stream once.
+            headers = list()
+            for frame in frames:
+                stream = _frame_info(frame)[1]
+                if ( stream not in self.spooled_headers and stream in self.headers ):
+                    headers.append( self.headers[stream] )
+                    self.spooled_headers.add(stream)
+
+            self.spool.append(headers + frames)
+            self.stats["rows_spooled"] += num_rows
+        else:
+            self.stats["rows_dropped"] += num_rows
+
+
+    def _send(self, frames):
+        if ( self.protocol == "tcp" ):
+            self.sock.sendall( b"".join(frames) )
+        else:
+            for frame in frames:
+                self.sock.send(frame)
+
+        for frame in frames:
+            self.stats["frames_sent"] += 1
+            self.stats["bytes_sent"] += len(frame)
+
+            ## Finished streams don't need their header anymore.
+            frame_type, stream = _frame_info(frame)
+            if ( frame_type == TYPE_END ):
+                self.headers.pop(stream, None)
+
+
+    def _send_headers(self):
+        self._send( list(self.headers.values()) )
+        self.last_header_time = time.time()
+
+
+    def _connect(self):
+        try:
+            if ( self.protocol == "tcp" ):
+                self.sock = socket.create_connection(self.address, timeout=5)
+            else:
+                self.sock = socket.socket(socket.AF_INET6 if ":" in self.address[0] else socket.AF_INET, socket.SOCK_DGRAM)
+                self.sock.connect(self.address)
+
+            self.stats["reconnects"] += 1
+
+            ## (Re-)announce all open streams, then deliver the spooled frames (in order).
+            self._send_headers()
+
+            while ( self.spool and not self.spool.is_empty() ):
+                self._send_spooled( self.spool.peek() )
+
+            self.spooled_headers = set()
+
+            self.backoff = 0
+
+        except OSError:
+            self._disconnect()
+            self._schedule_reconnect()
+
+
+    def _send_spooled(self, frames):
+        ## Frame by frame: After a failure, only the frames that were not sent stay in the spool.
+        sent = 0
+        try:
+            for frame in frames:
+                self._send([frame])
+                sent += 1
+        finally:
+            self.stats["rows_unspooled"] += sum( _count_rows(f) for f in frames[:sent] )
+            self.spool.consume(sent)
+
+
+    def _schedule_reconnect(self):
+        self.backoff = min( max(self.backoff * 2, self.MIN_BACKOFF), self.MAX_BACKOFF )
+        self.next_connect = time.time() + self.backoff
+
+
+    def _disconnect(self):
+        if ( self.sock ):
+            self.sock.close()
+            self.sock = None
+
+
+
+class CNLNetworkWriter:
+    """
+    Counterpart of the »CNLFileWriter« that sends the log to a »RemoteSink« instead of writing a file.
+    (Same usage.)
+    """
+
+    def __init__(self, sink, stream):
+        self.sink = sink
+        self.stream = stream
+        self.filename = sink.url + "/" + stream
+
+        self.json_header = None
+        self.header_written = False
+
+
+    def write_header(self, header_dict):
+        self.json_header = json.dumps(header_dict, sort_keys=True, indent=4)
+
+
+    def write_vector(self, out_vector):
+        line = ", ".join( map(str, out_vector) ) + "\n"
+
+        ## The first vector after the JSON header is the CSV header. Both are sent together.
+        if ( not self.header_written ):
+            body = self.json_header + "\n" + line
+            self.sink.enqueue( (TYPE_HEADER, self.stream, body.encode("utf-8")) )
+            self.header_written = True
+        else:
+            self.sink.enqueue( (TYPE_DATA, self.stream, line.encode("utf-8"), time.time()) )
+
+
+    def close(self):
+        self.sink.enqueue( (TYPE_END, self.stream) )
@@ -0,0 +1,107 @@
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Self-overhead of »cpunetlog«: What it costs to take (and process) each »Measurement«.
+
+The »OverheadMonitor« is fed by lightweight timers around the phases of the main loop, and attaches
+an »Overhead« to each measurement, which is logged as the class "Overhead".
+
+Note: Reading and computing refer to the measurement itself, while logging and displaying can only
+be known afterwards. Thus these refer to the previous measurement.
+'''
+
+import os
+import time
+
+from collections import namedtuple
+
+
+## Fields (in logging order)
+#   cpu_time:  CPU time (user + system, in seconds) of this process since the last measurement
+#   rss:       resident memory (bytes)
+#   read, compute, log, display:  time spent in these phases (seconds)
+#   jitter:    deviation of the measurement's timespan from the sampling interval (seconds)
+#   queue:     rows waiting in the queue of the log sink (if any)
+Overhead = namedtuple("Overhead", ("cpu_time", "rss", "read", "compute", "log", "display", "jitter", "queue"))
+
+NO_OVERHEAD = Overhead(0, 0, 0, 0, 0, 0, 0, 0)
+
+
+def _get_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int( f.read().split()[1] ) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+
+class OverheadMonitor:
+    """
+    Collects the phase timings of the main loop.
+
+    Usage:
+      - Constructor( sampling interval, queue_depth )    (|queue_depth| is a function, or None)
+      - Loop:
+          - begin()  /  end( phase )    (around each phase: "next", "log", "display")
+          - sample( source, measurement )  -->  »Overhead«
+    """
+
+    def __init__(self, interval=None, queue_depth=None):
+        self.interval = interval
+        self.queue_depth = queue_depth
+
+        self.started = 0
+        self.phases = dict.fromkeys( ("next", "log", "display"), 0.0 )
+
+        self.last_cpu_time = time.process_time()
+
+
+    def begin(self):
+        self.started = time.perf_counter()
+
+    def end(self, phase):
+        self.phases[phase] += time.perf_counter() - self.started
+
+
+    def sample(self, source, measurement):
+        """
+        Returns the »Overhead« of |measurement| (taken from |source|), and restarts all phase timers.
+        """
+
+        cpu_time = time.process_time()
+
+        ## The source may know how its time splits into reading and computing.
+        read = getattr(source, "read_time", None)
+        if ( read is None ):
+            read = self.phases["next"]
+            compute = 0
+        else:
+            compute = source.compute_time
+
+        ## ... and which interval preceded this measurement (it may vary, see »AdaptiveSampler«).
+        interval = getattr(source, "last_interval", None) or self.interval
+
+        ret = Overhead( cpu_time = cpu_time - self.last_cpu_time,
+                        rss = _get_rss(),
+                        read = read,
+                        compute = compute,
+                        log = self.phases["log"],
+                        display = self.phases["display"],
+                        jitter = measurement.timespan - interval if interval else 0,
+                        queue = self.queue_depth() if self.queue_depth else 0 )
+
+        self.last_cpu_time = cpu_time
+        for phase in self.phases:
+            self.phases[phase] = 0.0
+
+        return ret
@@ -0,0 +1,210 @@
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Built-in profiling of the main loop, for a bounded time window.
+
+Modes:
+  - "cprofile": deterministic profile (»cProfile«), written as ».pstats« (see »python3 -m pstats«)
+  - "sample":   sampling profiler (a thread that records the main thread's stack every few milliseconds),
+                written as collapsed stacks (».collapsed«, e.g. for flamegraph.pl or speedscope)
+
+Optionally, »tracemalloc« reports the top allocation sites of each sample (».tracemalloc.txt«).
+
+A profiling window can also be started (and stopped) with SIGUSR1, without restarting.
+'''
+
+import cProfile
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+
+class SamplingProfiler:
+    """
+    Records the stack of |thread_id| every |interval| seconds, as collapsed stacks ("outer;...;inner count").
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+
+        self.stacks = dict()
+        self.running = False
+        self.thread = None
+
+    def _run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+
+            stack = list()
+            while frame:
+                code = frame.f_code
+                stack.append( "{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno) )
+                frame = frame.f_back
+
+            if ( stack ):
+                key = ";".join( reversed(stack) )
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+            time.sleep(self.interval)
+
+    def enable(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="cpunetlog-sampling-profiler")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def disable(self):
+        self.running = False
+        self.thread.join()
+
+    def dump_stats(self, filename):
+        with open(filename, "w") as f:
+            for stack, count in sorted( self.stacks.items(), key=lambda item: -item[1] ):
+                f.write( "{} {}\n".format(stack, count) )
+
+
+
+class Profiler:
+    """
+    Profiles the main loop for (at most) |duration| seconds per window.
+
+    Output files are named "<prefix>-profile-<N>.<ext>".
+
+    Usage:
+      - Constructor( prefix, mode, duration, tracemalloc_top )
+      - install_signal_handler()   (optional: SIGUSR1 toggles profiling)
+      - start()                    (optional: profile right from the beginning)
+      - Loop (in the main loop):
+          - tick()
+      - stop()
+    """
+
+    def __init__(self, prefix, mode="cprofile", duration=60, tracemalloc_top=0, verbose=False):
+        if ( mode not in ("cprofile", "sample") ):
+            raise ValueError("Unknown profiling mode (expected 'cprofile' or 'sample'): " + mode)
+
+        self.prefix = prefix
+        self.mode = mode
+        self.duration = duration
+        self.tracemalloc_top = tracemalloc_top
+        self.verbose = verbose
+
+        self.profile = None
+        self.started = None
+        self.window = 0
+
+        self.toggle_requested = False
+
+        ## tracemalloc
+        self.snapshot = None
+        self.tracemalloc_file = None
+
+
+    def install_signal_handler(self, signum=signal.SIGUSR1):
+        signal.signal(signum, self._on_signal)
+
+    def _on_signal(self, signum, frame):
+        ## (Only flag it here; the main loop starts/stops the profiler in |tick()|.)
+        self.toggle_requested = True
+
+
+    def is_active(self):
+        return self.profile is not None
+
+
+    def _filename(self, extension):
+        return "{}-profile-{}.{}".format(self.prefix, self.window, extension)
+
+
+    def start(self):
+        if ( self.profile ):
+            return
+
+        self.window += 1
+
+        if ( self.mode == "cprofile" ):
+            self.profile = cProfile.Profile()
+        else:
+            self.profile = SamplingProfiler( threading.get_ident() )
+
+        if ( self.tracemalloc_top ):
+            tracemalloc.start()
+            self.snapshot = tracemalloc.take_snapshot()
+            self.tracemalloc_file = open( self._filename("tracemalloc.txt"), "w" )
+
+        self.started = time.time()
+        self.profile.enable()
+
+        if ( self.verbose ):
+            print( "Profiling started ({}, {}s).".format(self.mode, self.duration) )
+
+
+    def stop(self):
+        if ( not self.profile ):
+            return
+
+        self.profile.disable()
+
+        filename = self._filename( "pstats" if self.mode == "cprofile" else "collapsed" )
+        self.profile.dump_stats(filename)
+        self.profile = None
+
+        if ( self.tracemalloc_file ):
+            self.tracemalloc_file.close()
+            self.tracemalloc_file = None
+            self.snapshot = None
+            tracemalloc.stop()
+
+        if ( self.verbose ):
+            print( "Profile written to: " + filename )
+
+
+    def _report_allocations(self):
+        """
+        Appends the top allocation sites since the last sample to the tracemalloc report.
+        """
+
+        ## (Without the allocations of the profiling itself.)
+        snapshot = tracemalloc.take_snapshot().filter_traces( (tracemalloc.Filter(False, tracemalloc.__file__),
+                                                               tracemalloc.Filter(False, __file__)) )
+        stats = snapshot.compare_to(self.snapshot, "lineno")
+        self.snapshot = snapshot
+
+        f = self.tracemalloc_file
+        f.write( "## {:.3f}  (traced: {} bytes, peak: {} bytes)\n".format( time.time(), *tracemalloc.get_traced_memory() ) )
+        for stat in stats[:self.tracemalloc_top]:
+            f.write( "{}\n".format(stat) )
+        f.write( "\n" )
+
+
+    def tick(self):
+        """
+        Called once per iteration of the main loop.
+        """
+
+        if ( self.toggle_requested ):
+            self.toggle_requested = False
+            if ( self.profile ):
+                self.stop()
+            else:
+                self.start()
+
+        if ( self.profile ):
+            if ( self.tracemalloc_file ):
+                self._report_allocations()
+
+            if ( self.duration and time.time() - self.started >= self.duration ):
+                self.stop()
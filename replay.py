@@ -0,0 +1,217 @@
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Replay of recorded ».cnl« logs.
+
+The rows of a log are turned back into »Measurement«-like objects, so that they can be fed into
+the same display, logging and exporter code as live measurements.
+'''
+
+import time
+from collections import namedtuple
+
+from cnl_reader import CNLFileReader
+
+
+## Same fields as in the log. (»psutil« would give more, but they are not recorded.)
+RecordedCpuTimesPercent = namedtuple("cpupercent", ("user", "system", "irq", "softirq", "idle", "other"))
+
+MEMORY_FIELDS = ("total", "available", "used", "free", "active", "inactive", "buffers", "cached", "shared")
+RecordedMemory = namedtuple("svmem", MEMORY_FIELDS)
+
+
+def parse_speed(speed):
+    """
+    Parses a replay speed like "10x", "0.5" or "max" (as fast as possible, returned as 0).
+    """
+
+    if ( speed == "max" ):
+        return 0
+
+    return float( speed.rstrip("x") )
+
+
+
+class RecordedReading:
+    """ Stand-in for a »Reading«. Raw counters are not recorded, thus |cpu_times| and |net_io| are None. """
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+        self.cpu_times = None
+        self.net_io = None
+
+
+class RecordedTraffic:
+    """ Stand-in for »NetworkTraffic«. """
+
+    def __init__(self, send, receive, send_pps, receive_pps, timespan):
+        self.ratio = { "bytes_sent": send / 8,
+                       "bytes_recv": receive / 8,
+                       "packets_sent": send_pps,
+                       "packets_recv": receive_pps }
+
+        self.total = dict( (field, value * timespan) for field, value in self.ratio.items() )
+
+
+class RecordedMeasurement:
+    """ Stand-in for a »Measurement«, created from one row of a log. """
+
+    def __init__(self, row, layout):
+        begin, end, duration, cpus, nics, memory, files = layout
+
+        self.r1 = RecordedReading( row[begin] )
+        self.r2 = RecordedReading( row[end] )
+        self.timespan = row[duration]
+
+        self.cpu_times_percent = [ RecordedCpuTimesPercent(*[ row[i] for i in cpu ]) for cpu in cpus ]
+        self.net_io = dict( (nic, RecordedTraffic(*([ row[i] for i in cols ] + [self.timespan]))) for nic, cols in nics )
+        self.memory = RecordedMemory(*[ row[i] if i is not None else 0 for i in memory ])
+        self.nb_open_files = row[files] if files is not None else 0
+
+    def get_begin(self):
+        return self.r1.timestamp
+
+    def get_end(self):
+        return self.r2.timestamp
+
+
+
+class Replay:
+    """
+    Source of »RecordedMeasurements«, paced according to the recorded time (scaled by |speed|).
+
+    Usage (same as the live sampler):
+      - start()
+      - Loop:
+          - next()   (returns None at the end)
+          - wait()
+    """
+
+    def __init__(self, filename, speed=1, start=None, pause_at_end=False):
+        self.reader = CNLFileReader(filename)
+        self.speed = speed
+        self.start_time = start
+        self.pause_at_end = pause_at_end
+
+        ## Steps for seeking/changing the speed with the keyboard.
+        self.SEEK_STEP = 60   # seconds
+
+        self.system_info = self.reader.header["General"]["SystemInfo"]
+        self.num_cpus = len(self.reader.class_definitions["CPU"]["Siblings"])
+        self.nics = list(self.reader.class_definitions["NIC"]["Siblings"])
+        self.layout = self._init_layout()
+
+        self.rows = None
+        self.last = None
+        self.paused = False
+
+        ## Pacing: (wall clock, recorded time) of the last synchronization point.
+        self.sync = None
+
+
+    def _init_layout(self):
+        """
+        Pre-computes the column indices of all values of a »RecordedMeasurement«.
+        """
+
+        index = self.reader.index
+
+        cpus = [ [ index[cpu + "." + field] for field in ("usr", "system", "irq", "softirq", "idle", "other") ]
+                    for cpu in self.reader.class_definitions["CPU"]["Siblings"] ]
+        nics = [ (nic, [ index[nic + "." + field] for field in ("send", "receive", "send_pps", "receive_pps") ])
+                    for nic in self.nics ]
+        memory = [ index.get("mem." + field) for field in MEMORY_FIELDS ]
+
+        return index["begin"], index["end"], index["duration"], cpus, nics, memory, index.get("fd.open")
+
+
+    ## Source interface ##
+
+    def start(self):
+        self.seek(self.start_time)
+
+
+    def seek(self, timestamp):
+        offset = self.reader.find_time(timestamp) if timestamp is not None else None
+
+        self.rows = self.reader.rows(offset)
+        self.sync = None
+
+
+    def next(self):
+        ## A paused replay repeats the last measurement.
+        if ( self.paused and self.last ):
+            return self.last
+
+        row = next(self.rows, None)
+
+        if ( row is None ):
+            if ( self.pause_at_end and self.last ):
+                self.paused = True
+                return self.last
+
+            return None
+
+        self.last = RecordedMeasurement(row, self.layout)
+
+        return self.last
+
+
+    def wait(self):
+        if ( self.paused ):
+            time.sleep(0.1)
+            self.sync = None
+            return
+
+        if ( not self.speed or not self.last ):
+            return
+
+        ## Sleep until the recorded end of the last measurement is due (relative to the last sync point).
+        now = time.time()
+        if ( not self.sync ):
+            self.sync = (now, self.last.get_begin())
+
+        due = self.sync[0] + (self.last.get_end() - self.sync[1]) / self.speed
+        if ( due > now ):
+            time.sleep(due - now)
+
+
+
+    ## Interactive control ##
+
+    def handle_key(self, key):
+        """
+        Space: pause/resume;  "<"/">": seek backward/forward;  "["/"]": slower/faster
+        """
+
+        if ( key == ord(" ") ):
+            self.paused = not self.paused
+
+        elif ( key in (ord("<"), ord(">")) and self.last ):
+            step = self.SEEK_STEP if key == ord(">") else -self.SEEK_STEP
+            self.seek( self.last.get_end() + step )
+            if ( self.paused ):
+                self.last = None
+
+        elif ( key == ord("[") and self.speed ):
+            self.speed /= 2
+            self.sync = None
+
+        elif ( key == ord("]") and self.speed ):
+            self.speed *= 2
+            self.sync = None
+
+
+    def get_state(self):
+        speed = "{:g}x".format(self.speed) if self.speed else "max"
+
+        return "Replay {}{}".format(speed, " [paused]" if self.paused else "")
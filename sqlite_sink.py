@@ -0,0 +1,367 @@
+# -*- coding:utf-8 -*-
+
+# Copyright (c) 2014,
+# Karlsruhe Institute of Technology, Institute of Telematics
+#
+# This code is provided under the BSD 2-Clause License.
+# Please refer to the LICENSE.txt file for further information.
+#
+# Author: Mario Hock
+
+
+'''
+Writes »CNL« logs into a local SQLite database (instead of ».cnl« files).
+
+Every log (segment) is a row in the table "logs" (with its JSON header). The measurements go into
+  - "wide" layout:   table "measurements" (log_id, host, begin, end, duration, <one column per CSV column>)
+                     (Columns of new CPUs/NICs are added on the fly.)
+  - "narrow" layout: table "samples" (log_id, time, series_id, value), with the series names in
+                     table "series" and the view "samples_named" (log_id, host, time, series, value).
+                     ("time" is the end of the measurement.)
+
+The wide table is indexed on time and on (host, time). The narrow one is only indexed on (time, log_id);
+its host is resolved via the (indexed) "logs" table, since with ~2000 values per measurement, every
+index on "samples" costs a considerable share of the insert rate.
+
+All database work happens in a dedicated writer thread: Rows are queued without blocking and inserted
+in batched transactions (WAL mode), so that the sampler is never slowed down by the database.
+'''
+
+import json
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+
+## Columns of the wide table that are not measurement values.
+WIDE_KEY_COLUMNS = ("log_id", "host")
+TIME_COLUMNS = ("begin", "end", "duration")
+
+## Compile time limit of SQLite (SQLITE_MAX_COLUMN).
+MAX_COLUMNS = 2000
+
+
+ITEM_OPEN = "open"
+ITEM_ROW = "row"
+ITEM_END = "end"
+
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+
+class SQLiteSink:
+    """
+    Writes logs into the SQLite database |database|, from a background thread.
+
+    Rows are queued without blocking, and inserted every |batch_size| rows or every |flush_interval| seconds.
+
+    Usage:
+      - Constructor( database, layout )
+      - check_columns( columns )
+      - open_stream( name )  -->  »SQLiteWriter« (same usage as the »CNLFileWriter«)
+      - get_stats()
+      - close()
+    """
+
+    def __init__(self, database, layout="wide", batch_size=500, flush_interval=1.0, queue_size=10000):
+        if ( layout not in ("wide", "narrow") ):
+            raise ValueError("Unknown SQLite layout (expected 'wide' or 'narrow'): " + layout)
+
+        self.database = database
+        self.layout = layout
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.queue = queue.Queue(queue_size)
+        self.next_stream = 0
+
+        ## Writer thread state: stream -> (log_id, host, insert statement / narrow layout)
+        self.db = None
+        self.streams = dict()
+        self.wide_columns = None
+        self.series_ids = dict()
+
+        ## Rows waiting for the next transaction: (stream, values, enqueue-time)
+        self.pending = list()
+
+        ## Statistics
+        self.stats = dict.fromkeys( ("rows_written", "rows_dropped", "logs_dropped", "transactions", "latency_sum", "latency_max"), 0 )
+
+        ## Open the database in the sampling thread, so that errors (e.g. a wrong path) show up immediately.
+        sqlite3.connect(database).close()
+
+        self.thread = threading.Thread(target=self._run, name="cpunetlog-sqlite-sink")
+        self.thread.daemon = True
+        self.thread.start()
+
+
+
+    ## Interface (sampling thread) ##
+
+    def check_columns(self, columns):
+        """
+        Raises a ValueError if a log with these |columns| doesn't fit into the wide layout (see MAX_COLUMNS).
+        (The writer thread could only drop such a log.)
+        """
+
+        if ( self.layout != "wide" ):
+            return
+
+        db = sqlite3.connect(self.database)
+        try:
+            existing = set( row[1] for row in db.execute("PRAGMA table_info(measurements)") )
+        finally:
+            db.close()
+
+        num_columns = len( existing.union(WIDE_KEY_COLUMNS, TIME_COLUMNS, columns) )
+        if ( num_columns > MAX_COLUMNS ):
+            raise ValueError( "{} columns don't fit into the wide SQLite layout (at most {}). "
+                              "Use --sqlite-layout narrow, or log fewer classes.".format(num_columns, MAX_COLUMNS) )
+
+
+    def open_stream(self, name):
+        self.next_stream += 1
+        return SQLiteWriter(self, self.next_stream, name)
+
+
+    def enqueue(self, item):
+        """
+        Queues |item| for the writer thread. Never blocks: If the queue is full, the item is dropped.
+        """
+
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.stats["rows_dropped"] += 1
+
+
+    def get_queue_depth(self):
+        return self.queue.qsize() + len(self.pending)
+
+
+    def get_stats(self):
+        """
+        Returns throughput and latency counters. (Latencies are measured from queuing till committing, in seconds.)
+        """
+
+        ret = dict(self.stats)
+        latency_sum = ret.pop("latency_sum")
+        ret["latency_avg"] = latency_sum / ret["rows_written"] if ret["rows_written"] else 0
+        ret["queue_depth"] = self.get_queue_depth()
+
+        return ret
+
+
+    def close(self, timeout=5):
+        """
+        Writes all queued rows and stops the writer thread.
+        """
+
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+
+        self.thread.join(timeout)
+
+
+
+    ## Writer thread ##
+
+    def _run(self):
+        self.db = sqlite3.connect(self.database)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+        while True:
+            ## Wait for the next item, but not longer than the oldest pending row may wait.
+            if ( self.pending ):
+                timeout = max(self.pending[0][2] + self.flush_interval - time.time(), 0)
+            else:
+                timeout = self.flush_interval
+
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+
+            ## Shutdown.
+            if ( item is None ):
+                self._flush()
+                self.db.close()
+                return
+
+            ## Timeout.
+            if ( item is False ):
+                self._flush()
+
+            ## Row
+            elif ( item[0] == ITEM_ROW ):
+                self.pending.append( item[1:] )
+
+                if ( len(self.pending) >= self.batch_size ):
+                    self._flush()
+
+            ## New log
+            elif ( item[0] == ITEM_OPEN ):
+                self._flush()
+                self._open_log(*item[1:])
+
+            ## End of log
+            elif ( item[0] == ITEM_END ):
+                self._flush()
+                self.streams.pop(item[1], None)
+
+
+    def _create_schema(self):
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY, name TEXT, host TEXT, begin REAL, header TEXT)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS logs_host_time ON logs (host, begin)")
+
+            if ( self.layout == "wide" ):
+                self.db.execute("CREATE TABLE IF NOT EXISTS measurements (log_id INTEGER, host TEXT, begin REAL, end REAL, duration REAL)")
+                self.db.execute("CREATE INDEX IF NOT EXISTS measurements_time ON measurements (begin)")
+                self.db.execute("CREATE INDEX IF NOT EXISTS measurements_host_time ON measurements (host, begin)")
+
+                self.wide_columns = set( row[1] for row in self.db.execute("PRAGMA table_info(measurements)") )
+
+            else:
+                self.db.execute("CREATE TABLE IF NOT EXISTS series (id INTEGER PRIMARY KEY, name TEXT UNIQUE)")
+                self.db.execute("CREATE TABLE IF NOT EXISTS samples (log_id INTEGER, time REAL, series_id INTEGER, value REAL)")
+                self.db.execute("CREATE INDEX IF NOT EXISTS samples_time ON samples (time, log_id)")
+                self.db.execute("CREATE VIEW IF NOT EXISTS samples_named AS "
+                                "SELECT log_id, logs.host AS host, time, series.name AS series, value FROM samples "
+                                "JOIN logs ON log_id = logs.id JOIN series ON series_id = series.id")
+
+                self.series_ids = dict( (name, i) for i, name in self.db.execute("SELECT id, name FROM series") )
+
+
+    def _open_log(self, stream, name, header, columns):
+        host = header["General"]["SystemInfo"]["hostname"]
+
+        ## (Checked at startup, see |check_columns()|; but e.g. new NICs may be added later.)
+        if ( self.layout == "wide" ):
+            new_columns = [ c for c in columns if c not in self.wide_columns ]
+            if ( len(self.wide_columns) + len(new_columns) > MAX_COLUMNS ):
+                print( "SQLite: Too many columns for the wide layout (use the narrow one). Log '{}' is dropped.".format(name),
+                       file=sys.stderr )
+                self.stats["logs_dropped"] += 1
+                return
+
+        with self.db:
+            cursor = self.db.execute( "INSERT INTO logs (name, host, begin, header) VALUES (?, ?, ?, ?)",
+                                      (name, host, header["General"]["Date"][1], json.dumps(header, sort_keys=True)) )
+            log_id = cursor.lastrowid
+
+            if ( self.layout == "wide" ):
+                ## Add the columns of new CPUs, NICs, ...
+                for c in new_columns:
+                    self.db.execute( "ALTER TABLE measurements ADD COLUMN {} REAL".format(_quote(c)) )
+                    self.wide_columns.add(c)
+
+                ## (The statement is prepared once, and then cached by the connection.)
+                sql = "INSERT INTO measurements ({}) VALUES ({})".format(
+                            ", ".join( _quote(c) for c in WIDE_KEY_COLUMNS + tuple(columns) ),
+                            ", ".join( "?" * (len(WIDE_KEY_COLUMNS) + len(columns)) ) )
+
+                self.streams[stream] = (log_id, host, sql)
+
+            else:
+                for c in columns:
+                    if ( c not in self.series_ids and c not in TIME_COLUMNS ):
+                        self.db.execute( "INSERT OR IGNORE INTO series (name) VALUES (?)", (c,) )
+                        self.series_ids[c] = self.db.execute( "SELECT id FROM series WHERE name = ?", (c,) ).fetchone()[0]
+
+                end_col = columns.index("end")
+                series = [ (i, self.series_ids[c]) for i, c in enumerate(columns) if c not in TIME_COLUMNS ]
+
+                self.streams[stream] = (log_id, host, (end_col, series))
+
+
+    def _flush(self):
+        """
+        Inserts the pending rows in a single transaction.
+        """
+
+        if ( not self.pending ):
+            return
+
+        now = time.time()
+        rows = list()
+
+        for stream, values, t in self.pending:
+            log = self.streams.get(stream)
+            if ( not log ):
+                self.stats["rows_dropped"] += 1
+                continue
+
+            log_id, host, statement = log
+
+            if ( self.layout == "wide" ):
+                rows.append( (statement, (log_id, host) + tuple(values)) )
+            else:
+                end_col, series = statement
+                t_end = values[end_col]
+                rows.append( (None, [ (log_id, t_end, series_id, values[i]) for i, series_id in series ]) )
+
+            latency = now - t
+            self.stats["latency_sum"] += latency
+            self.stats["latency_max"] = max(self.stats["latency_max"], latency)
+
+        with self.db:
+            if ( self.layout == "wide" ):
+                ## Consecutive rows of the same log share one statement.
+                i = 0
+                while ( i < len(rows) ):
+                    j = i
+                    while ( j < len(rows) and rows[j][0] == rows[i][0] ):
+                        j += 1
+                    self.db.executemany( rows[i][0], [ r[1] for r in rows[i:j] ] )
+                    i = j
+            else:
+                self.db.executemany( "INSERT INTO samples (log_id, time, series_id, value) VALUES (?, ?, ?, ?)",
+                                     ( sample for r in rows for sample in r[1] ) )
+
+        self.stats["rows_written"] += len(rows)
+        self.stats["transactions"] += 1
+        self.pending = list()
+
+
+
+class SQLiteWriter:
+    """
+    Counterpart of the »CNLFileWriter« that writes the log into a »SQLiteSink« instead of a file.
+    (Same usage.)
+    """
+
+    def __init__(self, sink, stream, name):
+        self.sink = sink
+        self.stream = stream
+        self.name = name
+        self.filename = sink.database + "#" + name
+
+        self.header = None
+        self.header_written = False
+
+
+    def write_header(self, header_dict):
+        self.header = header_dict
+
+
+    def write_vector(self, out_vector):
+        ## The first vector after the JSON header is the CSV header. Both are stored together.
+        if ( not self.header_written ):
+            self.sink.enqueue( (ITEM_OPEN, self.stream, self.name, self.header, list(out_vector)) )
+            self.header_written = True
+        else:
+            self.sink.enqueue( (ITEM_ROW, self.stream, out_vector, time.time()) )
+
+
+    def close(self):
+        self.sink.enqueue( (ITEM_END, self.stream) )